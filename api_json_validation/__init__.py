@@ -6,7 +6,7 @@ import uuid
 import azure.functions as func
 from contextlib import redirect_stdout
 from library.tools_validation import get_jsons_storygraph_validated, get_generic_productions_from_file, \
-    print_errors_warnings
+    print_errors_warnings, get_allowed_names
 
 
 def prefix_path(path):
@@ -31,13 +31,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
             g, e = get_generic_productions_from_file(prefix_path(f'../json_validation/allowed_names/produkcje_generyczne.json'))
 
-            allowed_locations = json.load(open(prefix_path('../json_validation/allowed_names/locations.json'), encoding="utf8"))
-            allowed_locations += json.load(open(prefix_path('../json_validation/allowed_names/locations_Wojtek.json'), encoding="utf8"))
-            allowed_characters = json.load(open(prefix_path('../json_validation/allowed_names/characters.json'), encoding="utf8"))
-            allowed_characters += json.load(open(prefix_path('../json_validation/allowed_names/characters_Wojtek.json'), encoding="utf8"))
-            allowed_items = json.load(open(prefix_path('../json_validation/allowed_names/items.json'), encoding="utf8"))
-            allowed_items += json.load(open(prefix_path('../json_validation/allowed_names/items_Wojtek.json'), encoding="utf8"))
-            allowed_names = {"Locations": allowed_locations, "Characters": allowed_characters, "Items": allowed_items}
+            allowed_names = get_allowed_names()
 
             jsons_sg_validated, jsons_schema_validated, errors, warnings = get_jsons_storygraph_validated(session_path, production_titles_dict=g, allowed_names=allowed_names)
             print_errors_warnings(jsons_schema_validated, errors, warnings)
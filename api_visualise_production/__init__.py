@@ -8,10 +8,15 @@ import azure.functions as func
 import requests
 
 from library.tools import destinations_change_to_nodes, nodes_list_from_tree
+from library.tools_cache import set_render_cache, RENDER_CACHE_DIR
 from library.tools_process import apply_instructions_to_world
 from library.tools_visualisation import merge_images, draw_graph
 
 
+# obrazki tych samych produkcji są generowane raz na instancję funkcji
+set_render_cache(f'{tempfile.gettempdir()}/{RENDER_CACHE_DIR}')
+
+
 def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
         req_json = req.get_json()
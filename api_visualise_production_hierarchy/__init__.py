@@ -8,8 +8,10 @@ import uuid
 import azure.functions as func
 
 from library.tools import draw_production_tree
-from library.tools_match import get_production_tree_new
-from library.tools_validation import get_generic_productions_from_file, get_jsons_storygraph_validated
+from library.tools_cache import set_render_cache, RENDER_CACHE_DIR
+from library.tools_match import get_production_tree_new, HIERARCHY_CACHE_DIR
+from library.tools_validation import get_generic_productions_from_file, get_jsons_storygraph_validated, \
+    get_allowed_names
 
 
 def prefix_path(path):
@@ -17,6 +19,10 @@ def prefix_path(path):
     return os.path.join(func_dir, path)
 
 
+# obrazki tych samych produkcji są generowane raz na instancję funkcji
+set_render_cache(f'{tempfile.gettempdir()}/{RENDER_CACHE_DIR}')
+
+
 def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
         session_path = f'{tempfile.gettempdir()}/{uuid.uuid4()}'
@@ -33,13 +39,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         g, e = get_generic_productions_from_file(
             prefix_path(f'../json_validation/allowed_names/produkcje_generyczne.json'))
 
-        allowed_locations = json.load(open(prefix_path('../json_validation/allowed_names/locations.json'), encoding="utf8"))
-        allowed_locations += json.load(open(prefix_path('../json_validation/allowed_names/locations_Wojtek.json'), encoding="utf8"))
-        allowed_characters = json.load(open(prefix_path('../json_validation/allowed_names/characters.json'), encoding="utf8"))
-        allowed_characters += json.load(open(prefix_path('../json_validation/allowed_names/characters_Wojtek.json'), encoding="utf8"))
-        allowed_items = json.load(open(prefix_path('../json_validation/allowed_names/items.json'), encoding="utf8"))
-        allowed_items += json.load(open(prefix_path('../json_validation/allowed_names/items_Wojtek.json'), encoding="utf8"))
-        allowed_names = {"Locations": allowed_locations, "Characters": allowed_characters, "Items": allowed_items}
+        allowed_names = get_allowed_names()
 
         jsons_sg_validated, jsons_schema_validated, errors, warnings = get_jsons_storygraph_validated(session_path, production_titles_dict=g, allowed_names=allowed_names)
 
@@ -49,7 +49,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 'json': json.load(open(json_generic_productions_file_path, encoding="utf8")),
                 'file_path': json_generic_productions_file_path,
             }
-            prod_hierarchy, g, m = get_production_tree_new(json_generic_productions, data)
+            prod_hierarchy, g, m = get_production_tree_new(json_generic_productions, data,
+                                                           cache_dir=f'{tempfile.gettempdir()}/{HIERARCHY_CACHE_DIR}')
             if prod_hierarchy:
                 draw_production_tree(prod_hierarchy, missing=m, mission_name='out', directory_path=session_path)
 
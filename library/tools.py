@@ -8,6 +8,34 @@ import re
 import os
 
 from config.helpers import qdebug
+from library.tools_cache import render_source
+
+
+# Typy węzłów świata. Funkcje przeglądające drzewo korzystają z węzła wyłącznie przez interfejs słownika
+# (get, [], in, items, del), więc obok zwykłych słowników mogą działać na innych implementacjach węzła
+# (np. SlotNode z library.tools_nodes), które rejestrują się przez register_node_type.
+NODE_TYPES = (dict,)
+
+
+def register_node_type(node_type: type):
+    global NODE_TYPES
+    if node_type not in NODE_TYPES:
+        NODE_TYPES = NODE_TYPES + (node_type,)
+
+
+def is_node(element) -> bool:
+    return isinstance(element, NODE_TYPES)
+
+
+def json_default(element):
+    """
+    Converts the nodes of non-dict backends to dicts while dumping to json (use as json.dump default parameter).
+    :param element: object not serializable by json
+    :return: dict
+    """
+    if hasattr(element, 'items'):
+        return dict(element.items())
+    raise TypeError(f'Object of type {type(element).__name__} is not JSON serializable')
 
 
 def get_json_files_paths(path: str, mask: str = '*.json') -> List[Path]:
@@ -40,7 +68,7 @@ def breadcrumb_pointer(json_dict_or_list: Union[list, dict], path: list = None,
 
     if path is None:
         path = []
-    if isinstance(json_dict_or_list, dict):
+    if isinstance(json_dict_or_list, NODE_TYPES):
         for k, v in json_dict_or_list.items():
             if k == 'LSide':
                 p = breadcrumb_pointer(v, path, "root", pointer, name_or_id, attr, layer, remove, is_object)
@@ -117,7 +145,7 @@ def nodes_list_from_tree(json_dict_or_list: Union[list, dict], parent_key: str =
     :return: list of layer-described nodes (dict: "layer", "node")
     """
 
-    if isinstance(json_dict_or_list, dict):
+    if isinstance(json_dict_or_list, NODE_TYPES):
         current_list = []
         if json_dict_or_list.get('Id', json_dict_or_list.get('Name')):
             if not parent_key:
@@ -159,7 +187,7 @@ def list_from_tree(json_dict_or_list, parent_key: str = 'root') -> list:
     """
     if type(json_dict_or_list) in (int, float, bool, str):
         return []
-    elif isinstance(json_dict_or_list, dict):
+    elif isinstance(json_dict_or_list, NODE_TYPES):
         current_dict = {}
         if parent_key != 'root':
             current_dict['Layer'] = parent_key
@@ -186,7 +214,7 @@ def world_copy(old_one, new_one, sort_elements = True):
     sort_elements = True
     if type(new_one) in (int, float, bool, str): # new_one, żeby nie wchodzić w destination, które w starym są obiektem
         return []
-    elif isinstance(old_one, dict):
+    elif isinstance(old_one, NODE_TYPES):
         new_one['Id'] = str(id(old_one))
         # if remove_connections and 'Connections' in new_one:
         #     del(new_one['Connections'])
@@ -195,9 +223,9 @@ def world_copy(old_one, new_one, sort_elements = True):
                 # dest['Destination'] = str(dest['Destination']['Id'])
                 dest2['Destination'] = str(id(dest1['Destination']))
 
-        for old_k, new_k in zip(old_one, new_one):
+        for old_k in old_one:
             if old_k in ["Locations", "Characters", "Items", "Narration"]:
-                world_copy(old_one[old_k], new_one[new_k], sort_elements)
+                world_copy(old_one[old_k], new_one[old_k], sort_elements)
 
 
         if sort_elements:
@@ -266,7 +294,7 @@ def world_cut_ids(old_one):
     if type(old_one) in (
     int, float, bool, str):  # new_one, żeby nie wchodzić w destination, które w starym są obiektem
         return []
-    elif isinstance(old_one, dict):
+    elif isinstance(old_one, NODE_TYPES):
         if 'Id' in old_one:
             del(old_one['Id'])
 
@@ -784,8 +812,7 @@ def draw_production_tree(production_dict, missing = None, mission_name = None, d
     #     graph.node('missing', fillcolor='#F8CECC', color='red', style='filled')
     #     graph.edge('start', 'missing')
 
-    graph.render(format='png', filename=f'{mission_name}',
-                 directory=directory_path, cleanup=True)
+    render_source(graph.source, graph.engine, f'{mission_name}', directory_path, format='png', cleanup=True)
 
 
 def destinations_change_to_nodes(locations: list, world=False, remove_ids = True) -> bool:
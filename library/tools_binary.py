@@ -0,0 +1,284 @@
+import hashlib
+import json
+import marshal
+import os
+import sys
+import zlib
+from typing import List, Union
+
+from library.tools import destinations_change_to_nodes, json_default
+
+# nagłówek pliku binarnego: sygnatura, wersja formatu, wersja Pythona (marshal zależy od wersji) i flagi
+BINARY_MAGIC = b'SGB'
+BINARY_FORMAT_VERSION = 1
+BINARY_FLAG_COMPRESSED = 1
+BINARY_EXTENSION = '.sgb'
+# katalog skompilowanych pakietów produkcji (pliki nazwane skrótem zawartości pakietu)
+PACK_CACHE_DIR = 'packs_cache'
+
+
+def _binary_header(compress: bool) -> bytes:
+    return BINARY_MAGIC + bytes([BINARY_FORMAT_VERSION, sys.version_info[0], sys.version_info[1],
+                                 BINARY_FLAG_COMPRESSED if compress else 0])
+
+
+class _MissingDestination(Exception):
+    pass
+
+
+def _pack_value(value, strings: dict):
+    # internujemy wszystkie napisy (nazwy, klucze atrybutów), dzięki czemu marshal zapisuje je tylko raz
+    if isinstance(value, str):
+        return strings.setdefault(value, sys.intern(value))
+    if isinstance(value, dict):
+        packed = {}
+        for key, item in value.items():
+            if key == 'Locations' and isinstance(item, list):
+                packed[strings.setdefault(key, sys.intern(key))] = _pack_locations(item, strings)
+            else:
+                packed[strings.setdefault(key, sys.intern(key))] = _pack_value(item, strings)
+        return packed
+    if isinstance(value, list):
+        return [_pack_value(item, strings) for item in value]
+    return value
+
+
+def _pack_locations(locations: list, strings: dict) -> list:
+    """
+    Packs the list of locations. Connections destinations (nodes or identifiers) are stored as the integer
+    indexes of the locations in the list.
+    :param locations: list of locations (destinations may be nodes or identifiers)
+    :param strings: dict of interned strings
+    :return: packed list of locations (raises _MissingDestination if the destination is not in the list)
+    """
+    index_by_node = {id(location): nr for nr, location in enumerate(locations)}
+    index_by_id = {location['Id']: nr for nr, location in enumerate(locations) if 'Id' in location}
+    packed_locations = []
+    for location in locations:
+        packed_location = {}
+        for key, item in location.items():
+            if key == 'Connections':
+                packed_connections = []
+                for connection in item:
+                    packed_connection = _pack_value({k: v for k, v in connection.items() if k != 'Destination'}, strings)
+                    destination = connection.get('Destination')
+                    if isinstance(destination, dict):
+                        packed_connection['Destination'] = index_by_node.get(id(destination))
+                    else:
+                        packed_connection['Destination'] = index_by_id.get(destination)
+                    if packed_connection['Destination'] is None:
+                        raise _MissingDestination(location.get("Id", location.get("Name")))
+                    packed_connections.append(packed_connection)
+                packed_location[strings.setdefault(key, sys.intern(key))] = packed_connections
+            else:
+                packed_location[strings.setdefault(key, sys.intern(key))] = _pack_value(item, strings)
+        packed_locations.append(packed_location)
+    return packed_locations
+
+
+def _unpack_locations(value):
+    # zamieniamy indeksy lokacji docelowych na węzły; połączenia mają tylko lokacje (najwyższy poziom listy)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == 'Connections':
+                continue
+            if key == 'Locations' and isinstance(item, list):
+                for location in item:
+                    for connection in location.get('Connections', []):
+                        connection['Destination'] = item[connection['Destination']]
+                    _unpack_locations(location)
+            elif isinstance(item, (dict, list)):
+                _unpack_locations(item)
+    elif isinstance(value, list):
+        for item in value:
+            _unpack_locations(item)
+
+
+def dumps_binary(json_structures: List[dict], compress: bool = True) -> Union[bytes, None]:
+    """
+    Serializes the worlds or production packs to the compact binary form.
+    :param json_structures: list of dicts with keys 'file_path' and 'json' (as in get_jsons_schema_validated result),
+    destinations may be already changed to nodes
+    :param compress: True to compress the data with zlib
+    :return: binary data or None if some destination cannot be found
+    """
+    strings = {}
+    try:
+        packed = [{'file_path': x.get('file_path'), 'json': _pack_value(x['json'], strings)} for x in json_structures]
+    except _MissingDestination as e:
+        print(f'Nie znaleziono lokacji docelowej połączenia z lokacji {e}.')
+        return None
+    data = marshal.dumps(packed, 4)
+    if compress:
+        data = zlib.compress(data)
+    return _binary_header(compress) + data
+
+
+def loads_binary(data: bytes) -> Union[List[dict], None]:
+    """
+    Rebuilds the worlds or production packs from the binary form. The destinations of connections are already
+    nodes, so destinations_change_to_nodes is not needed.
+    :param data: binary data created by dumps_binary
+    :return: list of dicts with keys 'file_path' and 'json' or None if the data cannot be read
+    """
+    if data[:3] != BINARY_MAGIC or data[3] != BINARY_FORMAT_VERSION:
+        print('Nieznany format danych binarnych.')
+        return None
+    if (data[4], data[5]) != sys.version_info[:2]:
+        print(f'Dane binarne zapisano w Pythonie {data[4]}.{data[5]}. Trzeba je przekonwertować ponownie z jsona.')
+        return None
+    payload = data[7:]
+    if data[6] & BINARY_FLAG_COMPRESSED:
+        payload = zlib.decompress(payload)
+    json_structures = marshal.loads(payload)
+    for structure in json_structures:
+        _unpack_locations(structure['json'])
+    return json_structures
+
+
+def save_binary(json_structures: List[dict], file_path: str, compress: bool = True) -> bool:
+    data = dumps_binary(json_structures, compress)
+    if data is None:
+        print(f'Nie udało się zapisać pliku {file_path}.')
+        return False
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    with open(file_path, 'wb') as outfile:
+        outfile.write(data)
+    return True
+
+
+def load_binary(file_path: str) -> Union[List[dict], None]:
+    with open(file_path, 'rb') as infile:
+        return loads_binary(infile.read())
+
+
+def json_to_binary(json_file_paths: Union[str, List[str]], binary_file_path: str, world: bool = False,
+                   compress: bool = True) -> bool:
+    """
+    Converts json files (worlds or productions) to the single binary pack.
+    :param json_file_paths: path or list of paths of json files
+    :param binary_file_path: path of the binary file to create
+    :param world: True if the files contain worlds (identifiers are then removed as in destinations_change_to_nodes)
+    :param compress: True to compress the data with zlib
+    :return: True if succeeded
+    """
+    if isinstance(json_file_paths, str):
+        json_file_paths = [json_file_paths]
+    json_structures = []
+    for json_file_path in json_file_paths:
+        json_list = json.load(open(json_file_path, encoding="utf8"))
+        for production in json_list:
+            if not destinations_change_to_nodes(production['LSide']['Locations'], world=world):
+                print(f'Nie udało się wczytać pliku {json_file_path}.')
+                return False
+        json_structures.append({'file_path': json_file_path, 'json': json_list})
+    return save_binary(json_structures, binary_file_path, compress)
+
+
+def _json_relative_paths(json_structures: List[dict]) -> List[str]:
+    # ścieżki plików względem wspólnego katalogu paczki (pliki o tej samej nazwie w różnych katalogach nie kolidują)
+    file_paths = [os.path.normpath(structure.get('file_path') or f'pack_{nr:03d}.json')
+                  for nr, structure in enumerate(json_structures)]
+    try:
+        common_dir = os.path.commonpath([os.path.dirname(os.path.abspath(file_path)) for file_path in file_paths])
+    except ValueError:  # ścieżki na różnych dyskach
+        return [os.path.splitdrive(os.path.abspath(file_path))[1].lstrip(os.sep) for file_path in file_paths]
+    return [os.path.relpath(os.path.abspath(file_path), common_dir) for file_path in file_paths]
+
+
+def binary_to_json(binary_file_path: str, json_dir: str) -> List[str]:
+    """
+    Converts the binary pack back to json files. Destinations are written as locations identifiers.
+    The conversion is not lossless (packs of worlds have no identifiers and locations without a unique name get
+    new ones), so the files are written to a separate directory and existing files are never overwritten.
+    :param binary_file_path: path of the binary file
+    :param json_dir: directory of the json files (paths of the files relative to their common directory are kept)
+    :return: list of written json file paths (empty if nothing was written)
+    """
+    json_structures = load_binary(binary_file_path)
+    if json_structures is None:
+        return []
+    file_paths = [os.path.join(json_dir, relative_path) for relative_path in _json_relative_paths(json_structures)]
+    existing = [file_path for file_path in file_paths if os.path.exists(file_path)]
+    if existing:
+        print(f'Pliki {", ".join(existing)} już istnieją – nie zostaną nadpisane.')
+        return []
+    written = []
+    for structure, file_path in zip(json_structures, file_paths):
+        for production in structure['json']:
+            locations = production.get('LSide', {}).get('Locations', [])
+            # lokację docelową wskazujemy przez Id, przez jednoznaczną nazwę, a w ostateczności
+            # nadajemy jej Id tak samo jak w save_world
+            names_count = {}
+            for location in locations:
+                for reference in {location.get('Id'), location.get('Name')} - {None}:
+                    names_count[reference] = names_count.get(reference, 0) + 1
+            for location in locations:
+                for connection in location.get('Connections', []):
+                    destination = connection['Destination']
+                    if isinstance(destination, dict) and 'Id' not in destination and \
+                            names_count.get(destination.get('Name')) != 1:
+                        destination['Id'] = str(id(destination))
+            for location in locations:
+                for connection in location.get('Connections', []):
+                    if isinstance(connection['Destination'], dict):
+                        connection['Destination'] = connection['Destination'].get('Id') or connection['Destination']['Name']
+
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        with open(file_path, 'w', encoding="utf8") as outfile:
+            json.dump(structure['json'], outfile, indent=4, ensure_ascii=False)
+        written.append(file_path)
+    return written
+
+
+def pack_hash(pack) -> str:
+    """
+    Content hash of the production pack (e.g. QuestSource of the gameplay), independent of the keys order.
+    :param pack: json structure of the pack
+    :return: hex digest
+    """
+    return hashlib.sha1(json.dumps(pack, sort_keys=True, ensure_ascii=False, default=json_default)
+                        .encode('utf8')).hexdigest()
+
+
+def _pack_cache_path(cache_dir: str, content_hash: str) -> str:
+    return os.path.join(cache_dir, content_hash + BINARY_EXTENSION)
+
+
+def save_compiled_pack(pack: List[dict], cache_dir: str, content_hash: str = None) -> Union[str, None]:
+    """
+    Compiles the pack of productions in the gameplay format ([{quest_name: productions}, ...]) and stores it
+    in the cache under its content hash. The pack is changed in place (destinations changed to nodes).
+    :param pack: list of dicts quest name -> list of productions
+    :param cache_dir: directory of the cache
+    :param content_hash: hash of the pack before compilation (computed if not given)
+    :return: content hash or None if the pack cannot be compiled
+    """
+    content_hash = content_hash or pack_hash(pack)
+    json_structures = []
+    for quest in pack:
+        for quest_name, productions in quest.items():
+            for production in productions:
+                if not destinations_change_to_nodes(production['LSide']['Locations']):
+                    print(f'Nie udało się skompilować pakietu produkcji {quest_name}.')
+                    return None
+            json_structures.append({'file_path': quest_name, 'json': productions})
+    if not save_binary(json_structures, _pack_cache_path(cache_dir, content_hash)):
+        return None
+    return content_hash
+
+
+def load_compiled_pack(content_hash: str, cache_dir: str) -> Union[List[dict], None]:
+    """
+    Reads the compiled pack from the cache.
+    :param content_hash: content hash of the pack
+    :param cache_dir: directory of the cache
+    :return: list of dicts quest name -> list of productions (destinations are nodes) or None if not cached
+    """
+    file_path = _pack_cache_path(cache_dir, content_hash)
+    if not content_hash or not os.path.exists(file_path):
+        return None
+    json_structures = load_binary(file_path)
+    if json_structures is None:
+        return None
+    return [{structure['file_path']: structure['json']} for structure in json_structures]
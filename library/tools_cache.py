@@ -0,0 +1,93 @@
+import os
+import shutil
+import threading
+import uuid
+from hashlib import blake2b
+from typing import Union
+
+import graphviz
+
+# katalog obrazków wygenerowanych przez graphviz (pliki nazwane skrótem źródła DOT, silnika i formatu)
+RENDER_CACHE_DIR = 'render_cache'
+
+# katalog pamięci podręcznej obrazków (None – obrazki są zawsze generowane)
+_render_cache_dir = None
+_stats_lock = threading.Lock()
+render_cache_stats = {"Hits": 0, "Misses": 0}
+
+
+def set_render_cache(directory: Union[str, None]):
+    """
+    Turns on (or off, for None) the render cache used by render_source.
+    :param directory: directory of the cached images
+    """
+    global _render_cache_dir
+    _render_cache_dir = directory
+
+
+def render_key(source: str, engine: str, format: str) -> str:
+    """
+    :param source: DOT source of the graph (contains the drawn state, highlights, title and description)
+    :param engine: graphviz layout engine
+    :param format: output format
+    :return: name of the cached image (without the extension)
+    """
+    digest = blake2b(digest_size=20)
+    digest.update(f'{engine}\x00{format}\x00'.encode('utf8'))
+    digest.update(source.encode('utf8'))
+    return digest.hexdigest()
+
+
+def _link_or_copy(source_path: str, target_path: str):
+    # twarde dowiązanie oszczędza miejsce, ale nie zawsze jest możliwe (np. inny system plików)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+
+def render_source(source: str, engine: str, filename: str, directory: str, format: str = 'png',
+                  cleanup: bool = False) -> str:
+    """
+    Renders the DOT source as graphviz.Source(source, engine).render(...) does. If the render cache is on,
+    an image of the same source is linked (or copied) from the cache instead of running graphviz.
+    :param source: DOT source of the graph
+    :param engine: graphviz layout engine
+    :param filename: name of the output file (without the format extension)
+    :param directory: output directory
+    :param format: output format
+    :param cleanup: do not keep the DOT source file next to the image
+    :return: path of the image
+    """
+    if _render_cache_dir is None:
+        return graphviz.Source(source, engine=engine).render(format=format, filename=filename, directory=directory,
+                                                             cleanup=cleanup)
+
+    target_path = os.path.join(directory, f'{filename}.{format}')
+    cached_path = os.path.join(_render_cache_dir, f'{render_key(source, engine, format)}.{format}')
+    # obrazek w katalogu docelowym może być dowiązaniem do pliku z pamięci podręcznej – nie nadpisujemy go w miejscu
+    if os.path.lexists(target_path):
+        os.remove(target_path)
+    if os.path.exists(cached_path):
+        os.makedirs(directory, exist_ok=True)
+        if not cleanup:
+            with open(os.path.join(directory, filename), 'w', encoding='utf8') as source_file:
+                source_file.write(source)
+        _link_or_copy(cached_path, target_path)
+        with _stats_lock:
+            render_cache_stats["Hits"] += 1
+        return target_path
+
+    rendered_path = graphviz.Source(source, engine=engine).render(format=format, filename=filename,
+                                                                  directory=directory, cleanup=cleanup)
+    with _stats_lock:
+        render_cache_stats["Misses"] += 1
+    try:
+        os.makedirs(_render_cache_dir, exist_ok=True)
+        # zapis przez plik tymczasowy, żeby inny wątek lub proces nie odczytał niepełnego obrazka
+        temporary_path = f'{cached_path}.{uuid.uuid4().hex}.tmp'
+        shutil.copyfile(rendered_path, temporary_path)
+        os.replace(temporary_path, cached_path)
+    except OSError:
+        pass
+    return rendered_path
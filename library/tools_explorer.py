@@ -0,0 +1,230 @@
+import time
+import traceback
+from collections import deque, Counter
+from copy import deepcopy
+from typing import Union
+
+from library.tools import destinations_change_to_nodes, breadcrumb_pointer
+from library.tools_hash import WorldHasher
+from library.tools_session import GameSession, compile_session_sources
+
+try:
+    import resource
+except ImportError:  # brak modułu poza systemami uniksowymi – limit pamięci nie jest wtedy sprawdzany
+    resource = None
+
+EXPLORE_BFS = 'bfs'
+EXPLORE_DFS = 'dfs'
+
+# przyczyny zakończenia gałęzi przeszukiwania
+DEAD_END_DEATH = 'death'
+DEAD_END_STUCK = 'stuck'
+DEAD_END_SUBORDINATE = 'subordinate'
+
+# przyczyny przerwania przeszukiwania
+STOP_STATES = 'max_states'
+STOP_MEMORY = 'max_memory'
+STOP_WIN = 'win'
+
+
+def _memory_mb() -> Union[float, None]:
+    # szczytowe zużycie pamięci procesu (w Linuksie ru_maxrss jest w KB, w macOS w bajtach)
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 1024 / 1024 if max_rss > 1 << 32 else max_rss / 1024
+
+
+def _move_description(result: dict) -> dict:
+    return {"Title": result["Title"],
+            "Variant": [[ls_node.get('Id') or ls_node.get('Name'), w_node.get('Name')]
+                        for ls_node, w_node in result["Variant"]]}
+
+
+def _path(table: dict, state_hash: bytes) -> list:
+    """
+    Reconstructs the sequence of moves leading from the initial state to the state.
+    :param table: transposition table: hash -> (hash of the parent, moves, depth)
+    :param state_hash: hash of the state
+    :return: list of moves (hero moves and the automatic moves following them)
+    """
+    steps = []
+    parent_hash, moves, depth = table[state_hash]
+    while parent_hash is not None:
+        steps.append(moves)
+        parent_hash, moves, depth = table[parent_hash]
+    return [move for moves in reversed(steps) for move in moves]
+
+
+def _successors(session: GameSession, automatic_moves_limit: int):
+    """
+    Generates states following the state of the session: every hero option in every variant applied to a copy
+    of the world, followed by the automatic productions.
+    :param session: session with the explored state
+    :param automatic_moves_limit: maximal number of automatic moves in one location after a move
+    :return: generator of tuples (session with the new state, list of moves, error or None)
+    """
+    for option in session.options():
+        for variant_nr, variant in enumerate(option["Variants"]):
+            # kopiowanie świata razem z węzłami wariantu i bohaterem (memo łączy oryginały z kopiami)
+            memo = {}
+            new_world = deepcopy(session.world, memo)
+            new_session = GameSession(new_world, session.productions_chars_turn, session.productions_world_turn,
+                                      session.hierarchy, main_character=memo[id(session.main_character)],
+                                      hasher=session.hasher.copy(new_world, memo),
+                                      scheduler=session.scheduler.copy(memo))
+            new_option = dict(option, Character=new_session.main_character,
+                              Variants=[[(ls_node, memo[id(w_node)]) for ls_node, w_node in variant]])
+            moves = []
+            try:
+                moves.append(_move_description(new_session.apply(new_option, 0)))
+                for result in new_session.world_turn(limit=automatic_moves_limit):
+                    moves.append(_move_description(result))
+            except Exception:
+                yield None, moves or [{"Title": option["Title"], "Variant": variant_nr}], traceback.format_exc()
+                continue
+            yield new_session, moves, None
+
+
+def explore_state_space(world: list, main_character: dict, productions_chars_turn: list,
+                        productions_world_turn: list, hierarchy: dict = None, strategy: str = EXPLORE_BFS,
+                        max_depth: int = None, max_states: int = None, max_memory_mb: float = None,
+                        automatic_moves_limit: int = 50, max_reported: int = 100, stop_on_win: bool = False) -> dict:
+    """
+    Explores all world states reachable by the moves of the main character (every option in every variant),
+    each followed by the automatic productions. NPCs do not move. States equal up to node identity are
+    explored once (transposition table of canonical world hashes).
+    :param world: initial list of locations (destinations changed to nodes), not changed by the exploration
+    :param main_character: node of the main character
+    :param productions_chars_turn: compiled productions available to characters
+    :param productions_world_turn: compiled automatic productions
+    :param hierarchy: production hierarchy
+    :param strategy: EXPLORE_BFS (shortest paths first) or EXPLORE_DFS
+    :param max_depth: maximal number of hero moves (None – no limit)
+    :param max_states: maximal number of distinct states (None – no limit)
+    :param max_memory_mb: the exploration stops when the process uses more memory (None – no limit)
+    :param automatic_moves_limit: maximal number of automatic moves in one location after a move
+    :param max_reported: maximal number of reported win paths, dead ends and errors
+    :param stop_on_win: stop at the first winning state (with EXPLORE_BFS its path is the shortest one)
+    :return: report dict with keys States, Transitions, Complete, StopReason, DepthLimited, MaxDepth, Wins,
+    WinPaths, DeadEnds, DeadEndsCount, Errors, ErrorsCount, Seconds
+    """
+    start = time.time()
+    report = {"States": 0, "Transitions": 0, "Complete": False, "StopReason": None, "DepthLimited": False,
+              "MaxDepth": 0, "Wins": 0, "WinPaths": [], "DeadEnds": [], "DeadEndsCount": Counter(), "Errors": [],
+              "ErrorsCount": 0, "Seconds": 0}
+    memo = {}
+    initial_world = deepcopy(world, memo)
+    initial = GameSession(initial_world, productions_chars_turn, productions_world_turn, hierarchy,
+                          main_character=memo[id(main_character)], hasher=WorldHasher(initial_world))
+    initial_hash = initial.world_hash()
+    # tablica transpozycji: skrót stanu -> (skrót poprzednika, ruchy prowadzące do stanu, głębokość)
+    table = {initial_hash: (None, [], 0)}
+    frontier = deque([(initial, initial_hash, 0)])
+
+    def dead_end(reason, state_hash, depth):
+        report["DeadEndsCount"][reason] += 1
+        if len(report["DeadEnds"]) < max_reported:
+            report["DeadEnds"].append({"Reason": reason, "Depth": depth, "Path": _path(table, state_hash)})
+
+    while frontier:
+        if max_memory_mb is not None and (_memory_mb() or 0) > max_memory_mb:
+            report["StopReason"] = STOP_MEMORY
+            break
+        session, state_hash, depth = frontier.popleft() if strategy == EXPLORE_BFS else frontier.pop()
+        if table[state_hash][2] < depth:  # stan osiągnięty później krótszą drogą (DFS) jest już w kolejce
+            continue
+        report["MaxDepth"] = max(report["MaxDepth"], depth)
+
+        status = session.main_character_status()
+        if status == 'winner':
+            report["Wins"] += 1
+            if len(report["WinPaths"]) < max_reported:
+                report["WinPaths"].append(_path(table, state_hash))
+            if stop_on_win:
+                report["StopReason"] = STOP_WIN
+                break
+            continue
+        if status == 'missing':
+            dead_end(DEAD_END_DEATH, state_hash, depth)
+            continue
+        if status == 'subordinate':
+            dead_end(DEAD_END_SUBORDINATE, state_hash, depth)
+            continue
+        if max_depth is not None and depth >= max_depth:
+            report["DepthLimited"] = True
+            continue
+
+        has_moves = False
+        for new_session, moves, error in _successors(session, automatic_moves_limit):
+            has_moves = True
+            report["Transitions"] += 1
+            if error:
+                report["ErrorsCount"] += 1
+                if len(report["Errors"]) < max_reported:
+                    report["Errors"].append({"Path": _path(table, state_hash) + moves, "Traceback": error})
+                continue
+            new_hash = new_session.world_hash()
+            known = table.get(new_hash)
+            if known is not None and known[2] <= depth + 1:
+                continue
+            if known is None and max_states is not None and len(table) >= max_states:
+                report["StopReason"] = STOP_STATES
+                break
+            table[new_hash] = (state_hash, moves, depth + 1)
+            frontier.append((new_session, new_hash, depth + 1))
+        else:
+            if not has_moves:
+                dead_end(DEAD_END_STUCK, state_hash, depth)
+        if report["StopReason"]:
+            break
+
+    report["States"] = len(table)
+    report["Complete"] = not report["StopReason"] and not report["DepthLimited"]
+    report["DeadEndsCount"] = dict(report["DeadEndsCount"])
+    report["Seconds"] = round(time.time() - start, 3)
+    return report
+
+
+def explore_quest(world_source: dict, chars_turn_sources: list, world_turn_sources: list, hero_name: str,
+                  **kwargs) -> Union[dict, None]:
+    """
+    Explores the state space of the quest (see explore_state_space).
+    :param world_source: dict with keys 'file_path' and 'json' of the world
+    :param chars_turn_sources: productions for characters (as in get_jsons_storygraph_validated result)
+    :param world_turn_sources: automatic productions (as in get_jsons_storygraph_validated result)
+    :param hero_name: name of the main character
+    :param kwargs: limits and options of explore_state_space
+    :return: report dict or None if the world can not be prepared
+    """
+    world = deepcopy(world_source['json'])[0]["LSide"]["Locations"]
+    if not destinations_change_to_nodes(world, world=True):
+        print('Problem wczytywania świata.')
+        return None
+    hero_paths = breadcrumb_pointer(world, name_or_id=hero_name, layer="Characters")
+    if len(hero_paths) != 1:
+        print(f'Niejednoznaczne wskazanie postaci {hero_name} w świecie.')
+        return None
+    productions_chars_turn, productions_world_turn, hierarchy = compile_session_sources(chars_turn_sources,
+                                                                                        world_turn_sources)
+    return explore_state_space(world, hero_paths[0][-1], productions_chars_turn, productions_world_turn, hierarchy,
+                               **kwargs)
+
+
+def print_exploration_report(report: dict):
+    print(f'Zbadano {report["States"]} stanów i {report["Transitions"]} przejść w {report["Seconds"]} s '
+          f'(największa głębokość {report["MaxDepth"]}).')
+    if report["Complete"]:
+        print('Przestrzeń stanów została zbadana w całości.')
+    else:
+        print(f'Przeszukiwanie niepełne: {report["StopReason"] or "limit głębokości"}.')
+    print(f'Stany wygrywające: {report["Wins"]}.')
+    if report["WinPaths"]:
+        shortest = min(report["WinPaths"], key=len)
+        print(f'Najkrótsza znaleziona droga do wygranej ({len(shortest)} ruchów):')
+        for move in shortest:
+            print(f'    {move["Title"].split(" / ")[0]}')
+    print('Ślepe zaułki: ' + (', '.join(f'{k} – {v}' for k, v in report["DeadEndsCount"].items()) or 'brak'))
+    for error in report["Errors"]:
+        print(f'Wyjątek po ruchach {[move["Title"].split(" / ")[0] for move in error["Path"]]}:')
+        print(error["Traceback"])
@@ -0,0 +1,193 @@
+from hashlib import blake2b
+from typing import List, Union
+
+from library.tools import is_node
+
+# warstwy dzieci węzła
+NODE_LAYERS = ('Characters', 'Items', 'Narration')
+# klucze nieuwzględniane w skrócie węzła (tożsamość węzła i warstwy liczone osobno)
+_SKIPPED_KEYS = ('Id', 'Name', 'Attributes', 'Connections') + NODE_LAYERS
+HASH_SIZE = 16
+
+
+def _value_bytes(value) -> bytes:
+    # wartości atrybutów są skalarne, repr jest jednoznaczny i niezależny od procesu (w przeciwieństwie do hash())
+    return repr(value).encode('utf8')
+
+
+def node_hash(node, children_hashes: dict = None) -> bytes:
+    """
+    Canonical hash of the node with its subtree: name, sorted attributes, other properties and multisets
+    of hashes of children in every layer. Node identity (Id, address) and the order of children are ignored.
+    :param node: node of the world
+    :param children_hashes: dict id(child) -> hash of already hashed children (computed recursively if missing)
+    :return: hash (bytes)
+    """
+    digest = blake2b(digest_size=HASH_SIZE)
+    digest.update(_value_bytes(node.get('Name')))
+    attributes = node.get('Attributes')
+    if attributes:
+        for key, value in sorted(attributes.items(), key=lambda x: x[0]):
+            digest.update(b'\x00A' + key.encode('utf8') + b'=' + _value_bytes(value))
+    for key in sorted(k for k in node if k not in _SKIPPED_KEYS):
+        digest.update(b'\x00P' + key.encode('utf8') + b'=' + _value_bytes(node[key]))
+    for layer in NODE_LAYERS:
+        children = node.get(layer)
+        if not children:
+            continue
+        hashes = sorted(children_hashes[id(child)] if children_hashes and id(child) in children_hashes
+                        else node_hash(child, children_hashes) for child in children)
+        digest.update(b'\x00L' + layer.encode('utf8') + len(hashes).to_bytes(4, 'little'))
+        for child_hash in hashes:
+            digest.update(child_hash)
+    return digest.digest()
+
+
+def locations_hash(locations_hashes: List[bytes], world: list) -> bytes:
+    """
+    Combines hashes of locations into the hash of the world, adding connections between locations
+    (each connection as the pair of hashes of its ends).
+    :param locations_hashes: hashes of locations, in the order of the world list
+    :param world: list of locations (destinations changed to nodes)
+    :return: hash of the world
+    """
+    hash_by_location = {id(location): location_hash for location, location_hash in zip(world, locations_hashes)}
+    entries = []
+    for location, location_hash in zip(world, locations_hashes):
+        destinations = sorted(hash_by_location.get(id(connection.get('Destination')), b'')
+                              if is_node(connection.get('Destination'))
+                              else _value_bytes(connection.get('Destination'))
+                              for connection in location.get('Connections') or [])
+        entries.append(location_hash + b''.join(destinations))
+    digest = blake2b(digest_size=HASH_SIZE)
+    for entry in sorted(entries):
+        digest.update(len(entry).to_bytes(4, 'little') + entry)
+    return digest.digest()
+
+
+def world_hash(world: list) -> bytes:
+    """
+    Canonical hash of the world state: two worlds have the same hash if they are equal up to node identity
+    and order of nodes in layers.
+    :param world: list of locations (destinations changed to nodes)
+    :return: hash (bytes)
+    """
+    return locations_hash([node_hash(location) for location in world], world)
+
+
+class WorldHasher:
+    """
+    Canonical world hash maintained incrementally (Merkle tree over the world nodes). The hashes of nodes are
+    cached; after a move only the nodes changed by the operations (see touched_nodes in apply_instructions_to_world)
+    and their ancestors are hashed again, so the cost depends on the changed paths, not on the size of the world.
+    """
+
+    def __init__(self, world: list):
+        """
+        :param world: list of locations (destinations changed to nodes)
+        """
+        self.world = world
+        # id węzła -> (węzeł, skrót, id dzieci); referencja do węzła chroni id przed ponownym użyciem
+        self._entries = {}
+        # id węzła -> rodzic (lokacje nie mają rodzica)
+        self._parents = {}
+        self._dirty = set()
+        self._locations_hashes = [self._node_hash(location, None) for location in world]
+        self._hash = locations_hash(self._locations_hashes, world)
+
+    def _node_hash(self, node, parent) -> bytes:
+        """
+        Hashes the node using the cached hashes of its unchanged children and updates the cache.
+        :param node: node of the world
+        :param parent: parent of the node (None for locations)
+        :return: hash of the node
+        """
+        self._parents[id(node)] = parent
+        entry = self._entries.get(id(node))
+        if entry is not None and entry[0] is node and id(node) not in self._dirty:
+            return entry[1]
+        self._dirty.discard(id(node))
+        children = [child for layer in NODE_LAYERS for child in node.get(layer) or []]
+        children_hashes = {id(child): self._node_hash(child, node) for child in children}
+        node_hash_value = node_hash(node, children_hashes)
+        children_ids = frozenset(children_hashes)
+        if entry is not None:
+            # dzieci usunięte z węzła (i nieprzeniesione gdzie indziej) nie są już potrzebne w pamięci podręcznej
+            for child_id in entry[2] - children_ids:
+                if self._parents.get(child_id) is node:
+                    self._forget(child_id)
+        self._entries[id(node)] = (node, node_hash_value, children_ids)
+        return node_hash_value
+
+    def _forget(self, node_id: int):
+        entry = self._entries.pop(node_id, None)
+        self._parents.pop(node_id, None)
+        if entry is not None:
+            for child_id in entry[2]:
+                self._forget(child_id)
+
+    def copy(self, world: list, memo: dict) -> 'WorldHasher':
+        """
+        Creates the hasher of the deep copy of the world without hashing it again.
+        :param world: copy of the world made by deepcopy(self.world, memo)
+        :param memo: memo dict of that deepcopy (id of the original -> copy)
+        :return: hasher of the copy
+        """
+        self.hash()
+        hasher = WorldHasher.__new__(WorldHasher)
+        hasher.world = world
+        hasher._entries = {}
+        hasher._parents = {}
+        hasher._dirty = set()
+        for node_id, (node, node_hash_value, children_ids) in self._entries.items():
+            new_node = memo.get(node_id)
+            if new_node is None:
+                continue
+            hasher._entries[id(new_node)] = (new_node, node_hash_value,
+                                             frozenset(id(memo[child_id]) for child_id in children_ids))
+            parent = self._parents.get(node_id)
+            hasher._parents[id(new_node)] = memo[id(parent)] if parent is not None else None
+        hasher._locations_hashes = list(self._locations_hashes)
+        hasher._hash = self._hash
+        return hasher
+
+    def touch(self, nodes: list):
+        """
+        Marks the changed nodes and their ancestors for hashing.
+        :param nodes: nodes changed by the operations (attributes or lists of children)
+        """
+        for node in nodes:
+            node_id = id(node)
+            while node_id not in self._dirty:
+                self._dirty.add(node_id)
+                parent = self._parents.get(node_id)
+                if parent is None:
+                    break
+                node_id = id(parent)
+        self._hash = None
+
+    def hash(self) -> bytes:
+        """
+        :return: canonical hash of the current world state (equal to world_hash(world))
+        """
+        if self._hash is None:
+            locations_hashes = []
+            for nr, location in enumerate(self.world):
+                if id(location) in self._dirty:
+                    locations_hashes.append(self._node_hash(location, None))
+                else:
+                    locations_hashes.append(self._locations_hashes[nr])
+            self._locations_hashes = locations_hashes
+            self._hash = locations_hash(locations_hashes, self.world)
+            # pozostałe oznaczone węzły zostały usunięte ze świata
+            self._dirty.clear()
+        return self._hash
+
+    def node_hash(self, node) -> Union[bytes, None]:
+        """
+        :param node: node of the world
+        :return: hash of the node with its subtree or None if the node is not in the world
+        """
+        self.hash()
+        entry = self._entries.get(id(node))
+        return entry[1] if entry is not None and entry[0] is node else None
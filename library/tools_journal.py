@@ -0,0 +1,341 @@
+import gzip
+import json
+import os
+import re
+from json import JSONDecodeError
+from typing import Iterator, Tuple, Union
+
+from library.tools import json_default
+from library.tools_binary import pack_hash
+
+# rozszerzenia plików dziennika rozgrywki (jeden rekord JSON w każdej linii)
+JOURNAL_EXTENSION = '.jsonl'
+JOURNAL_GZIP_EXTENSION = '.jsonl.gz'
+INDEX_EXTENSION = '.idx'
+
+# typy rekordów dziennika
+RECORD_HEADER = 'Header'
+RECORD_MOVE = 'Move'
+RECORD_END = 'End'
+
+# pakiety produkcji zapisane w nagłówku rozgrywki
+PRODUCTION_PACKS = ('QuestSource', 'WorldResponseSource')
+
+# otwarte dzienniki rozgrywek, kluczem jest id() słownika rozgrywki
+_open_journals = {}
+
+
+class GameplayJournal:
+    """
+    Append-only gameplay journal. The first line is the header record (the gameplay dict without moves),
+    then every move is written as a separate line. Lines are buffered and flushed in batches.
+    The uncompressed journal is accompanied by the index file with byte offsets of the records.
+    """
+
+    def __init__(self, file_path: str, compress: bool = False, batch_size: int = 10, index: bool = True):
+        self.file_path = file_path
+        self.compress = compress
+        self.batch_size = max(1, batch_size)
+        self.moves_count = 0
+        self._buffer = []
+        self._index_buffer = []
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        if compress:
+            self._file = gzip.open(file_path, 'at', encoding='utf8')
+        else:
+            # newline='\n', żeby przesunięcia w indeksie zgadzały się z bajtami pliku
+            self._file = open(file_path, 'a', encoding='utf8', newline='\n')
+        # w skompresowanym pliku nie da się szybko przeskoczyć do rekordu, więc nie tworzymy indeksu
+        self._index_file = None
+        if index and not compress:
+            self._offset = os.path.getsize(file_path)
+            self._index_file = open(index_file_path(file_path), 'a', encoding='utf8', newline='\n')
+
+    def _write(self, record: dict, force_flush: bool = False, index_entry: dict = None):
+        line = json.dumps(record, ensure_ascii=False, default=json_default)
+        self._buffer.append(line)
+        if self._index_file:
+            length = len(line.encode('utf8'))
+            entry = {"Record": record["Record"], "Offset": self._offset, "Length": length}
+            entry.update(index_entry or {})
+            self._index_buffer.append(json.dumps(entry, ensure_ascii=False))
+            self._offset += length + 1
+        if force_flush or len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def write_header(self, gp: dict):
+        header = {k: v for k, v in gp.items() if k != 'Moves'}
+        packs = {k: pack_hash(gp[k]) for k in PRODUCTION_PACKS if k in gp} if self._index_file else None
+        self._write({"Record": RECORD_HEADER, "Gameplay": header}, force_flush=True, index_entry={"Packs": packs})
+
+    def append_move(self, move: dict):
+        self._write({"Record": RECORD_MOVE, "Nr": self.moves_count, "Move": move},
+                    index_entry={"Nr": self.moves_count, "Keyframe": "WorldAfter" in move})
+        self.moves_count += 1
+
+    def write_end(self, gp: dict):
+        end = {k: gp[k] for k in ("DateTimeEnd", "EndReason", "EndDecisionExplanation", "PlayerComment") if k in gp}
+        self._write({"Record": RECORD_END, "Gameplay": end}, force_flush=True)
+
+    def flush(self):
+        if self._buffer:
+            self._file.write('\n'.join(self._buffer) + '\n')
+            self._buffer = []
+        self._file.flush()
+        # indeks zapisujemy po danych, więc nigdy nie wskazuje rekordu, którego nie ma w dzienniku
+        if self._index_file and self._index_buffer:
+            self._index_file.write('\n'.join(self._index_buffer) + '\n')
+            self._index_buffer = []
+            self._index_file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+        if self._index_file and not self._index_file.closed:
+            self._index_file.close()
+
+
+def journal_file_path(gp: dict, compress: bool = False) -> str:
+    """
+    Builds the path of the journal file using the same naming scheme as the gameplay json file.
+    :param gp: gameplay dict
+    :param compress: True if the journal is gzip-compressed
+    :return: path of the journal file
+    """
+    player_to_filename = re.sub(r'[^\w\d-]+', '', gp["Player"])
+    extension = JOURNAL_GZIP_EXTENSION if compress else JOURNAL_EXTENSION
+    return f'{gp["FilePath"]}{os.sep}gameplay_{gp["QuestName"]}_{gp["WorldName"]}_{gp["DateTimeStart"]}_{player_to_filename}{extension}'
+
+
+def index_file_path(journal_path: str) -> str:
+    return journal_path + INDEX_EXTENSION
+
+
+def is_journal_file(file_name: str) -> bool:
+    return file_name.endswith(JOURNAL_EXTENSION) or file_name.endswith(JOURNAL_GZIP_EXTENSION)
+
+
+def open_journal(gp: dict, compress: bool = False, batch_size: int = 10) -> GameplayJournal:
+    """
+    Opens the journal for the given gameplay and writes its header record.
+    :param gp: gameplay dict
+    :param compress: True to write gzip-compressed journal
+    :param batch_size: number of records buffered before writing them to the file
+    :return: journal object
+    """
+    journal = GameplayJournal(journal_file_path(gp, compress), compress, batch_size)
+    journal.write_header(gp)
+    _open_journals[id(gp)] = journal
+    return journal
+
+
+def get_journal(gp: dict) -> Union[GameplayJournal, None]:
+    return _open_journals.get(id(gp))
+
+
+def close_journal(gp: dict) -> bool:
+    """
+    Writes the end record and closes the journal of the given gameplay.
+    :param gp: gameplay dict
+    :return: True if the gameplay had an open journal
+    """
+    journal = _open_journals.pop(id(gp), None)
+    if not journal:
+        return False
+    journal.write_end(gp)
+    journal.close()
+    return True
+
+
+def read_journal(file_path: str) -> Iterator[dict]:
+    """
+    Reads the journal record by record. Stops on the truncated tail of the file (e.g. after a crash).
+    :param file_path: path of the journal file
+    :return: generator of records
+    """
+    opener = gzip.open if file_path.endswith('.gz') else open
+    with opener(file_path, 'rt', encoding='utf8') as infile:
+        try:
+            for line_nr, line in enumerate(infile):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except JSONDecodeError:
+                    print(f'Uszkodzony rekord nr {line_nr} w dzienniku {file_path}. Pomijam dalszą część pliku.')
+                    return
+        except EOFError:
+            print(f'Niekompletny plik {file_path}. Wczytano rekordy zapisane przed przerwaniem.')
+
+
+def read_gameplay(gameplay_dir: str, gameplay_filename: str) -> Tuple[dict, Iterator[dict]]:
+    """
+    Opens the gameplay saved either as a single json or as a journal.
+    :param gameplay_dir: directory of the gameplay file
+    :param gameplay_filename: name of the gameplay file
+    :return: gameplay dict (without moves) and the iterator of moves
+    """
+    file_path = f'{gameplay_dir}/{gameplay_filename}'
+    if not is_journal_file(gameplay_filename):
+        gp = json.load(open(file_path, encoding="utf8"))
+        return gp, iter(gp.get("Moves", []))
+
+    records = read_journal(file_path)
+    first = next(records, None)
+    if not first or first.get("Record") != RECORD_HEADER:
+        print(f'Brak nagłówka w dzienniku {file_path}.')
+        return {}, iter([])
+    gp = first["Gameplay"]
+
+    def moves():
+        for record in records:
+            if record.get("Record") == RECORD_MOVE:
+                yield record["Move"]
+            elif record.get("Record") == RECORD_END:
+                gp.update(record["Gameplay"])
+
+    return gp, moves()
+
+
+def read_journal_record(file_path: str, offset: int, length: int) -> Union[dict, None]:
+    """
+    Reads a single record of the uncompressed journal using its position from the index.
+    :param file_path: path of the journal file
+    :param offset: byte offset of the record
+    :param length: length of the record in bytes
+    :return: record or None if the index does not match the journal
+    """
+    with open(file_path, 'rb') as infile:
+        infile.seek(offset)
+        data = infile.read(length)
+    try:
+        return json.loads(data.decode('utf8'))
+    except (JSONDecodeError, UnicodeDecodeError):
+        print(f'Indeks nie zgadza się z dziennikiem {file_path}.')
+        return None
+
+
+def _read_lines_backwards(file_path: str, block_size: int = 65536) -> Iterator[bytes]:
+    # czytamy plik blokami od końca, dzięki czemu koszt nie zależy od długości pliku
+    with open(file_path, 'rb') as infile:
+        infile.seek(0, os.SEEK_END)
+        position = infile.tell()
+        rest = b''
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            infile.seek(position)
+            lines = (infile.read(read_size) + rest).split(b'\n')
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if rest.strip():
+            yield rest
+
+
+def _ends_with_newline(file_path: str) -> bool:
+    if not os.path.getsize(file_path):
+        return True
+    with open(file_path, 'rb') as infile:
+        infile.seek(-1, os.SEEK_END)
+        return infile.read(1) == b'\n'
+
+
+def _last_index_entry(index_path: str) -> Union[dict, None]:
+    for line in _read_lines_backwards(index_path):
+        try:
+            return json.loads(line)
+        except JSONDecodeError:
+            # niedokończony ostatni wpis (np. po przerwaniu programu)
+            continue
+    return None
+
+
+def update_journal_index(journal_path: str) -> bool:
+    """
+    Creates the index of the uncompressed journal or completes it with the records which are not indexed yet
+    (e.g. journals written before the index was introduced or interrupted before the index was flushed).
+    Only the part of the journal behind the last indexed record is read.
+    :param journal_path: path of the journal file
+    :return: True if the index is up to date
+    """
+    if journal_path.endswith('.gz') or not os.path.exists(journal_path):
+        return False
+    index_path = index_file_path(journal_path)
+    last_entry = _last_index_entry(index_path) if os.path.exists(index_path) else None
+    if last_entry:
+        start = last_entry["Offset"] + last_entry["Length"] + 1
+        moves_count = last_entry["Nr"] + 1 if last_entry["Record"] == RECORD_MOVE else 0
+    else:
+        start = 0
+        moves_count = 0
+        # indeks bez żadnego kompletnego wpisu tworzymy od nowa
+        open(index_path, 'w').close()
+    if start >= os.path.getsize(journal_path):
+        return True
+
+    entries = []
+    with open(journal_path, 'rb') as infile:
+        infile.seek(start)
+        offset = start
+        for line in infile:
+            if not line.endswith(b'\n'):
+                break  # niekompletny ostatni rekord
+            length = len(line) - 1
+            try:
+                record = json.loads(line.decode('utf8'))
+            except (JSONDecodeError, UnicodeDecodeError):
+                print(f'Uszkodzony rekord w dzienniku {journal_path}. Indeks obejmuje rekordy przed nim.')
+                break
+            entry = {"Record": record.get("Record"), "Offset": offset, "Length": length}
+            if record.get("Record") == RECORD_HEADER:
+                entry["Packs"] = {k: pack_hash(record["Gameplay"][k]) for k in PRODUCTION_PACKS
+                                  if k in record["Gameplay"]}
+            elif record.get("Record") == RECORD_MOVE:
+                entry["Nr"] = record.get("Nr", moves_count)
+                entry["Keyframe"] = "WorldAfter" in record["Move"]
+                moves_count = entry["Nr"] + 1
+            entries.append(json.dumps(entry, ensure_ascii=False))
+            offset += len(line)
+    if entries:
+        # niedokończony ostatni wpis indeksu zostawiamy w osobnej linii (czytający go pomijają)
+        broken_tail = not _ends_with_newline(index_path)
+        with open(index_path, 'a', encoding='utf8', newline='\n') as index_file:
+            index_file.write(('\n' if broken_tail else '') + '\n'.join(entries) + '\n')
+    return True
+
+
+def find_resume_point(journal_path: str) -> Union[dict, None]:
+    """
+    Finds in the index the header record and the last keyframe (move with the whole world state).
+    Reads only the beginning and the end of the index, so the cost does not grow with the gameplay length.
+    :param journal_path: path of the uncompressed journal
+    :return: dict with keys 'Header', 'Keyframe' (index entries, 'Keyframe' may be None) and 'MovesCount'
+    or None if the journal cannot be indexed
+    """
+    if not update_journal_index(journal_path):
+        return None
+    index_path = index_file_path(journal_path)
+    with open(index_path, encoding='utf8') as index_file:
+        header = json.loads(index_file.readline() or 'null')
+    if not header or header.get("Record") != RECORD_HEADER:
+        print(f'Brak nagłówka w indeksie {index_path}.')
+        return None
+
+    keyframe = None
+    moves_count = 0
+    for line in _read_lines_backwards(index_path):
+        try:
+            entry = json.loads(line)
+        except JSONDecodeError:
+            continue
+        if entry.get("Record") == RECORD_HEADER:
+            break
+        if entry.get("Record") == RECORD_MOVE:
+            moves_count = max(moves_count, entry["Nr"] + 1)
+            if entry.get("Keyframe"):
+                keyframe = entry
+                break
+    return {"Header": header, "Keyframe": keyframe, "MovesCount": moves_count}
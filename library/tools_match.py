@@ -1,6 +1,9 @@
 import datetime
+import hashlib
 import inspect
+import json
 import re
+from concurrent.futures import ProcessPoolExecutor
 from copy import copy, deepcopy
 from itertools import product
 from typing import Union, Tuple, List
@@ -11,12 +14,28 @@ import os
 
 from library.tools import breadcrumb_pointer, list_from_tree, find_reference_leaves, \
     eval_expression_po_rozmowie_z_Wojtkiem, action_description, sheaf_description, world_copy, \
-    destinations_change_to_nodes
+    destinations_change_to_nodes, is_node
 from library.tools_process import save_world, apply_instructions_to_world, draw_variants_graphs, \
-    dict_from_variant, get_reds
+    dict_from_variant, get_reds, record_move
 from library.tools_visualisation import draw_graph
 
 
+def _call_depth(function_name: str) -> int:
+    """
+    Counts the calls of the function on the current call stack (as the frames from inspect.stack, but without
+    reading the source files of all frames).
+    :param function_name: name of the function
+    :return: number of the frames of the function
+    """
+    count = 0
+    frame = inspect.currentframe()
+    while frame is not None:
+        if frame.f_code.co_name == function_name:
+            count += 1
+        frame = frame.f_back
+    return count
+
+
 def neighbours_mismatch_removal(matches: list, ls_node_match: dict, w_node: dict, single_match: bool = True, test_mode = False) -> bool:
     """
     NEW Narrows down the potential matches lists using the property of neighbourhood
@@ -107,7 +126,7 @@ def neighbours_mismatch_removal(matches: list, ls_node_match: dict, w_node: dict
                         error_log += "Coś poszło bardzo nie tak z usuwaniem niepasującego węzła świata."
                         print("Coś poszło bardzo nie tak z usuwaniem niepasującego węzła świata.")
                     return False
-                elif len(intersection) == 1 and single_match and len([x for x in inspect.stack(0) if x.function == 'neighbours_mismatch_removal']) < 100:
+                elif len(intersection) == 1 and single_match and _call_depth('neighbours_mismatch_removal') < 100:
                     neighbours_mismatch_removal(matches, neighbour, neighbour['w_nodes_list'][0], single_match=True)
 
     # w produkcji i w świecie są sąsiedzi, ale w świecie za mało
@@ -146,25 +165,29 @@ def fit_properties(ls_element: dict, world_element: dict, test_mode: bool = Fals
     """
     error_log = ''
 
+    # węzły innych implementacji niż słownik mogą mieć własne, szybsze porównanie (np. SlotNode po symbolach)
+    if hasattr(world_element, 'fits'):
+        return world_element.fits(ls_element)
+
     if 'Name' in ls_element and world_element.get('Name') != ls_element['Name']:
-        error_log += f"Potomek {len([x for x in inspect.stack(0) if x.function == 'node_and_children_match'])-1} rzędu: \
+        error_log += f"Potomek {_call_depth('node_and_children_match')-1} rzędu: \
               {ls_element['Name']} i {world_element.get('Name')} nie pasują do siebie."
         return False
 
     if 'Attributes' in ls_element and ls_element['Attributes']:
         if 'Attributes' not in world_element:
-            error_log += f"Potomek {len([x for x in inspect.stack(0) if x.function == 'node_and_children_match'])-1} rzędu: \
+            error_log += f"Potomek {_call_depth('node_and_children_match')-1} rzędu: \
                   {ls_element.get('Id', ls_element.get('Name'))} ma atrybuty {ls_element['Attributes']} a \
                   {world_element.get('Name')} nie ma."
             return False
         for attr, v in ls_element['Attributes'].items():
             if attr not in world_element['Attributes']:
-                error_log += f"Potomek {len([x for x in inspect.stack(0) if x.function == 'node_and_children_match']) - 1} \
+                error_log += f"Potomek {_call_depth('node_and_children_match') - 1} \
                 rzędu: {ls_element.get('Id', ls_element.get('Name'))} ma atrybut {attr} o wartości {v} a \
                 {world_element.get('Name')} nie ma."
                 return False
             if v is not None and v != world_element['Attributes'][attr]:
-                error_log += f"Potomek {len([x for x in inspect.stack(0) if x.function == 'node_and_children_match']) - 1} \
+                error_log += f"Potomek {_call_depth('node_and_children_match') - 1} \
                 rzędu: {ls_element.get('Id', ls_element.get('Name'))} ma atrybut \
                     {attr} o wartości {v} a {world_element.get('Name')} ma {world_element['Attributes'].get(attr)}."
                 return False
@@ -174,12 +197,14 @@ def fit_properties(ls_element: dict, world_element: dict, test_mode: bool = Fals
     return True
 
 
-def node_and_children_match(parent_ls: dict, parent_w: dict, character: Union[str, dict]=None, test_mode: bool = None) -> Tuple[bool, list]:
+def node_and_children_match(parent_ls: dict, parent_w: dict, character: Union[str, dict]=None, test_mode: bool = None,
+                            fitting_cache: dict = None) -> Tuple[bool, list]:
     """
     NEW Checks if the properties of given pair of nodes fits, match their children and recursively checks their matches
     :param parent_ls: production element of given pair
     :param parent_w: world element of given pair
     :param character: the node given as the object of the production
+    :param fitting_cache: matches of children subtrees shared between characters (see what_to_do_batch)
     :return: True or False
     """
     error_log = ''
@@ -217,7 +242,7 @@ def node_and_children_match(parent_ls: dict, parent_w: dict, character: Union[st
             continue  # jest w porządku, lecimy do następnej warstwy
         if layer in parent_ls and len(parent_ls[layer]) > 0:
             if layer not in parent_w or len(parent_w[layer]) < len(parent_ls[layer]):
-                error_log =f"Potomek {len([x for x in inspect.stack(0) if x.function == 'node_and_children_match']) - 1} \
+                error_log =f"Potomek {_call_depth('node_and_children_match') - 1} \
                 rzędu: {parent_ls.get('Id', parent_ls.get('Name'))} ma dzieci w warstwie {layer} a \
                 {parent_w.get('Name')} nie ma lub ma za mało."
                 return False, []
@@ -239,7 +264,7 @@ def node_and_children_match(parent_ls: dict, parent_w: dict, character: Union[st
                 w_nodes_with_ls_names[current_name] = [nd for nd in w_nodes if nd.get('Name') == current_name]
                 w_names_count[current_name] = len(w_nodes_with_ls_names[current_name])
                 if ls_names_count[current_name] > w_names_count[current_name]:
-                    error_log =f"Potomek {len([x for x in inspect.stack(0) if x.function == 'node_and_children_match']) - 1} \
+                    error_log =f"Potomek {_call_depth('node_and_children_match') - 1} \
                     rzędu: „{parent_ls.get('Id', parent_ls.get('Name'))}” nie pasuje do „{parent_w.get('Name')}”, \
                     bo w lewej stronie jest więcej dzieci „{current_name}”."
                     return False, []
@@ -293,15 +318,16 @@ def node_and_children_match(parent_ls: dict, parent_w: dict, character: Union[st
         if 'w_nodes_list' in node and len(node['w_nodes_list']) > 0:
             extended_children_list = []
             error_list = []
+            ls_len = len(list_from_tree(node['ls_node']))
             for possible_node in node['w_nodes_list']:
-                fitting, fitting_result = node_and_children_match(node['ls_node'], possible_node, character=character)  # fitting_nodes będzie listą list tupli
+                fitting, fitting_result = _cached_node_match(node['ls_node'], possible_node, character, fitting_cache)  # fitting_nodes będzie listą list tupli
                 if fitting:
                     if fitting_result:
                         for package in fitting_result:
-                            if len(package) == len(list_from_tree(node['ls_node']))-1: # trzeba przetestować ten dodatkowy warunek
+                            if len(package) == ls_len - 1: # trzeba przetestować ten dodatkowy warunek
                                 extended_children_list.append([(node['ls_node'], possible_node)] + package)
                     else:
-                        if len(list_from_tree(node['ls_node'])) == 1:
+                        if ls_len == 1:
                             extended_children_list.append([(node['ls_node'], possible_node)])
                 else:
                     error_list.append(possible_node)  # dodane, przetestować
@@ -388,6 +414,21 @@ def find_matches_in_world(world: Union[list, dict], world_main_location:dict, pr
     :param test_mode:
     :return:
     """
+    matches_OK, matches = find_location_candidates(world, world_main_location, prod)
+    if not matches_OK:
+        return False, []
+    return match_location_candidates(prod, matches, character=character, test_mode=test_mode)
+
+
+def find_location_candidates(world: Union[list, dict], world_main_location: dict, prod: dict) -> Tuple[bool, list]:
+    """
+    The first, character independent part of find_matches_in_world: lists of world locations which may be matched
+    to the locations of the production (by names and neighbourhood).
+    :param world: list of locations
+    :param world_main_location: location of the character
+    :param prod: production
+    :return: True or False (the production can not be matched) and the list of dicts with keys ls_node, w_nodes_list
+    """
     error_log = ''
     error_log =f"### {prod['Title'].split(' / ')[0]} ###"
     # inicjowanie tabeli lokacji dla produkcji
@@ -495,24 +536,66 @@ def find_matches_in_world(world: Union[list, dict], world_main_location:dict, pr
                 # "Pasture" [{'Destination': 'Road'}, {'Destination': 'Village'}]
                 # "Road" [{'Destination': 'Forest'}, {'Destination': 'Inn'}, {'Destination': 'Pasture'}, {'Destination': 'Village'}, {'Destination': 'Wizards_hut'}]
 
+    return True, matches
+
+
+def _has_object(ls_node: dict) -> bool:
+    return any(child.get('IsObject') or _has_object(child)
+               for layer in ['Characters', 'Items', 'Narration'] for child in ls_node.get(layer) or [])
+
+
+def _cached_node_match(ls_node: dict, w_node: dict, character, fitting_cache: Union[dict, None]) -> Tuple[bool, list]:
+    """
+    node_and_children_match with the results for LS subtrees without IsObject nodes (independent of the character)
+    remembered in fitting_cache.
+    """
+    if fitting_cache is None:
+        return node_and_children_match(ls_node, w_node, character=character)
+    object_free = fitting_cache.get(id(ls_node))
+    if object_free is None:
+        object_free = fitting_cache[id(ls_node)] = not _has_object(ls_node)
+    if not object_free:
+        return node_and_children_match(ls_node, w_node, character=character, fitting_cache=fitting_cache)
+    key = (id(ls_node), id(w_node))
+    if key not in fitting_cache:
+        fitting_cache[key] = node_and_children_match(ls_node, w_node, character=character)
+    return fitting_cache[key]
+
+
+def match_location_candidates(prod: dict, matches: list, character=None, test_mode=False,
+                              fitting_cache: dict = None) -> Tuple[bool, list]:
+    """
+    The second part of find_matches_in_world: matches the subtrees of the candidate locations and builds the variants.
+    :param prod: production
+    :param matches: result of find_location_candidates (lists of candidates are narrowed down in place)
+    :param character: the node given as the object of the production
+    :param test_mode: print the matches
+    :param fitting_cache: dict for sharing the matches of location subtrees without IsObject nodes (they do not depend
+    on the character) between calls for different characters in the same state of the world
+    :return: True or False and the list of variants
+    """
+    error_log = ''
+    production_impossible = False
+
     # usuwanie węzłów, których atrybuty, liczba dzieci etc nie pasują.
     current_matches = []
     for location in matches:
         if 'w_nodes_list' in location:
             extended_children_list = []
             error_list = []
+            ls_len = len(list_from_tree(location['ls_node']))
             for possible_node in location['w_nodes_list']:
                 #
-                fitting, fitting_result = node_and_children_match(location['ls_node'], possible_node,
-                                                                  character=character)  # fitting_nodes będzie listą list tupli
+                fitting, fitting_result = _cached_node_match(location['ls_node'], possible_node, character,
+                                                             fitting_cache)  # fitting_nodes będzie listą list tupli
                 if fitting:
                     if fitting_result:
                         for package in fitting_result:
-                            if len(package) == len(list_from_tree(location['ls_node'])) - 1:  # trzeba przetestować ten dodatkowy warunek
+                            if len(package) == ls_len - 1:  # trzeba przetestować ten dodatkowy warunek
                                 extended_children_list.append([(location['ls_node'], possible_node)] + package)
 
                     else:
-                        if len(list_from_tree(location['ls_node'])) == 1:  # trzeba przetestować ten dodatkowy warunek
+                        if ls_len == 1:  # trzeba przetestować ten dodatkowy warunek
                             extended_children_list.append([(location['ls_node'], possible_node)])
                 else:
                     error_list.append(possible_node) # dodane, przetestować
@@ -677,37 +760,270 @@ def what_to_do(world: Union[list, dict], main_location: dict, production_list: l
         matches_OK, matches_to_verify_preconditions = find_matches_in_world(world, world_main_location, prod, test_mode, character=character)
         if not matches_OK:
             continue
-        # testowe
-        for variant in matches_to_verify_preconditions:
-            ls_len = len(list_from_tree(prod['LSide']))
-            variant_len = len(variant)
-            if ls_len != variant_len:
-                print(f'Coś poszło nie tak: dopasowano {variant_len} węzłów do {ls_len} węzłów do produkcji {prod["Title"].split(" / ")[0]}.')
-
-        # sprawdzanie predykatów stosowalności
-        if not prod_vis_mode:
-            if prod.get('Preconditions'):
-                matches_OK, matches_verified_with_preconditions = verify_matches_with_preconditions(prod, matches_to_verify_preconditions)
-            else:
-                matches_verified_with_preconditions = matches_to_verify_preconditions
+        matched_prod = _matched_production(prod, matches_to_verify_preconditions, prod_vis_mode)
+        if matched_prod is not None:
+            all_matches.append(matched_prod)
+
+    return True, all_matches
+
+
+def _matched_production(prod: dict, matches_to_verify_preconditions: list, prod_vis_mode=False) -> Union[dict, None]:
+    """
+    The last part of matching in what_to_do: checks the preconditions of the variants.
+    :param prod: production
+    :param matches_to_verify_preconditions: variants found by find_matches_in_world
+    :param prod_vis_mode: preconditions are not checked
+    :return: copy of the production with the key Matches or None if the preconditions are not met
+    """
+    # testowe
+    ls_len = len(list_from_tree(prod['LSide'])) if matches_to_verify_preconditions else 0
+    for variant in matches_to_verify_preconditions:
+        variant_len = len(variant)
+        if ls_len != variant_len:
+            print(f'Coś poszło nie tak: dopasowano {variant_len} węzłów do {ls_len} węzłów do produkcji {prod["Title"].split(" / ")[0]}.')
+
+    # sprawdzanie predykatów stosowalności
+    matches_OK = True
+    if not prod_vis_mode:
+        if prod.get('Preconditions'):
+            matches_OK, matches_verified_with_preconditions = verify_matches_with_preconditions(prod, matches_to_verify_preconditions)
         else:
-            # if prod.get('Preconditions'):
-            #     pass
-            #     compare_preconditions(prod, matches_to_verify_preconditions)
-            #     matches_verified_with_preconditions = matches_to_verify_preconditions
-            #     # sprawdzić, czy preconditions pasują i instrukcje pasują
-            # else:
-            #     # sprawdzić, czy instrukcje pasują
             matches_verified_with_preconditions = matches_to_verify_preconditions
+    else:
+        # if prod.get('Preconditions'):
+        #     pass
+        #     compare_preconditions(prod, matches_to_verify_preconditions)
+        #     matches_verified_with_preconditions = matches_to_verify_preconditions
+        #     # sprawdzić, czy preconditions pasują i instrukcje pasują
+        # else:
+        #     # sprawdzić, czy instrukcje pasują
+        matches_verified_with_preconditions = matches_to_verify_preconditions
+    if not matches_OK:
+        return None
+
+    matched_prod = prod.copy()
+    matched_prod['Matches'] = matches_verified_with_preconditions
+
+    return matched_prod
+
+
+def _single_object_nodes(ls_node: dict) -> list:
+    # węzły IsObject jedyne wśród postaci swojego rodzica – dopasowywane wprost do postaci (node_and_children_match)
+    objects = [nd for nd in ls_node.get('Characters') or [] if nd.get('IsObject') == True]
+    result = objects if len(objects) == 1 else []
+    for layer in ['Characters', 'Items', 'Narration']:
+        for child in ls_node.get(layer) or []:
+            result.extend(_single_object_nodes(child))
+    return result
+
+
+def what_to_do_batch(world: Union[list, dict], main_location: dict, production_list: list, characters: list,
+                     test_mode=False) -> List[Tuple[bool, list]]:
+    """
+    Matches productions for many characters of the same location in one pass, with the same result as what_to_do
+    called for every character. Candidates of locations are found once per production, subtrees of locations
+    without IsObject nodes are matched once for all characters, and productions whose object node does not fit
+    the character are skipped for that character without matching.
+    :param world: The graph of the actual world state
+    :param main_location: location of the characters
+    :param production_list: The list of productions to match
+    :param characters: nodes of the characters
+    :param test_mode: The indicator of error status printing
+    :return: list of what_to_do results (pairs: True or False and the list of matched productions), one per character
+    """
+    results = []
+    active_characters = []
+    for character in characters:
+        initial_paths = breadcrumb_pointer(world, pointer=character, layer='Characters')
+        if len(initial_paths) != 1 or initial_paths[0][-2] is not main_location:
+            print(f"Wskazanie głównego bohatera „{character.get('Name')}” w świecie nie jest jednoznaczne!")
+            results.append((False, []))
+        else:
+            results.append((True, []))
+            active_characters.append((len(results) - 1, character))
+    if len(active_characters) == 1:
+        # dla pojedynczej postaci nie ma czego współdzielić
+        nr, character = active_characters[0]
+        results[nr] = what_to_do(world, main_location, production_list, character=character, test_mode=test_mode)
+        return results
+
+    for prod in production_list:
+
+        # robocze usuwanie produkcji schematowych
+        if 'Comment' in prod and "Użyto „?”" in prod['Comment']:
+            continue
+
+        # część dopasowania niezależna od postaci
+        matches_OK, location_candidates = find_location_candidates(world, main_location, prod)
         if not matches_OK:
             continue
+        object_nodes = []
+        for location in prod['LSide']['Locations']:
+            object_nodes.extend(_single_object_nodes(location))
+        fitting_cache = {}
+
+        for nr, character in active_characters:
+            # węzeł podmiotu produkcji niepasujący do postaci wyklucza produkcję
+            if any(not fit_properties(node, character) for node in object_nodes):
+                continue
+            matches = [dict(location, w_nodes_list=copy(location['w_nodes_list'])) for location in location_candidates]
+            matches_OK, matches_to_verify_preconditions = match_location_candidates(prod, matches, character=character,
+                                                                                    test_mode=test_mode,
+                                                                                    fitting_cache=fitting_cache)
+            if not matches_OK:
+                continue
+            matched_prod = _matched_production(prod, matches_to_verify_preconditions)
+            if matched_prod is not None:
+                results[nr][1].append(matched_prod)
 
-        matched_prod = prod.copy()
-        matched_prod['Matches'] = matches_verified_with_preconditions
+    return results
 
-        all_matches.append(matched_prod)
 
-    return True, all_matches
+# skompilowane blokady produkcji: id listy blokad z hierarchii -> (lista blokad, predykaty)
+_blockade_predicates = {}
+# elementy blokad według węzłów LS dopasowanej produkcji: (id listy blokad, id LSide) -> (lista blokad, LSide,
+# id węzłów LS, słowniki id węzła LS -> numery elementów dla kolejnych blokad)
+_blockade_ls_nodes = {}
+
+
+def _compiled_blockades(blockades: list) -> list:
+    """
+    Compiles the blockades of the production (from check_hierarchy) into predicates.
+    :param blockades: list of blockades; a blockade is a list of pairs (LS node of the production, required
+    Name and Attributes of the matched world node)
+    :return: list of tuples (length of the blockade, list of tuples (LS node, name or None, attributes items
+    or None))
+    """
+    entry = _blockade_predicates.get(id(blockades))
+    if entry is not None and entry[0] is blockades:
+        return entry[1]
+    compiled = [(len(blockade), [(ls_node, keys.get("Name") or None,
+                                  tuple(keys["Attributes"].items()) if keys.get("Attributes") else None)
+                                 for ls_node, keys in blockade])
+                for blockade in blockades]
+    _blockade_predicates[id(blockades)] = (blockades, compiled)
+    return compiled
+
+
+def _blockades_elements(blockades: list, compiled: list, ls_side: dict, ls_nodes: dict) -> list:
+    """
+    Finds the elements of the blockades concerning the LS nodes of the matched production (the hierarchy is built
+    from other copies of productions, so the nodes are compared by content, once per production).
+    :param blockades: list of blockades from the hierarchy
+    :param compiled: the blockades compiled by _compiled_blockades
+    :param ls_side: LSide of the matched production
+    :param ls_nodes: dict id -> LS node of the nodes bound in the variants of the production
+    :return: for every blockade, dict: id of the LS node -> indexes of the elements of the blockade equal to it
+    """
+    key = (id(blockades), id(ls_side))
+    entry = _blockade_ls_nodes.get(key)
+    if entry is not None and entry[0] is blockades and entry[1] is ls_side and entry[2].issuperset(ls_nodes):
+        return entry[3]
+    elements = []
+    for _, b in compiled:
+        b_elements = {}
+        for i, (e1_node, _, _) in enumerate(b):
+            for ls_id, ls_node in ls_nodes.items():
+                if e1_node == ls_node:
+                    b_elements.setdefault(ls_id, []).append(i)
+        elements.append(b_elements)
+    if ls_side is not None:
+        _blockade_ls_nodes[key] = (blockades, ls_side, frozenset(ls_nodes), elements)
+    return elements
+
+
+def production_covers(hierarchy: dict, todos: list, mark_variants: bool = False) -> Tuple[List[str], List[set]]:
+    """
+    Labels the matched productions covered by more detailed productions (BLOKADA1 – the variant is blocked
+    by the blockade of the generic production, BLOKADA2 – a matched child production overrides the production).
+    :param hierarchy: production hierarchy (result of get_production_tree_new)
+    :param todos: matched productions (result of what_to_do)
+    :param mark_variants: if True, "BLOKADA1 " is appended to the blocked variants (as shown to the player)
+    :return: list of labels (in the order of todos) and list of sets of blocked variants indexes
+    """
+    todos_names = [x["Title"] for x in todos]
+    covers = []
+    blocked_variants = []
+    for todo in todos:
+        cover = ''
+        blocked = set()
+        blockades2 = hierarchy.get(todo['Title'], {}).get("children") or []
+        for ch in blockades2:
+            if ch in todos_names and hierarchy[ch]['prod']['Override'] == 2:
+                cover = 'BLOKADA2 '
+        blockades1 = hierarchy.get(todo['Title'], {}).get("blockades")
+
+        if todo['Title'] == "Teleportation / Teleportacja":  # ta produkcja blokowana jest zawsze, więc nie musimy sprawdzać
+            cover = 'BLOKADA1 '
+        elif blockades1:
+            # węzły LS dopasowanej produkcji (wszystkie warianty wiążą te same węzły)
+            ls_nodes = {id(e2[0]): e2[0] for v in todo['Matches'] for e2 in v if isinstance(e2, tuple)}
+            compiled = _compiled_blockades(blockades1)
+            blockades_elements = _blockades_elements(blockades1, compiled, todo.get('LSide'), ls_nodes)
+            for (b_len, b), elements in zip(compiled, blockades_elements):
+                for v_nr, v in enumerate(todo['Matches']):
+                    vb = 0
+                    m = [0] * len(b)
+                    for e2 in v:
+                        if not isinstance(e2, tuple):
+                            continue
+                        for i in elements.get(id(e2[0]), ()):
+                            e1_name, e1_attributes = b[i][1], b[i][2]
+                            if e1_name and e1_name == e2[1].get("Name"):
+                                m[i] += 1
+                            if e1_attributes and e2[1].get("Attributes"):
+                                w_attributes = e2[1]["Attributes"].items()
+                                if all(x in w_attributes for x in e1_attributes):
+                                    m[i] += 1
+                    for i in range(len(b)):
+                        if m[i] >= b_len:
+                            if mark_variants:
+                                v.append("BLOKADA1 ")
+                            blocked.add(v_nr)
+                            vb += 1
+                if vb == len(todo['Matches']):
+                    cover = 'BLOKADA1 '
+                elif vb:
+                    cover = 'CZĘŚCIOWA BLOKADA1 '
+        elif todo.get('TitleGeneric') and todo.get('Override') == 2:
+            try:
+                if 0 in blocked_variants[todos_names.index(todo['TitleGeneric'])]:
+                    cover = 'BLOKADA1 '
+            except (ValueError, IndexError):
+                pass
+        covers.append(cover)
+        blocked_variants.append(blocked)
+    return covers, blocked_variants
+
+
+def make_move_record(production: dict, variant: list, who: str, todos: list, nr: int, chosen_variant: int,
+                     modified_nodes: list, world: list) -> dict:
+    """
+    Builds the record of the move saved in the gameplay.
+    :param production: applied production
+    :param variant: applied variant
+    :param who: name of the character or "Action automatically performed"
+    :param todos: matched productions
+    :param nr: index of the applied production in todos
+    :param chosen_variant: index of the applied variant
+    :param modified_nodes: ids of the modified nodes (result of apply_instructions_to_world)
+    :param world: world after the move
+    :return: move dict
+    """
+    return {
+        "ProductionTitle": production["Title"],
+        "Object": who,
+        "LSMatching": dict_from_variant(variant),
+        "MatchedProductionListLength": len(todos),
+        "MatchedProductionIndex": nr,
+        "MatchedVariantListLength": len(todos[nr]['Matches']),
+        "MatchedVariantIndex": chosen_variant,
+        "ModifiedNodes": modified_nodes,
+        "ModifiedNodesNames": [ctypes.cast(x, ctypes.py_object).value.get("Name") for x in modified_nodes],
+        # "WorldBefore": world_before,
+        "WorldAfter": world_copy(world, deepcopy(world)),
+        "DateTimeMove": datetime.datetime.now().strftime("%Y%m%d%H%M%S"),
+    }
 
 
 def make_automatic_moves(gameplay, world, loc, productions_to_match, decision_nr, visualise = True):
@@ -829,22 +1145,8 @@ def make_automatic_moves(gameplay, world, loc, productions_to_match, decision_nr
 
         draw_graph(world, d_title, d_desc, d_file, d_dir)
 
-    world_after = world_copy(world, deepcopy(world))
-
-    gameplay['Moves'].append({
-        "ProductionTitle": prod["Title"],
-        "Object": "Action automatically performed",
-        "LSMatching": dict_from_variant(variant),
-        "MatchedProductionListLength": len(todos),
-        "MatchedProductionIndex": nr,
-        "MatchedVariantListLength": len(todos[nr]['Matches']),
-        "MatchedVariantIndex": chosen_variant,
-        "ModifiedNodes": red_nodes_new,
-        "ModifiedNodesNames": [ctypes.cast(x, ctypes.py_object).value.get("Name") for x in red_nodes_new],
-        # "WorldBefore": world_before,
-        "WorldAfter": world_after,
-        "DateTimeMove": datetime.datetime.now().strftime("%Y%m%d%H%M%S"),
-    } )
+    record_move(gameplay, make_move_record(prod, variant, "Action automatically performed", todos, nr, chosen_variant,
+                                           red_nodes_new, world))
 
     return red_nodes
 
@@ -890,7 +1192,7 @@ def character_turn(gameplay, world, world_source, main_location, productions_to_
     else:
         char_text = ''
 
-    print(f"\n#### Co może zrobić {char_text}{character.get('Name') if type(character) == dict else 'dowolna postać'}:")
+    print(f"\n#### Co może zrobić {char_text}{character.get('Name') if is_node(character) else 'dowolna postać'}:")
 
     # znajdowanie dopasowań LS
     productions_matched, todos = what_to_do(world, main_location, productions_to_match, character=character)
@@ -901,7 +1203,8 @@ def character_turn(gameplay, world, world_source, main_location, productions_to_
         print(f"Z {len(productions_to_match)} produkcji udało się dopasować {len(todos)}. ")
 
 
-    todos_names = [x["Title"] for x in todos]
+    # oznaczanie produkcji (i wariantów) przykrytych przez produkcje szczegółowe
+    covers, blocked_variants = production_covers(gameplay["ProductionHierarchy"], todos, mark_variants=True)
 
     # generowanie podsumowania znalezionych dopasowań
     offset = 0
@@ -909,45 +1212,7 @@ def character_turn(gameplay, world, world_source, main_location, productions_to_
         if len(todos) > nr - offset and productions_to_match[nr]['Title'] == todos[nr - offset]['Title']:
             warning_text = ''  # TODO kiedyś będziemy ostrzegać, czy produkcja nie jest zablokowana przez szczegółową
             all_prod_number_text = f"{nr:02d}/" if test_mode else ''
-            cover = ''
-            blockades2 = gameplay["ProductionHierarchy"][productions_to_match[nr]['Title']].get("children")
-            for ch in blockades2:
-                if ch in todos_names and gameplay["ProductionHierarchy"][ch]['prod']['Override'] == 2:
-                    cover = 'BLOKADA2 '
-            blockades1 = gameplay["ProductionHierarchy"][productions_to_match[nr]['Title']].get("blockades")
-
-
-            if productions_to_match[nr]['Title'] == "Teleportation / Teleportacja": # ta produkcja blokowana jest zawsze, więc nie musimy sprawdzać
-                cover = 'BLOKADA1 '
-            elif blockades1:
-                for b in blockades1:
-                    for v in todos[nr - offset]['Matches']:
-                        vb = 0
-                        for e1 in b:
-                            m = 0
-                            for e2 in v:
-                                if e1[0] == e2[0]:
-                                    if e1[1].get("Name"):
-                                        if e1[1].get("Name") == e2[1].get("Name"):
-                                            m += 1
-                                    if e1[1].get("Attributes") and e2[1].get("Attributes"):
-                                        if all(x in e2[1]["Attributes"].items() for x in e1[1]["Attributes"].items()):
-                                            m += 1
-                            if m >= len(b):
-                                v.append("BLOKADA1 ")
-                                vb += 1
-                    if vb == len(todos[nr - offset]['Matches']):
-                        cover = 'BLOKADA1 '
-                    elif vb:
-                        cover = 'CZĘŚCIOWA BLOKADA1 '
-            elif todos[nr - offset].get('TitleGeneric') and  todos[nr - offset].get('Override') == 2:
-                try:
-                    if todos[todos_names.index(todos[nr - offset]['TitleGeneric'])]['Matches'][0][-1] == "BLOKADA1 ":
-                        cover = 'BLOKADA1 '
-                except ValueError:
-                    pass
-
-
+            cover = covers[nr - offset]
 
             print(f"{all_prod_number_text}{nr - offset:02d}. {cover}{warning_text}{productions_to_match[nr]['Title'].split(' / ')[0]} – ", end="")
             print(f"{len(todos[nr - offset]['Matches'])} wariantów", end="")
@@ -1100,21 +1365,8 @@ def character_turn(gameplay, world, world_source, main_location, productions_to_
         d_file = f'{decision_nr:03d}c_world_between_moves'
         draw_graph(world, d_title, d_desc, d_file, d_dir)
 
-    world_after = world_copy(world, deepcopy(world))
-    gameplay['Moves'].append({
-        "ProductionTitle": production["Title"],
-        "Object": character.get("Name"),
-        "LSMatching": dict_from_variant(variant),
-        "MatchedProductionListLength": len(todos),
-        "MatchedProductionIndex": nr,
-        "MatchedVariantListLength": len(todos[nr]['Matches']),
-        "MatchedVariantIndex": chosen_variant,
-        "ModifiedNodes": red_nodes_new,
-        "ModifiedNodesNames": [ctypes.cast(x, ctypes.py_object).value.get("Name") for x in red_nodes_new],
-        # "WorldBefore": world_before,
-        "WorldAfter": world_after,
-        "DateTimeMove": datetime.datetime.now().strftime("%Y%m%d%H%M%S"),
-    } )
+    record_move(gameplay, make_move_record(production, variant, character.get("Name"), todos, nr, chosen_variant,
+                                           red_nodes_new, world))
 
     return red_nodes
 
@@ -1307,7 +1559,181 @@ def check_hierarchy(parent, child, character = None) -> Tuple[str, list]:
     # return 'OK' if instr_OK else LS_OK else 'No LS matches'
 
 
-def get_production_tree_new(*json_sources):
+# katalog wyników check_hierarchy (pliki nazwane skrótami zawartości produkcji rodzica i dziecka)
+HIERARCHY_CACHE_DIR = 'hierarchy_cache'
+# wersja zapisu wyników; zmiana check_hierarchy lub compare_instructions wymaga jej zwiększenia
+HIERARCHY_CACHE_VERSION = 1
+
+
+def _production_key_value(value):
+    # docelowe lokacje połączeń (węzły po destinations_change_to_nodes) zastępujemy ich identyfikatorami
+    if is_node(value):
+        return {k: [{ck: (cv.get('Id', cv.get('Name')) if ck == 'Destination' and is_node(cv)
+                          else _production_key_value(cv)) for ck, cv in connection.items()} for connection in v]
+                if k == 'Connections' and isinstance(v, list) else _production_key_value(v)
+                for k, v in value.items()}
+    if isinstance(value, list):
+        return [_production_key_value(x) for x in value]
+    return value
+
+
+def production_hash(production: dict) -> str:
+    """
+    Content hash of the production, the same before and after destinations_change_to_nodes.
+    :param production: production
+    :return: hex digest
+    """
+    return hashlib.sha1(json.dumps(_production_key_value(production), sort_keys=True, ensure_ascii=False)
+                        .encode('utf8')).hexdigest()
+
+
+def _ls_nodes_paths(production: dict) -> dict:
+    """
+    :param production: production
+    :return: dict id of the LS node -> (node, path: list of pairs (layer, index) from LSide)
+    """
+    paths = {}
+
+    def walk(node, path):
+        paths[id(node)] = (node, path)
+        for layer in ('Characters', 'Items', 'Narration'):
+            for nr, child in enumerate(node.get(layer) or []):
+                walk(child, path + [[layer, nr]])
+
+    for nr, location in enumerate(production['LSide'].get('Locations') or []):
+        walk(location, [['Locations', nr]])
+    return paths
+
+
+def _ls_node_by_path(production: dict, path: list) -> Union[dict, None]:
+    node = production['LSide']
+    try:
+        for layer, nr in path:
+            node = node[layer][nr]
+    except (KeyError, IndexError, TypeError):
+        return None
+    return node
+
+
+def _hierarchy_result_to_json(parent: dict, status: str, blockades: list) -> Union[dict, None]:
+    """
+    :param parent: generic production
+    :param status: status returned by check_hierarchy
+    :param blockades: blockades returned by check_hierarchy (pairs with the LS nodes of the parent)
+    :return: json form of the result (LS nodes as paths in the LSide of the parent) or None if a node of
+    the blockades is not in the parent
+    """
+    paths = _ls_nodes_paths(parent)
+    if not all(id(ls_node) in paths for blockade in blockades for ls_node, keys in blockade):
+        return None
+    return {"Version": HIERARCHY_CACHE_VERSION, "Status": status,
+            "Blockades": [[{"Path": paths[id(ls_node)][1], "Keys": keys} for ls_node, keys in blockade]
+                          for blockade in blockades]}
+
+
+def _hierarchy_result_from_json(parent: dict, result: dict) -> Union[Tuple[str, list], None]:
+    """
+    :param parent: generic production
+    :param result: json form of the result of check_hierarchy
+    :return: status and blockades (with the LS nodes of the parent) or None if the result does not fit the parent
+    """
+    if not result or result.get("Version") != HIERARCHY_CACHE_VERSION:
+        return None
+    blockades = []
+    for result_blockade in result["Blockades"]:
+        blockade = [(_ls_node_by_path(parent, element["Path"]), element["Keys"]) for element in result_blockade]
+        if any(ls_node is None for ls_node, keys in blockade):
+            return None
+        blockades.append(blockade)
+    return result["Status"], blockades
+
+
+def _check_hierarchy_json(pair: tuple) -> Union[dict, None]:
+    # wykonywane w procesie potomnym: węzły LS rodzica wracają jako ścieżki, bo proces główny ma własne kopie
+    parent, child = pair
+    status, blockades = check_hierarchy(parent, child)
+    return _hierarchy_result_to_json(parent, status, blockades)
+
+
+def check_hierarchies(pairs: List[Tuple[dict, dict]], cache_dir: str = None, processes: int = 1,
+                      hashes: dict = None) -> List[Tuple[str, list]]:
+    """
+    Runs check_hierarchy for many pairs of productions, using the results stored on disk under the content
+    hashes of both productions and (optionally) a pool of processes for the remaining pairs.
+    :param pairs: list of pairs (generic production, production refining it)
+    :param cache_dir: directory of the cache (None – no cache)
+    :param processes: number of processes (1 – without additional processes, None – number of processors)
+    :param hashes: dict id of the production -> its hash, filled in (to hash every production once)
+    :return: results of check_hierarchy in the order of pairs (the blockades refer to the LS nodes of the parents)
+    """
+    if hashes is None:
+        hashes = {}
+    results = [None] * len(pairs)
+    cache_paths = [None] * len(pairs)
+    if cache_dir is not None:
+        for nr, (parent, child) in enumerate(pairs):
+            for production in (parent, child):
+                if id(production) not in hashes:
+                    hashes[id(production)] = production_hash(production)
+            cache_paths[nr] = os.path.join(cache_dir, f'{hashes[id(parent)]}_{hashes[id(child)]}.json')
+            try:
+                with open(cache_paths[nr], encoding='utf8') as cache_file:
+                    results[nr] = _hierarchy_result_from_json(parent, json.load(cache_file))
+            except (OSError, ValueError):
+                pass
+            if results[nr] is not None:
+                # check_hierarchy przygotowuje obie produkcje do dopasowania – zachowujemy ten efekt
+                destinations_change_to_nodes(parent["LSide"]["Locations"])
+                destinations_change_to_nodes(child["LSide"]["Locations"])
+
+    missing = [nr for nr, result in enumerate(results) if result is None]
+    results_json = {}
+    if processes != 1 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            for nr, result_json in zip(missing, executor.map(_check_hierarchy_json, [pairs[nr] for nr in missing])):
+                results[nr] = _hierarchy_result_from_json(pairs[nr][0], result_json)
+                results_json[nr] = result_json
+    for nr in missing:
+        parent, child = pairs[nr]
+        if results[nr] is None:
+            # sprawdzenie w procesie głównym zmienia też produkcje tak jak check_hierarchy
+            results[nr] = check_hierarchy(parent, child)
+            results_json[nr] = _hierarchy_result_to_json(parent, *results[nr])
+        else:
+            destinations_change_to_nodes(parent["LSide"]["Locations"])
+            destinations_change_to_nodes(child["LSide"]["Locations"])
+        if cache_paths[nr] is not None and results_json[nr] is not None:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                temporary_path = f'{cache_paths[nr]}.{os.getpid()}.tmp'
+                with open(temporary_path, 'w', encoding='utf8') as cache_file:
+                    json.dump(results_json[nr], cache_file, ensure_ascii=False)
+                os.replace(temporary_path, cache_paths[nr])
+            except (OSError, TypeError, ValueError):
+                pass
+    return results
+
+
+def check_hierarchy_cached(parent: dict, child: dict, cache_dir: str = None, hashes: dict = None) -> Tuple[str, list]:
+    """
+    check_hierarchy with the results stored on disk under the content hashes of both productions.
+    :param parent: generic production
+    :param child: production refining the parent
+    :param cache_dir: directory of the cache (None – check_hierarchy without the cache)
+    :param hashes: dict id of the production -> its hash, filled in (to hash every production once)
+    :return: the same as check_hierarchy (the blockades refer to the LS nodes of the parent)
+    """
+    return check_hierarchies([(parent, child)], cache_dir, hashes=hashes)[0]
+
+
+def _link_productions(*json_sources):
+    """
+    Links the productions with their parents, without checking them (first part of get_production_tree_new).
+    :param json_sources: dicts with keys 'file_path' and 'json' of production files
+    :return: tuple (hierarchy dict, root generic productions titles, missing generic productions titles,
+    hierarchy entries of the productions to check against their parents); False if two different productions
+    have the same title
+    """
     parents_set = set()
     root_missing = []
     root_generics = []
@@ -1317,7 +1743,7 @@ def get_production_tree_new(*json_sources):
     for json_given in json_sources:
         # wykluczamy światy
         if len(json_given["json"]) == 1 and not json_given["json"][0].get("Instructions"):
-            return {}, [], []
+            return {}, [], [], []
 
         for production in json_given["json"]:
             if production["Title"] in production_dict:
@@ -1342,6 +1768,7 @@ def get_production_tree_new(*json_sources):
             root_missing.append(g)
 
     # uzupełnianie powiązań
+    checked = []
     for p, v in production_dict.items():
         if v["prod"]["TitleGeneric"] in root_missing:
             v["parent"] = 'missing'
@@ -1350,14 +1777,179 @@ def get_production_tree_new(*json_sources):
         else:
             v["parent"] = v["prod"]["TitleGeneric"]
             production_dict[v["parent"]]["children"].append(v["prod"]["Title"])
-            # print(f'### {v["file_path"]}')
-            hierarchy_res, blockades = check_hierarchy(production_dict[v["parent"]]["prod"], v["prod"])
-            # v["blockades"] = blockades
-            if not production_dict[v["parent"]].get("blockades"):
-                production_dict[v["parent"]]["blockades"] = []
-            production_dict[v["parent"]]["blockades"].extend(blockades)
-            if hierarchy_res != 'OK':
-                v["hierarchy_mismatch"] = hierarchy_res
+            checked.append(v)
+    return production_dict, root_generics, root_missing, checked
+
+
+def _apply_hierarchy_results(production_dict: dict, checked: list, results: list):
+    """
+    Adds the results of check_hierarchy to the hierarchy (second part of get_production_tree_new).
+    :param production_dict: hierarchy dict
+    :param checked: hierarchy entries of the checked productions
+    :param results: results of check_hierarchy for the productions and their parents (in the order of checked)
+    """
+    for v, (hierarchy_res, blockades) in zip(checked, results):
+        # print(f'### {v["file_path"]}')
+        # v["blockades"] = blockades
+        if not production_dict[v["parent"]].get("blockades"):
+            production_dict[v["parent"]]["blockades"] = []
+        production_dict[v["parent"]]["blockades"].extend(blockades)
+        if hierarchy_res != 'OK':
+            v["hierarchy_mismatch"] = hierarchy_res
+
+
+def get_production_tree_new(*json_sources, cache_dir: str = None, processes: int = 1):
+    """
+    Builds the hierarchy of productions (generic productions and the productions refining them).
+    :param json_sources: dicts with keys 'file_path' and 'json' of production files
+    :param cache_dir: directory of the cache of check_hierarchy results (None – no cache)
+    :param processes: number of processes checking the productions against their parents (1 – without
+    additional processes, None – number of processors)
+    :return: tuple (hierarchy dict, root generic productions titles, missing generic productions titles);
+    False if two different productions have the same title
+    """
+    linked = _link_productions(*json_sources)
+    if linked is False:
+        return False
+    production_dict, root_generics, root_missing, checked = linked
 
+    # porównania z rodzicami są niezależne; wyniki scalamy w kolejności produkcji
+    results = check_hierarchies([(production_dict[v["parent"]]["prod"], v["prod"]) for v in checked],
+                                cache_dir, processes)
+    _apply_hierarchy_results(production_dict, checked, results)
 
-    return production_dict, root_generics, root_missing
\ No newline at end of file
+    return production_dict, root_generics, root_missing
+
+
+class ProductionHierarchy:
+    """
+    Production hierarchy (as built by get_production_tree_new) kept up to date while production files or single
+    productions are added, replaced or removed. Only the pairs parent/child with a changed production are checked
+    again by check_hierarchy; hierarchy, root_generics and root_missing are updated in place, so the sessions
+    using them see the new productions. Changed productions have to be given as new objects (not changed in place).
+    """
+
+    def __init__(self, *json_sources, cache_dir: str = None, processes: int = 1):
+        """
+        :param json_sources: dicts with keys 'file_path' and 'json' of production files
+        :param cache_dir: directory of the cache of check_hierarchy results (None – no cache)
+        :param processes: number of processes checking the productions against their parents
+        """
+        self.sources = []
+        self.hierarchy = {}
+        self.root_generics = []
+        self.root_missing = []
+        self.cache_dir = cache_dir
+        self.processes = processes
+        # liczba par sprawdzonych przez check_hierarchy w ostatniej aktualizacji
+        self.checked = 0
+        # (skrót rodzica, skrót dziecka) -> wynik check_hierarchy (węzły LS rodzica jako ścieżki)
+        self._results = {}
+        # id produkcji -> (produkcja, skrót zawartości)
+        self._hashes = {}
+        self.ok = self._update(list(json_sources))
+
+    def _hash(self, production: dict) -> str:
+        entry = self._hashes.get(id(production))
+        if entry is None or entry[0] is not production:
+            entry = (production, production_hash(production))
+            self._hashes[id(production)] = entry
+        return entry[1]
+
+    def _update(self, sources: list) -> bool:
+        """
+        Builds the hierarchy of the sources, reusing the results of unchanged pairs parent/child.
+        :param sources: new list of production files
+        :return: False (and the hierarchy unchanged) if two different productions have the same title
+        """
+        linked = _link_productions(*sources)
+        if linked is False:
+            return False
+        production_dict, root_generics, root_missing, checked = linked
+
+        pairs = [(production_dict[v["parent"]]["prod"], v["prod"]) for v in checked]
+        keys = [(self._hash(parent), self._hash(child)) for parent, child in pairs]
+        results = [_hierarchy_result_from_json(parent, self._results.get(key))
+                   for (parent, child), key in zip(pairs, keys)]
+        for (parent, child), result in zip(pairs, results):
+            if result is not None:
+                # check_hierarchy przygotowuje obie produkcje do dopasowania – zachowujemy ten efekt
+                destinations_change_to_nodes(parent["LSide"]["Locations"])
+                destinations_change_to_nodes(child["LSide"]["Locations"])
+        missing = [nr for nr, result in enumerate(results) if result is None]
+        hashes = {production_id: entry[1] for production_id, entry in self._hashes.items()}
+        for nr, result in zip(missing, check_hierarchies([pairs[nr] for nr in missing], self.cache_dir,
+                                                         self.processes, hashes)):
+            results[nr] = result
+        _apply_hierarchy_results(production_dict, checked, results)
+
+        # pamiętamy tylko wyniki par i skróty produkcji obecnych w hierarchii
+        results_json = {}
+        for (parent, child), key, result in zip(pairs, keys, results):
+            results_json[key] = self._results.get(key) or _hierarchy_result_to_json(parent, *result)
+        self._results = {key: result_json for key, result_json in results_json.items() if result_json is not None}
+        self._hashes = {id(v["prod"]): self._hashes[id(v["prod"])] for v in production_dict.values()
+                        if id(v["prod"]) in self._hashes}
+        self.checked = len(missing)
+
+        self.sources = sources
+        self.hierarchy.clear()
+        self.hierarchy.update(production_dict)
+        self.root_generics[:] = root_generics
+        self.root_missing[:] = root_missing
+        return True
+
+    def set_source(self, json_source: dict) -> bool:
+        """
+        Adds the production file or replaces the file with the same path (in its place in the order of files).
+        :param json_source: dict with keys 'file_path' and 'json'
+        :return: False if the hierarchy could not be built (it stays unchanged)
+        """
+        sources = list(self.sources)
+        for nr, source in enumerate(sources):
+            if source['file_path'] == json_source['file_path']:
+                sources[nr] = json_source
+                break
+        else:
+            sources.append(json_source)
+        return self._update(sources)
+
+    def remove_source(self, file_path: str) -> bool:
+        """
+        :param file_path: path of the removed production file
+        :return: False if the hierarchy could not be built (it stays unchanged)
+        """
+        return self._update([source for source in self.sources if source['file_path'] != file_path])
+
+    def set_production(self, production: dict, file_path: str = None) -> bool:
+        """
+        Replaces the production with the same title (in every file containing it) or adds it to the file.
+        :param production: new production
+        :param file_path: file of the added production (the last file by default)
+        :return: False if the hierarchy could not be built (it stays unchanged)
+        """
+        sources = []
+        replaced = False
+        for source in self.sources:
+            if any(x["Title"] == production["Title"] for x in source['json']):
+                replaced = True
+                source = dict(source, json=[production if x["Title"] == production["Title"] else x
+                                            for x in source['json']])
+            sources.append(source)
+        if not replaced:
+            nr = next((nr for nr, source in enumerate(sources) if source['file_path'] == file_path), None)
+            if nr is None and (file_path is not None or not sources):
+                sources.append({'file_path': file_path, 'json': []})
+                nr = len(sources) - 1
+            elif nr is None:
+                nr = len(sources) - 1
+            sources[nr] = dict(sources[nr], json=[*sources[nr]['json'], production])
+        return self._update(sources)
+
+    def remove_production(self, title: str) -> bool:
+        """
+        :param title: title of the removed production
+        :return: False if the hierarchy could not be built (it stays unchanged)
+        """
+        return self._update([dict(source, json=[x for x in source['json'] if x["Title"] != title])
+                             for source in self.sources])
@@ -0,0 +1,191 @@
+import contextlib
+import io
+import random
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from typing import Union
+
+from library.tools import destinations_change_to_nodes, breadcrumb_pointer
+from library.tools_session import GameSession, compile_session_sources
+
+# wyniki pojedynczej gry
+OUTCOME_WINNER = 'winner'
+OUTCOME_DEATH = 'death'
+OUTCOME_BUDGET = 'budget'
+OUTCOME_STUCK = 'stuck'
+OUTCOME_EXCEPTION = 'exception'
+
+# dane wspólne dla wszystkich gier w procesie (ustawiane raz w każdym procesie)
+_game_sources = {}
+
+
+def _init_game_sources(world_source: dict, chars_turn_sources: list, world_turn_sources: list):
+    """
+    Compiles the productions once per process.
+    :param world_source: dict with keys 'file_path' and 'json' of the world
+    :param chars_turn_sources: list of dicts with keys 'file_path' and 'json' of productions for characters
+    :param world_turn_sources: list of dicts with keys 'file_path' and 'json' of automatic productions
+    """
+    productions_chars_turn, productions_world_turn, hierarchy = compile_session_sources(chars_turn_sources,
+                                                                                        world_turn_sources)
+    _game_sources.update(world_json=world_source['json'], productions_chars_turn=productions_chars_turn,
+                         productions_world_turn=productions_world_turn, hierarchy=hierarchy)
+
+
+def _choose(rng: random.Random, options: list, weights: dict, avoid_blocked: bool) -> Union[tuple, None]:
+    """
+    Chooses the option and its variant, weighted by production titles.
+    :return: pair (option, variant index) or None if there is nothing to choose
+    """
+    if avoid_blocked:
+        options = [option for option in options if option['Cover'] not in ('BLOKADA1 ', 'BLOKADA2 ')]
+    if not options:
+        return None
+    option_weights = [weights.get(option['Title'], 1) for option in options] if weights else None
+    if option_weights is not None and not any(option_weights):
+        return None
+    option = rng.choices(options, weights=option_weights)[0]
+    variants = range(len(option['Variants']))
+    if avoid_blocked:
+        variants = [nr for nr in variants if nr not in option['BlockedVariants']] or list(variants)
+    return option, rng.choice(list(variants))
+
+
+def play_random_game(seed: int, hero_name: str, max_moves: int = 200, weights: dict = None,
+                     npc_move_probability: float = 0.5, avoid_blocked: bool = False,
+                     automatic_moves_limit: int = 50) -> dict:
+    """
+    Plays one game with random choices for the hero and the NPCs, with the same turn order as the interactive
+    gameplay (hero, world turn, then NPCs one by one, each followed by the world turn).
+    :param seed: seed of the random generator (the game is reproducible)
+    :param hero_name: name of the main character
+    :param max_moves: budget of moves (moves of characters and automatic moves)
+    :param weights: weights of productions by title (1 for productions not given, 0 – never chosen)
+    :param npc_move_probability: probability that an NPC makes a move in its turn
+    :param avoid_blocked: do not choose productions and variants labelled BLOKADA1/BLOKADA2
+    :param automatic_moves_limit: maximal number of automatic moves in one location after a move
+    :return: dict with keys Seed, Outcome, Moves, Productions (titles counter), Exception
+    """
+    rng = random.Random(seed)
+    result = {"Seed": seed, "Outcome": OUTCOME_BUDGET, "Moves": 0, "Productions": Counter(), "Exception": None}
+    last_title = None
+    try:
+        world_json = deepcopy(_game_sources['world_json'])
+        world = world_json[0]["LSide"]["Locations"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            destinations_change_to_nodes(world, world=True)
+        hero_paths = breadcrumb_pointer(world, name_or_id=hero_name, layer="Characters")
+        if len(hero_paths) != 1:
+            raise ValueError(f'Niejednoznaczne wskazanie postaci {hero_name} w świecie.')
+        session = GameSession(world, _game_sources['productions_chars_turn'],
+                              _game_sources['productions_world_turn'], _game_sources['hierarchy'],
+                              main_character=hero_paths[0][-1])
+
+        def move(choice) -> bool:
+            nonlocal last_title
+            option, variant_nr = choice
+            last_title = option['Title']
+            session.apply(option, variant_nr)
+            result["Productions"][option['Title']] += 1
+            result["Moves"] += 1
+            for automatic in session.world_turn(limit=automatic_moves_limit):
+                last_title = automatic['Title']
+                result["Productions"][automatic['Title']] += 1
+                result["Moves"] += 1
+            return session.main_character_status() in ('winner', 'missing') or result["Moves"] >= max_moves
+
+        finished = False
+        while not finished:
+            moved = False
+            if session.main_character_status() == 'active':
+                choice = _choose(rng, session.options(), weights, avoid_blocked)
+                if choice:
+                    moved = True
+                    finished = move(choice)
+            for location, character in ([] if finished else session.npcs()):
+                # postać mogła zginąć w jednym z wcześniejszych ruchów
+                if character not in location.get('Characters', []) or rng.random() >= npc_move_probability:
+                    continue
+                choice = _choose(rng, session.options(character), weights, avoid_blocked)
+                if choice:
+                    moved = True
+                    finished = move(choice)
+                    if finished:
+                        break
+            if not moved:
+                result["Outcome"] = OUTCOME_STUCK
+                break
+
+        status = session.main_character_status()
+        if status == 'winner':
+            result["Outcome"] = OUTCOME_WINNER
+        elif status == 'missing':
+            result["Outcome"] = OUTCOME_DEATH
+    except Exception:
+        result["Outcome"] = OUTCOME_EXCEPTION
+        result["Exception"] = {"Production": last_title, "Traceback": traceback.format_exc()}
+    return result
+
+
+def _play_random_game_args(args) -> dict:
+    return play_random_game(*args)
+
+
+def run_monte_carlo(world_source: dict, chars_turn_sources: list, world_turn_sources: list, hero_name: str,
+                    games: int = 100, processes: int = None, seed: int = 0, max_moves: int = 200,
+                    weights: dict = None, npc_move_probability: float = 0.5, avoid_blocked: bool = False) -> dict:
+    """
+    Plays many random games of the quest in a pool of processes and summarises them.
+    :param world_source: dict with keys 'file_path' and 'json' of the world
+    :param chars_turn_sources: productions for characters (as in get_jsons_storygraph_validated result)
+    :param world_turn_sources: automatic productions (as in get_jsons_storygraph_validated result)
+    :param hero_name: name of the main character
+    :param games: number of games
+    :param processes: number of processes (None – number of processors, 1 – without additional processes)
+    :param seed: seed of the first game (next games get next seeds)
+    :param max_moves: budget of moves in a game
+    :param weights: weights of productions by title
+    :param npc_move_probability: probability that an NPC makes a move in its turn
+    :param avoid_blocked: do not choose productions labelled BLOKADA1/BLOKADA2
+    :return: report dict
+    """
+    start = time.time()
+    tasks = [(seed + nr, hero_name, max_moves, weights, npc_move_probability, avoid_blocked) for nr in range(games)]
+    if processes == 1:
+        _init_game_sources(world_source, chars_turn_sources, world_turn_sources)
+        results = [_play_random_game_args(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_game_sources,
+                                 initargs=(world_source, chars_turn_sources, world_turn_sources)) as executor:
+            results = list(executor.map(_play_random_game_args, tasks, chunksize=max(1, games // 64)))
+    seconds = time.time() - start
+
+    productions = Counter()
+    for result in results:
+        productions.update(result["Productions"])
+    outcomes = Counter(result["Outcome"] for result in results)
+    return {
+        "Games": games,
+        "Seconds": round(seconds, 3),
+        "GamesPerSecond": round(games / seconds, 2) if seconds else None,
+        "Outcomes": dict(outcomes),
+        "WinRate": outcomes[OUTCOME_WINNER] / games if games else 0,
+        "AverageLength": sum(result["Moves"] for result in results) / games if games else 0,
+        "ProductionFrequencies": dict(productions.most_common()),
+        "Exceptions": [{"Seed": result["Seed"], **result["Exception"]} for result in results if result["Exception"]],
+    }
+
+
+def print_monte_carlo_report(report: dict):
+    print(f'Rozegrano {report["Games"]} gier w {report["Seconds"]} s ({report["GamesPerSecond"]} gier/s).')
+    print(f'Wygrane: {report["WinRate"]:.1%}, średnia długość gry: {report["AverageLength"]:.1f} ruchów.')
+    print('Wyniki gier: ' + ', '.join(f'{k} – {v}' for k, v in report["Outcomes"].items()))
+    print('Najczęściej wykonywane produkcje:')
+    for title, count in list(report["ProductionFrequencies"].items())[:20]:
+        print(f'{count:8d}  {title.split(" / ")[0]}')
+    for exception in report["Exceptions"]:
+        print(f'Wyjątek w grze {exception["Seed"]} (produkcja {exception["Production"]}):')
+        print(exception["Traceback"])
@@ -0,0 +1,309 @@
+from collections.abc import MutableMapping
+from typing import List, Union
+
+from library.tools import register_node_type, is_node
+
+
+class SymbolTable:
+    """
+    Table of interned strings. Every name and attribute key is stored once and represented by an integer symbol.
+    """
+    __slots__ = ('strings', 'symbols')
+
+    def __init__(self):
+        self.strings = []
+        self.symbols = {}
+
+    def symbol(self, string: str) -> int:
+        symbol = self.symbols.get(string)
+        if symbol is None:
+            symbol = len(self.strings)
+            self.strings.append(string)
+            self.symbols[string] = symbol
+        return symbol
+
+    def lookup(self, string: str) -> int:
+        # nie dodaje napisu do tablicy; -1 oznacza, że takiego napisu nie ma w żadnym węźle
+        return self.symbols.get(string, -1)
+
+    def __getitem__(self, symbol: int) -> str:
+        return self.strings[symbol]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+# wspólna tablica symboli, dzięki czemu symbole są porównywalne między światami
+SYMBOLS = SymbolTable()
+
+# warstwy dzieci węzła
+NODE_LAYERS = ('Characters', 'Items', 'Narration')
+# kolejność kluczy węzła (taka sama jak po save_world i world_copy)
+SLOT_KEYS = ('Id', 'Name', 'IsObject', 'Attributes', 'Characters', 'Items', 'Narration', 'Connections')
+_SLOT_NAMES = {'Id': '_id', 'Name': '_name', 'IsObject': '_is_object', 'Attributes': '_attributes',
+               'Characters': '_characters', 'Items': '_items', 'Narration': '_narration', 'Connections': '_connections'}
+# pusta warstwa obecna w węźle; lista tworzona jest dopiero przy pierwszym odczycie
+_EMPTY_LAYER = ()
+_MISSING = object()
+
+
+class AttributesView(MutableMapping):
+    """
+    Dict-like attributes of the SlotNode. Attributes are stored as a flat tuple
+    (symbol, value, symbol, value, ...).
+    """
+    __slots__ = ('_flat',)
+
+    def __init__(self, flat: tuple = ()):
+        self._flat = flat
+
+    def _index(self, key) -> int:
+        symbol = SYMBOLS.lookup(key)
+        attributes = self._flat
+        for nr in range(0, len(attributes), 2):
+            if attributes[nr] == symbol:
+                return nr
+        return -1
+
+    def __getitem__(self, key):
+        nr = self._index(key)
+        if nr < 0:
+            raise KeyError(key)
+        return self._flat[nr + 1]
+
+    def __setitem__(self, key, value):
+        nr = self._index(key)
+        attributes = self._flat
+        if nr < 0:
+            self._flat = attributes + (SYMBOLS.symbol(key), value)
+        else:
+            self._flat = attributes[:nr + 1] + (value,) + attributes[nr + 2:]
+
+    def __delitem__(self, key):
+        nr = self._index(key)
+        if nr < 0:
+            raise KeyError(key)
+        attributes = self._flat
+        self._flat = attributes[:nr] + attributes[nr + 2:]
+
+    def __iter__(self):
+        attributes = self._flat
+        for nr in range(0, len(attributes), 2):
+            yield SYMBOLS[attributes[nr]]
+
+    def __len__(self):
+        return len(self._flat) // 2
+
+    def __contains__(self, key):
+        return self._index(key) >= 0
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class SlotNode(MutableMapping):
+    """
+    World node with __slots__ instead of the dict. Name is stored as the symbol of the SYMBOLS table
+    and attributes as the flat tuple of symbols and values (AttributesView). The node supports the same
+    access interface as the dict node (get, [], in, items, del), so the matcher, the operations and
+    the renderer work with both.
+    """
+    __slots__ = ('_id', '_name', '_is_object', '_attributes', '_characters', '_items', '_narration',
+                 '_connections', '_extra')
+
+    def __init__(self, source: dict = None):
+        if source:
+            for key, value in source.items():
+                self[key] = value
+
+    def __getitem__(self, key):
+        slot = _SLOT_NAMES.get(key)
+        if slot is None:
+            extra = getattr(self, '_extra', None)
+            if extra is None or key not in extra:
+                raise KeyError(key)
+            return extra[key]
+        value = getattr(self, slot, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        if slot == '_name':
+            return SYMBOLS[value]
+        if value is _EMPTY_LAYER:
+            value = []
+            setattr(self, slot, value)
+        return value
+
+    def __setitem__(self, key, value):
+        slot = _SLOT_NAMES.get(key)
+        if slot is None:
+            extra = getattr(self, '_extra', None)
+            if extra is None:
+                extra = self._extra = {}
+            extra[key] = value
+        elif slot == '_name':
+            self._name = SYMBOLS.symbol(value)
+        elif slot == '_attributes':
+            if isinstance(value, AttributesView):
+                self._attributes = value
+            else:
+                attributes = ()
+                for attr_name, attr_value in value.items():
+                    attributes += (SYMBOLS.symbol(attr_name), attr_value)
+                self._attributes = AttributesView(attributes)
+        elif key in NODE_LAYERS and isinstance(value, list) and not value:
+            setattr(self, slot, _EMPTY_LAYER)
+        else:
+            setattr(self, slot, value)
+
+    def __delitem__(self, key):
+        slot = _SLOT_NAMES.get(key)
+        if slot is None:
+            extra = getattr(self, '_extra', None)
+            if extra is None or key not in extra:
+                raise KeyError(key)
+            del extra[key]
+            if not extra:
+                del self._extra
+            return
+        if getattr(self, slot, _MISSING) is _MISSING:
+            raise KeyError(key)
+        delattr(self, slot)
+
+    def __contains__(self, key):
+        slot = _SLOT_NAMES.get(key)
+        if slot is None:
+            extra = getattr(self, '_extra', None)
+            return extra is not None and key in extra
+        return getattr(self, slot, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        for key in SLOT_KEYS:
+            if getattr(self, _SLOT_NAMES[key], _MISSING) is not _MISSING:
+                yield key
+        extra = getattr(self, '_extra', None)
+        if extra:
+            yield from extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def get(self, key, default=None):
+        # szybsza ścieżka niż w MutableMapping (bez wyjątku KeyError)
+        slot = _SLOT_NAMES.get(key)
+        if slot is None:
+            extra = getattr(self, '_extra', None)
+            return extra.get(key, default) if extra else default
+        value = getattr(self, slot, _MISSING)
+        if value is _MISSING:
+            return default
+        if slot == '_name':
+            return SYMBOLS[value]
+        if value is _EMPTY_LAYER:
+            return self[key]
+        return value
+
+    def fits(self, ls_element: dict) -> bool:
+        """
+        Fast version of fit_properties: compares name and attributes using symbols.
+        :param ls_element: node from the production
+        :return: True if name and attributes of the production node fit the node
+        """
+        if 'Name' in ls_element and getattr(self, '_name', -1) != SYMBOLS.lookup(ls_element['Name']):
+            return False
+        ls_attributes = ls_element.get('Attributes')
+        if ls_attributes:
+            attributes = getattr(self, '_attributes', _MISSING)
+            if attributes is _MISSING:
+                return False
+            attributes = attributes._flat
+            for attr, v in ls_attributes.items():
+                symbol = SYMBOLS.lookup(attr)
+                for nr in range(0, len(attributes), 2):
+                    if attributes[nr] == symbol:
+                        if v is not None and v != attributes[nr + 1]:
+                            return False
+                        break
+                else:
+                    return False
+        return True
+
+    def __repr__(self):
+        return f'SlotNode({dict(self.items())!r})'
+
+
+register_node_type(SlotNode)
+
+
+def node_to_slots(node: dict) -> SlotNode:
+    """
+    Converts the dict node with its subtree to SlotNode. Connections are rewritten later by world_to_slots.
+    :param node: node in the dict-of-lists format
+    :return: SlotNode
+    """
+    slot_node = SlotNode()
+    for key, value in node.items():
+        if key in NODE_LAYERS:
+            slot_node[key] = [node_to_slots(child) for child in value]
+        elif key == 'Connections':
+            slot_node[key] = [dict(connection) for connection in value]
+        else:
+            slot_node[key] = value
+    return slot_node
+
+
+def node_to_dict(node) -> dict:
+    """
+    Converts the node (of any backend) with its subtree to the dict node. Connections are rewritten later by
+    slots_to_world.
+    :param node: node
+    :return: dict node
+    """
+    dict_node = {}
+    for key, value in node.items():
+        if key in NODE_LAYERS:
+            dict_node[key] = [node_to_dict(child) for child in value]
+        elif key == 'Attributes':
+            dict_node[key] = dict(value.items())
+        elif key == 'Connections':
+            dict_node[key] = [dict(connection) for connection in value]
+        else:
+            dict_node[key] = value
+    return dict_node
+
+
+def _rewrite_destinations(old_world: list, new_world: list):
+    # wskazania lokacji docelowych przenosimy na odpowiednie lokacje nowego świata
+    new_by_old = {id(old): new for old, new in zip(old_world, new_world)}
+    for new_location in new_world:
+        for connection in new_location.get('Connections', []):
+            destination = connection.get('Destination')
+            if is_node(destination):
+                connection['Destination'] = new_by_old.get(id(destination), destination)
+
+
+def world_to_slots(world: list) -> List[SlotNode]:
+    """
+    Converts the world (list of locations with destinations changed to nodes) to the SlotNode backend.
+    :param world: list of dict locations
+    :return: list of SlotNode locations
+    """
+    slot_world = [node_to_slots(location) for location in world]
+    _rewrite_destinations(world, slot_world)
+    return slot_world
+
+
+def slots_to_world(slot_world: list) -> List[dict]:
+    """
+    Converts the world of SlotNode locations back to the dict-of-lists format.
+    :param slot_world: list of SlotNode locations
+    :return: list of dict locations
+    """
+    world = [node_to_dict(location) for location in slot_world]
+    _rewrite_destinations(slot_world, world)
+    return world
+
+
+def slot_nodes_count(world: Union[list, SlotNode]) -> int:
+    if isinstance(world, list):
+        return sum(slot_nodes_count(node) for node in world)
+    return 1 + sum(slot_nodes_count(world.get(layer) or []) for layer in NODE_LAYERS if layer in world)
@@ -0,0 +1,238 @@
+from copy import deepcopy
+from typing import List, Union, Iterable
+
+from library.tools_process import apply_instructions_to_world
+
+# klucze węzła, które w wersji trwałej są przechowywane w osobnych polach
+NODE_LAYERS = ('Characters', 'Items', 'Narration')
+STRUCTURAL_KEYS = ('Name', 'Attributes', 'Characters', 'Items', 'Narration', 'Connections')
+
+
+class PersistentNode:
+    """
+    Immutable node of the persistent world. Children layers are tuples of PersistentNode objects, so
+    the unchanged subtrees are shared between consecutive versions of the world.
+    """
+    __slots__ = ('keys', 'name', 'attributes', 'characters', 'items', 'narration', 'connections', 'extra', 'origin')
+
+    def __init__(self, keys, name, attributes, characters, items, narration, connections, extra, origin=None):
+        self.keys = keys  # kolejność kluczy w oryginalnym słowniku
+        self.name = name
+        self.attributes = attributes  # krotka par (klucz, wartość) albo None
+        self.characters = characters  # krotka węzłów albo None, gdy warstwy nie było w słowniku
+        self.items = items
+        self.narration = narration
+        self.connections = connections  # krotka par (indeks lokacji docelowej, dodatkowe pola połączenia)
+        self.extra = extra  # pozostałe pola węzła (Id, IsObject, Comment...) jako krotka par
+        self.origin = origin  # id() słownika, z którego powstał węzeł – tylko podpowiedź przy kolejnej wersji
+
+    def layer(self, layer_name: str) -> Union[tuple, None]:
+        return getattr(self, layer_name.lower())
+
+    def same_content(self, other) -> bool:
+        """
+        Checks if two persistent nodes have identical content. Children are compared by identity, which is
+        enough, because the unchanged children are always shared.
+        :param other: persistent node to compare with
+        :return: True if nodes are interchangeable
+        """
+        if other is None or self.keys != other.keys or self.name != other.name or \
+                self.attributes != other.attributes or self.extra != other.extra or \
+                self.connections != other.connections:
+            return False
+        for layer_name in ('characters', 'items', 'narration'):
+            mine = getattr(self, layer_name)
+            theirs = getattr(other, layer_name)
+            if mine is theirs:
+                continue
+            if mine is None or theirs is None or len(mine) != len(theirs):
+                return False
+            if any(a is not b for a, b in zip(mine, theirs)):
+                return False
+        return True
+
+
+class PersistentWorld:
+    """
+    Version of the world built from PersistentNode locations. Versions created from each other share all
+    the locations and sheaves which have not been changed.
+    """
+    __slots__ = ('locations', 'previous', 'version')
+
+    def __init__(self, locations: tuple, previous=None):
+        self.locations = locations
+        self.previous = previous
+        self.version = previous.version + 1 if previous else 0
+
+    def __len__(self):
+        return len(self.locations)
+
+
+def _freeze_value(value):
+    # atrybuty są skalarne, ale na wszelki wypadek kopiujemy wartości złożone, by wersja była niezmienna
+    if isinstance(value, (dict, list)):
+        return deepcopy(value)
+    return value
+
+
+def _freeze_node(node: dict, previous: PersistentNode = None, location_index: dict = None) -> PersistentNode:
+    """
+    Converts a dict node (with its subtree) into PersistentNode, reusing the previous version of the node
+    and its children wherever the content has not changed.
+    :param node: node in the dict-of-lists format
+    :param previous: persistent node created earlier from the same dict node (or None)
+    :param location_index: dict id(location) -> index of location in the world, used for connections
+    :return: persistent node
+    """
+    previous_children = {}
+    if previous is not None:
+        for layer_name in NODE_LAYERS:
+            for child in previous.layer(layer_name) or ():
+                previous_children[child.origin] = child
+
+    layers = {}
+    for layer_name in NODE_LAYERS:
+        if layer_name in node:
+            layers[layer_name] = tuple(_freeze_node(child, previous_children.get(id(child)), location_index)
+                                       for child in node[layer_name])
+        else:
+            layers[layer_name] = None
+
+    connections = None
+    if 'Connections' in node:
+        connections = []
+        for connection in node['Connections']:
+            destination = connection.get('Destination')
+            if isinstance(destination, dict):
+                destination = location_index.get(id(destination)) if location_index else None
+            rest = tuple((k, _freeze_value(v)) for k, v in connection.items() if k != 'Destination')
+            connections.append((destination, rest))
+        connections = tuple(connections)
+
+    attributes = None
+    if 'Attributes' in node:
+        attributes = tuple((k, _freeze_value(v)) for k, v in node['Attributes'].items())
+
+    extra = tuple((k, _freeze_value(v)) for k, v in node.items() if k not in STRUCTURAL_KEYS)
+
+    new_node = PersistentNode(tuple(node.keys()), node.get('Name'), attributes, layers['Characters'],
+                              layers['Items'], layers['Narration'], connections, extra, id(node))
+    if new_node.same_content(previous):
+        return previous
+    return new_node
+
+
+def _thaw_node(p_node: PersistentNode, locations: list = None) -> dict:
+    """
+    Converts PersistentNode (with its subtree) back to the dict-of-lists format.
+    :param p_node: persistent node
+    :param locations: list of already created dict locations, used to resolve connections
+    :return: node in the dict format
+    """
+    extra = dict(p_node.extra)
+    node = {}
+    for key in p_node.keys:
+        if key == 'Name':
+            node['Name'] = p_node.name
+        elif key == 'Attributes':
+            node['Attributes'] = {k: _freeze_value(v) for k, v in p_node.attributes}
+        elif key in NODE_LAYERS:
+            node[key] = [_thaw_node(child, locations) for child in p_node.layer(key)]
+        elif key == 'Connections':
+            node['Connections'] = []
+            for destination, rest in p_node.connections:
+                connection = {'Destination': locations[destination] if isinstance(destination, int) and locations
+                              else destination}
+                connection.update({k: _freeze_value(v) for k, v in rest})
+                node['Connections'].append(connection)
+        else:
+            node[key] = _freeze_value(extra[key])
+    return node
+
+
+def world_to_persistent(world: list, previous: PersistentWorld = None,
+                        changed_locations: Iterable[int] = None) -> PersistentWorld:
+    """
+    Creates the persistent version of the world given in the dict-of-lists format. If the previous version is
+    given, only the changed locations are converted again and all the other ones are shared.
+    :param world: list of locations (with destinations changed to nodes)
+    :param previous: previous persistent version of the same world
+    :param changed_locations: ids of the dict locations changed since the previous version (all if None)
+    :return: new persistent version of the world
+    """
+    location_index = {id(location): nr for nr, location in enumerate(world)}
+    if previous is not None and len(previous.locations) != len(world):
+        print('Liczba lokacji w świecie nie zgadza się z poprzednią wersją. Tworzę wersję od nowa.')
+        previous = None
+
+    if previous is None:
+        return PersistentWorld(tuple(_freeze_node(location, None, location_index) for location in world))
+
+    if changed_locations is None:
+        changed = set(location_index)
+    else:
+        changed = set(changed_locations) & set(location_index)
+    locations = list(previous.locations)
+    for location_id in changed:
+        nr = location_index[location_id]
+        locations[nr] = _freeze_node(world[nr], previous.locations[nr], location_index)
+
+    return PersistentWorld(tuple(locations), previous)
+
+
+def persistent_to_world(p_world: PersistentWorld) -> list:
+    """
+    Converts the persistent version of the world to the list of locations in the dict-of-lists format,
+    with destinations already changed to nodes.
+    :param p_world: persistent version of the world
+    :return: list of locations
+    """
+    locations = []
+    for p_location in p_world.locations:
+        # najpierw tworzymy lokacje bez połączeń, żeby móc wskazać węzły docelowe
+        locations.append({})
+    for location, p_location in zip(locations, p_world.locations):
+        location.update(_thaw_node(p_location, locations))
+    return locations
+
+
+def persistent_apply_production(p_world: PersistentWorld, world: list, production: dict, variant: list,
+                                prod_vis_mode: bool = False):
+    """
+    Applies the production to the working (dict) copy of the world and returns the new persistent version,
+    which shares all the locations untouched by the production with the given version.
+    :param p_world: persistent version corresponding to the current state of the working world
+    :param world: working world in the dict-of-lists format
+    :param production: production chosen to apply
+    :param variant: list of pairs of matched nodes: left from the production nodespace and right from the world
+    :param prod_vis_mode: passed to apply_instructions_to_world
+    :return: new persistent version of the world and the list of modified nodes ids
+    """
+    location_ids = {id(location) for location in world}
+    # instrukcje działają wyłącznie w lokacjach dopasowanych do lewej strony produkcji
+    changed_locations = [id(w_node) for ls_node, w_node in variant if id(w_node) in location_ids]
+    modified_nodes = apply_instructions_to_world(production, variant, world, prod_vis_mode)
+    return world_to_persistent(world, p_world, changed_locations), modified_nodes
+
+
+def shared_locations_count(p_world_1: PersistentWorld, p_world_2: PersistentWorld) -> int:
+    """
+    Counts locations shared (not copied) by two persistent versions of the world.
+    :param p_world_1: persistent version of the world
+    :param p_world_2: persistent version of the world
+    :return: number of shared locations
+    """
+    return sum(1 for loc1, loc2 in zip(p_world_1.locations, p_world_2.locations) if loc1 is loc2)
+
+
+def persistent_history(p_world: PersistentWorld) -> List[PersistentWorld]:
+    """
+    Returns the chain of versions ending with the given one, from the oldest.
+    :param p_world: the newest version
+    :return: list of versions
+    """
+    history = []
+    while p_world is not None:
+        history.append(p_world)
+        p_world = p_world.previous
+    return history[::-1]
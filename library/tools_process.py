@@ -12,8 +12,12 @@ import ctypes
 
 from library.tools import find_reference_leaves, ls_to_world, breadcrumb_pointer, find_node_layer_name, \
     nodes_list_from_tree, find_reference_leaves_single_graph, node_description, eval_expression_po_rozmowie_z_Wojtkiem, \
-    world_copy, destinations_change_to_nodes
-from library.tools_visualisation import draw_graph, GraphVisualizer, draw_narration_line
+    world_copy, destinations_change_to_nodes, json_default
+from library.tools_visualisation import draw_graph, GraphVisualizer, draw_narration_line, flush_render_queue
+from library.tools_journal import open_journal, get_journal, close_journal, read_gameplay, find_resume_point, \
+    read_journal_record, JOURNAL_EXTENSION, PRODUCTION_PACKS
+from library.tools_binary import load_compiled_pack, save_compiled_pack, PACK_CACHE_DIR
+from library.tools_serialization import canonical_world_json, write_json_stream, materialize_json
 
 
 def get_op_source_paths_list(ls: list, variant: List[Tuple], path_single: str, path_multiple: str) -> List[List[dict]]:
@@ -70,12 +74,13 @@ def get_op_target_node(ls: list, variant: List[Tuple], to: str) -> (dict, str):
     return w_target_node, target_array
 
 
-def add_node(node_to_add: dict, target_node: dict, target_layer: str) -> List[int]:
+def add_node(node_to_add: dict, target_node: dict, target_layer: str, touched_nodes: list = None) -> List[int]:
     """
     Adds the given node to the target layer of the target node.
     :param node_to_add: given node to add
     :param target_node: node to places the node_to_add into the children list
     :param target_layer: name of the specific children layer of the target_node
+    :param touched_nodes: if given, the target node is appended to it (node whose children have changed)
     :return: list of added nodes. If empty, it means the instruction application has failed
     """
     modified_nodes_ids = []
@@ -94,16 +99,20 @@ def add_node(node_to_add: dict, target_node: dict, target_layer: str) -> List[in
         target_node[target_layer] = []
     target_node[target_layer].append(node_to_add)
     modified_nodes_ids.append(id(node_to_add))
+    if touched_nodes is not None:
+        touched_nodes.append(target_node)
 
     return modified_nodes_ids
 
 
-def remove_node(node_to_remove: dict, parent_node: dict = None, world: Union[list, dict] = None) -> List[int]:
+def remove_node(node_to_remove: dict, parent_node: dict = None, world: Union[list, dict] = None,
+                touched_nodes: list = None) -> List[int]:
     """
     Removes the given node from the list of children of parent node (parent in the world).
     :param node_to_remove: given node to remove
     :param parent_node: the parent node of the removed one, if not given the world argument is used to calculate
     :param world: graph from which the node is removed. used to calculate the parent node, if not given directly
+    :param touched_nodes: if given, the parent node is appended to it (node whose children have changed)
     :return: id of the parent of deleted node
     """
     if not node_to_remove:
@@ -128,16 +137,19 @@ def remove_node(node_to_remove: dict, parent_node: dict = None, world: Union[lis
     except:
         print(f'Błąd operacji, bo nie da się usunąć węzła {node_to_remove.get("Name")} ze świata.')
         return []
+    if touched_nodes is not None:
+        touched_nodes.append(parent_node)
 
     return [id(parent_node)]
 
 
-def operation_move(ls: list, variant: List[tuple], instruction: dict) -> List[int]:
+def operation_move(ls: list, variant: List[tuple], instruction: dict, touched_nodes: list = None) -> List[int]:
     """
     Moves nodes in the world (in its part represented by the variant tuples right sides).
     :param ls: left side of the production
     :param variant: list of pairs of matched nodes: left from the production nodespace and right from the world nodespace
     :param instruction: dict of the parameters taken from the operation “Instructions” list
+    :param touched_nodes: if given, the world nodes changed by the operation are appended to it
     :return: list of modified nodes ids. If empty, it means the instruction application has failed
     """
     modified_nodes_ids = []
@@ -170,20 +182,21 @@ def operation_move(ls: list, variant: List[tuple], instruction: dict) -> List[in
                   f'Przypuszczalnie usiłujemy przenieść lokację, co jest zabronione.')
             continue
 
-        if remove_node(node_to_move, parent_node):
-            modified_nodes_ids.extend(add_node(node_to_move, target_node, target_layer))
+        if remove_node(node_to_move, parent_node, touched_nodes=touched_nodes):
+            modified_nodes_ids.extend(add_node(node_to_move, target_node, target_layer, touched_nodes))
         else:
             continue
 
     return modified_nodes_ids
 
 
-def operation_copy(ls: list, variant: List[tuple], instruction: dict) -> List[int]:
+def operation_copy(ls: list, variant: List[tuple], instruction: dict, touched_nodes: list = None) -> List[int]:
     """
     Copies nodes in the world (in its part represented by the variant tuples right sides).
     :param ls: left side of the production
     :param variant: list of pairs of matched nodes: left from the production nodespace and right form the world nodespace
     :param instruction: dict of the parameters taken from the operation “Instructions” list
+    :param touched_nodes: if given, the world nodes changed by the operation are appended to it
     :return: list of modified nodes ids. If empty, it means the instruction application has failed
     """
     modified_nodes_ids = []
@@ -202,17 +215,18 @@ def operation_copy(ls: list, variant: List[tuple], instruction: dict) -> List[in
         # dodawanie do pozycji docelowej
         for path in nodes_paths[0:limit]:
             node_to_copy = path[-1]
-            modified_nodes_ids.extend(add_node(deepcopy(node_to_copy), target_node, target_layer))
+            modified_nodes_ids.extend(add_node(deepcopy(node_to_copy), target_node, target_layer, touched_nodes))
 
     return modified_nodes_ids
 
 
-def operation_create(ls: list, variant: List[tuple], instruction: dict) -> List[int]:
+def operation_create(ls: list, variant: List[tuple], instruction: dict, touched_nodes: list = None) -> List[int]:
     """
     Creates nodes in the world (in its part represented by the variant tuples right sides).
     :param ls: left side of the production
     :param variant: list of pairs of matched nodes: left from the production nodespace and right form the world nodespace
     :param instruction: dict of the parameters taken from the operation “Instructions” list
+    :param touched_nodes: if given, the world nodes changed by the operation are appended to it
     :return: list of modified nodes ids. If empty, it means the instruction application has failed
     """
     modified_nodes_ids = []
@@ -224,12 +238,12 @@ def operation_create(ls: list, variant: List[tuple], instruction: dict) -> List[
 
     for nr in range(limit):
         new_node = deepcopy(node_to_create)
-        modified_nodes_ids.extend(add_node(new_node, target_node, target_layer))
+        modified_nodes_ids.extend(add_node(new_node, target_node, target_layer, touched_nodes))
 
     return modified_nodes_ids
 
 
-def operation_winning(ls: list, variant: List[tuple], instruction: dict) -> List[int]:
+def operation_winning(ls: list, variant: List[tuple], instruction: dict, touched_nodes: list = None) -> List[int]:
     character = ls_to_world(ls[0]["Characters"][0], variant)
     if not character.get("Attributes"):
         character['Attributes'] = {}
@@ -258,16 +272,19 @@ def operation_winning(ls: list, variant: List[tuple], instruction: dict) -> List
         """)
 
     character['Attributes']["IsWinner"] = True
+    if touched_nodes is not None:
+        touched_nodes.append(character)
 
     return []
 
 
-def operation_delete(ls: list, variant: List[tuple], instruction: dict) -> List[int]:
+def operation_delete(ls: list, variant: List[tuple], instruction: dict, touched_nodes: list = None) -> List[int]:
     """
     Deletes nodes from the world (from its part represented by the variant tuples right sides).
     :param ls: left side of the production
     :param variant: list of pairs of matched nodes: left from the production nodespace and right form the world nodespace
     :param instruction: dict of the parameters taken from the operation “Instructions” list
+    :param touched_nodes: if given, the world nodes changed by the operation are appended to it
     :return: list of parents of deleted nodes ids. If empty, it means the instruction application has failed
     """
     modified_nodes_ids = []
@@ -301,31 +318,31 @@ def operation_delete(ls: list, variant: List[tuple], instruction: dict) -> List[
             if constr_characters == 'move':
                 if node_to_delete.get('Characters'):
                     for ch in node_to_delete['Characters']:
-                        if remove_node(ch, node_to_delete, parent_node):
-                            modified_nodes_ids.extend(add_node(ch, node_to_delete, 'Characters'))
+                        if remove_node(ch, node_to_delete, parent_node, touched_nodes):
+                            modified_nodes_ids.extend(add_node(ch, node_to_delete, 'Characters', touched_nodes))
             elif constr_characters == 'prohibit':
                     if node_to_delete.get('Characters') and len(node_to_delete['Characters']) > 0:
                         continue
             if constr_items == 'move':
                 if node_to_delete.get('Items'):
                     for ch in node_to_delete['Items']:
-                        if remove_node(ch, node_to_delete, parent_node):
-                            modified_nodes_ids.extend(add_node(ch, node_to_delete, 'Items'))
+                        if remove_node(ch, node_to_delete, parent_node, touched_nodes):
+                            modified_nodes_ids.extend(add_node(ch, node_to_delete, 'Items', touched_nodes))
             elif constr_items == 'prohibit':
                     if node_to_delete.get('Items') and len(node_to_delete['Items']) > 0:
                         continue
             if constr_narration == 'move':
                 if node_to_delete.get('Narration'):
                     for ch in node_to_delete['Narration']:
-                        if remove_node(ch, node_to_delete, parent_node):
-                            modified_nodes_ids.extend(add_node(ch, node_to_delete, 'Narration'))
+                        if remove_node(ch, node_to_delete, parent_node, touched_nodes):
+                            modified_nodes_ids.extend(add_node(ch, node_to_delete, 'Narration', touched_nodes))
             elif constr_narration == 'prohibit':
                     if node_to_delete.get('Narration') and len(node_to_delete['Narration']) > 0:
                         continue
 
             # usuwamy węzeł źródłowy
             try:
-                modified_nodes_ids.extend(remove_node(node_to_delete, parent_node))
+                modified_nodes_ids.extend(remove_node(node_to_delete, parent_node, touched_nodes=touched_nodes))
             except:
                 print(f'Błąd operacji delete, bo nie da się usunąć węzła {node_to_delete.get("Name")} ze świata.')
                 continue
@@ -337,12 +354,14 @@ def operation_delete(ls: list, variant: List[tuple], instruction: dict) -> List[
     return modified_nodes_ids
 
 
-def operation_set(ls: list, variant: List[tuple], instruction: dict, prod_vis_mode = False) -> List[int]:
+def operation_set(ls: list, variant: List[tuple], instruction: dict, prod_vis_mode = False,
+                  touched_nodes: list = None) -> List[int]:
     """
     Sets the attributes of the nodes in the world (in its part represented by the variant tuples right sides).
     :param ls: left side of the production
     :param variant: list of pairs of matched nodes: left from the production nodespace and right form the world nodespace
     :param instruction: dict of the parameters taken from the operation “Instructions” list
+    :param touched_nodes: if given, the world nodes changed by the operation are appended to it
     :return: list of modified nodes ids. If empty, it means the instruction application has failed
     """
     modified_nodes_ids = []
@@ -374,15 +393,19 @@ def operation_set(ls: list, variant: List[tuple], instruction: dict, prod_vis_mo
 
     node_to_change['Attributes'][attribute_name] = value
     modified_nodes_ids.append(id(node_to_change))
+    if touched_nodes is not None:
+        touched_nodes.append(node_to_change)
 
     return modified_nodes_ids
 
-def operation_add(ls: list, variant: List[tuple], instruction: dict, prod_vis_mode = False) -> List[int]:
+def operation_add(ls: list, variant: List[tuple], instruction: dict, prod_vis_mode = False,
+                  touched_nodes: list = None) -> List[int]:
     """
     Sets the attributes of the nodes in the world (in its part represented by the variant tuples right sides).
     :param ls: left side of the production
     :param variant: list of pairs of matched nodes: left from the production nodespace and right form the world nodespace
     :param instruction: dict of the parameters taken from the operation “Instructions” list
+    :param touched_nodes: if given, the world nodes changed by the operation are appended to it
     :return: list of modified nodes ids. If empty, it means the instruction application has failed
     """
     modified_nodes_ids = []
@@ -433,15 +456,19 @@ def operation_add(ls: list, variant: List[tuple], instruction: dict, prod_vis_mo
             print(f'Błąd operacji {instruction["Op"]} dla atrybutu: {attribute}.')
 
     modified_nodes_ids.append(id(node_to_change))
+    if touched_nodes is not None:
+        touched_nodes.append(node_to_change)
 
     return modified_nodes_ids
 
-def operation_mul(ls: list, variant: List[tuple], instruction: dict, prod_vis_mode = False) -> List[int]:
+def operation_mul(ls: list, variant: List[tuple], instruction: dict, prod_vis_mode = False,
+                  touched_nodes: list = None) -> List[int]:
     """
     Sets the attributes of the nodes in the world (in its part represented by the variant tuples right sides).
     :param ls: left side of the production
     :param variant: list of pairs of matched nodes: left from the production nodespace and right form the world nodespace
     :param instruction: dict of the parameters taken from the operation “Instructions” list
+    :param touched_nodes: if given, the world nodes changed by the operation are appended to it
     :return: list of modified nodes ids. If empty, it means the instruction application has failed
     """
     modified_nodes_ids = []
@@ -492,16 +519,19 @@ def operation_mul(ls: list, variant: List[tuple], instruction: dict, prod_vis_mo
             print(f'Błąd operacji {instruction["Op"]} dla atrybutu: {attribute}.')
 
     modified_nodes_ids.append(id(node_to_change))
+    if touched_nodes is not None:
+        touched_nodes.append(node_to_change)
 
     return modified_nodes_ids
 
 
-def operation_unset(ls: list, variant: List[tuple], instruction: dict) -> List[int]:
+def operation_unset(ls: list, variant: List[tuple], instruction: dict, touched_nodes: list = None) -> List[int]:
     """
     Unets the given attribute of the node in the world (in its part represented by the variant tuples right sides).
     :param ls: left side of the production
     :param variant: list of pairs of matched nodes: left from the production nodespace and right form the world nodespace
     :param instruction: dict of the parameters taken from the operation “Instructions” list
+    :param touched_nodes: if given, the world nodes changed by the operation are appended to it
     :return: list of modified nodes ids. If empty, it means the instruction application has failed
     """
     modified_nodes_ids = []
@@ -527,16 +557,21 @@ def operation_unset(ls: list, variant: List[tuple], instruction: dict) -> List[i
         print(f'Nie udało się usunąć  atrybutu {attribute_name} węzła {node_to_change.get("Name", "")}')
         return []
     modified_nodes_ids.append(id(node_to_change))
+    if touched_nodes is not None:
+        touched_nodes.append(node_to_change)
 
     return modified_nodes_ids
 
 
-def apply_instructions_to_world(production: dict, variant: list, world: Union[list, dict], prod_vis_mode = False):
+def apply_instructions_to_world(production: dict, variant: list, world: Union[list, dict], prod_vis_mode = False,
+                                touched_nodes: list = None):
     """
     Applies instructions given in the production to the world (currently to its part represented by the variant tuples right sides).
     :param production: production chosen to apply
     :param variant: list of pairs of matched nodes: left from the production nodespace and right form the world nodespace
     :param world: Currently not used, prepared for the instructions using nodes from beyond the variant list
+    :param touched_nodes: if given, the world nodes changed by the instructions (their attributes or lists of children)
+    are appended to it, e.g. for the incremental world hash
     :return: nothing
     """
     instructions = production['Instructions']
@@ -546,32 +581,32 @@ def apply_instructions_to_world(production: dict, variant: list, world: Union[li
     for instruction_number, instruction in enumerate(instructions):
 
         if instruction['Op'] == 'move':
-            modified_nodes.extend(operation_move(ls, variant, instruction))
+            modified_nodes.extend(operation_move(ls, variant, instruction, touched_nodes))
 
         elif instruction['Op'] == 'delete':
-            modified_nodes.extend(operation_delete(ls, variant, instruction))
+            modified_nodes.extend(operation_delete(ls, variant, instruction, touched_nodes))
 
         elif instruction['Op'] == 'create':
-            modified_nodes.extend(operation_create(ls, variant, instruction))
+            modified_nodes.extend(operation_create(ls, variant, instruction, touched_nodes))
 
         elif instruction['Op'] == 'copy':
-            modified_nodes.extend(operation_copy(ls, variant, instruction))
+            modified_nodes.extend(operation_copy(ls, variant, instruction, touched_nodes))
 
         elif instruction['Op'] == 'set':
-            modified_nodes.extend(operation_set(ls, variant, instruction, prod_vis_mode))
+            modified_nodes.extend(operation_set(ls, variant, instruction, prod_vis_mode, touched_nodes))
 
         elif instruction['Op'] == 'add':
-            modified_nodes.extend(operation_add(ls, variant, instruction, prod_vis_mode))
+            modified_nodes.extend(operation_add(ls, variant, instruction, prod_vis_mode, touched_nodes))
 
         elif instruction['Op'] == 'mul':
-            modified_nodes.extend(operation_mul(ls, variant, instruction, prod_vis_mode))
+            modified_nodes.extend(operation_mul(ls, variant, instruction, prod_vis_mode, touched_nodes))
 
         elif instruction['Op'] == 'unset':
-            modified_nodes.extend(operation_unset(ls, variant, instruction))
+            modified_nodes.extend(operation_unset(ls, variant, instruction, touched_nodes))
 
         # operacje testowe
         elif instruction['Op'] == 'winning':
-            modified_nodes.extend(operation_winning(ls, variant, instruction))
+            modified_nodes.extend(operation_winning(ls, variant, instruction, touched_nodes))
 
 
         # instrukcje modyfikujące cały świat
@@ -657,160 +692,55 @@ def save_stats(world_structure: dict, world: list, folder:str, file_name: str =
     #
     # with open(file_path, 'w', encoding="utf8") as outfile:
     #     # json.dump(json_string, outfile)
-    #     json.dump(world_target['json'], outfile, indent=4, ensure_ascii=False)
+    #     json.dump(world_target['json'], outfile, indent=4, ensure_ascii=False, default=json_default)
 
     return
 
 
 def save_world(world_structure: dict, folder:str = None, file_name: str = None):
-    world_target = deepcopy(world_structure)
-    if folder:
-        if not file_name:
-            file_name = str(datetime.datetime.now().strftime("%Y%m%d%H%M%S")) + '_' + world_target['file_path'].split('/')[-1]
-    for location in world_target['json'][0]["LSide"]["Locations"]:
-        if 'Connections' in location:
-            for dest in location['Connections']:
-                dest['Destination']['Id'] = str(id(dest['Destination']))
-                dest['Destination'] = str(id(dest['Destination']))
-
-    for location in world_target['json'][0]["LSide"]["Locations"]:
-        if 'Attributes' in location:
-            temp_attributes = location['Attributes']
-            del(location['Attributes'])
-        else:
-            temp_attributes = None
-        if 'Characters' in location:
-            temp_characters = location['Characters']
-            del(location['Characters'])
-        else:
-            temp_characters = None
-        if 'Items' in location:
-            temp_items = location['Items']
-            del (location['Items'])
-        else:
-            temp_items = None
-        if 'Narration' in location:
-            temp_narration = location['Narration']
-            del (location['Narration'])
-        else:
-            temp_narration = None
-        if 'Connections' in location:
-            temp_connections = location['Connections']
-            del (location['Connections'])
-        else:
-            temp_connections = None
-        if 'Name' in location:
-            temp_name = location['Name']
-            del (location['Name'])
-        else:
-            temp_name = None
-        if 'Id' in location:
-            temp_id = location['Id']
-            del (location['Id'])
-        else:
-            temp_id = None
-
-        if temp_id:
-            location['Id'] = temp_id
-        if temp_name:
-            location['Name'] = temp_name
-        if temp_attributes:
-            location['Attributes'] = temp_attributes
-        if temp_characters:
-            location['Characters'] = temp_characters
-        if temp_items:
-            location['Items'] = temp_items
-        if temp_narration:
-            location['Narration'] = temp_narration
-        if temp_connections:
-            location['Connections'] = temp_connections
-
-
-    if folder:
-        file_path = folder.rstrip(os.sep) + os.sep + file_name
-        # Directly from dictionary
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w', encoding="utf8") as outfile:
-            # json.dump(json_string, outfile)
-            json.dump(world_target['json'], outfile, indent=4, ensure_ascii=False)
+    """
+    Saves the world with locations ordered canonically and destinations written as locations Ids.
+    The json is streamed straight from the live world, without copying it.
+    :param world_structure: dict with keys 'file_path' and 'json' (destinations changed to nodes)
+    :param folder: target folder, if not given nothing is written
+    :param file_name: name of the file (by default the date and the name of the world file)
+    :return: path of the written file or the new json structure if folder is not given
+    """
+    canonical_json = canonical_world_json(world_structure)
+    if not folder:
+        return materialize_json(canonical_json)
+
+    if not file_name:
+        file_name = str(datetime.datetime.now().strftime("%Y%m%d%H%M%S")) + '_' + world_structure['file_path'].split('/')[-1]
+    file_path = folder.rstrip(os.sep) + os.sep + file_name
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w', encoding="utf8") as outfile:
+        write_json_stream(canonical_json, outfile)
 
-    return world_target['json']
+    return file_path
 
 
 def save_world_game(world_structure: dict, folder:str = None, file_name: str = None):
-    world_target = deepcopy(world_structure)
-    world_copy(world_structure['json'][0]["LSide"]["Locations"], world_target['json'][0]["LSide"]["Locations"], False)
-    if folder:
-        if not file_name:
-            file_name = str(datetime.datetime.now().strftime("%Y%m%d%H%M%S")) + '_' + world_target['file_path'].split('/')[-1]
-    # for location in world_target['json'][0]["LSide"]["Locations"]:
-    #     if 'Connections' in location:
-    #         for dest in location['Connections']:
-    #             dest['Destination'] = str(dest['Destination']['Id'])
-    #             # dest['Destination'] = str(id(dest['Destination']))
-
-    # for location in world_target['json'][0]["LSide"]["Locations"]:
-    #     if 'Attributes' in location:
-    #         temp_attributes = location['Attributes']
-    #         del(location['Attributes'])
-    #     else:
-    #         temp_attributes = None
-    #     if 'Characters' in location:
-    #         temp_characters = location['Characters']
-    #         del(location['Characters'])
-    #     else:
-    #         temp_characters = None
-    #     if 'Items' in location:
-    #         temp_items = location['Items']
-    #         del (location['Items'])
-    #     else:
-    #         temp_items = None
-    #     if 'Narration' in location:
-    #         temp_narration = location['Narration']
-    #         del (location['Narration'])
-    #     else:
-    #         temp_narration = None
-    #     if 'Connections' in location:
-    #         temp_connections = location['Connections']
-    #         del (location['Connections'])
-    #     else:
-    #         temp_connections = None
-    #     if 'Name' in location:
-    #         temp_name = location['Name']
-    #         del (location['Name'])
-    #     else:
-    #         temp_name = None
-    #     if 'Id' in location:
-    #         temp_id = location['Id']
-    #         del (location['Id'])
-    #     else:
-    #         temp_id = None
-    #
-    #     if temp_id:
-    #         location['Id'] = temp_id
-    #     if temp_name:
-    #         location['Name'] = temp_name
-    #     if temp_attributes:
-    #         location['Attributes'] = temp_attributes
-    #     if temp_characters:
-    #         location['Characters'] = temp_characters
-    #     if temp_items:
-    #         location['Items'] = temp_items
-    #     if temp_narration:
-    #         location['Narration'] = temp_narration
-    #     if temp_connections:
-    #         location['Connections'] = temp_connections
-
-
-    if folder:
-        file_path = folder.rstrip('/') + '/' + file_name
-        # Directly from dictionary
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w', encoding="utf8") as outfile:
-            # json.dump(json_string, outfile)
-            json.dump(world_target['json'], outfile, indent=4, ensure_ascii=False)
+    """
+    Saves the world as stored in the gameplay: every node gets Id being the address of the live node
+    (the same as in world_copy), so the saved world can be compared with moves records.
+    :param world_structure: dict with keys 'file_path' and 'json' (destinations changed to nodes)
+    :param folder: target folder, if not given nothing is written
+    :param file_name: name of the file (by default the date and the name of the world file)
+    :return: path of the written file or the new json structure if folder is not given
+    """
+    canonical_json = canonical_world_json(world_structure, game=True)
+    if not folder:
+        return materialize_json(canonical_json)
 
-    return world_target['json']
+    if not file_name:
+        file_name = str(datetime.datetime.now().strftime("%Y%m%d%H%M%S")) + '_' + world_structure['file_path'].split('/')[-1]
+    file_path = folder.rstrip('/') + '/' + file_name
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w', encoding="utf8") as outfile:
+        write_json_stream(canonical_json, outfile)
+
+    return file_path
 
 
 def find_node_from_input(graph, prompt, only_one: bool = False, choose_one: bool = False, d = None, f = None) -> list:
@@ -933,12 +863,24 @@ def draw_variants_graphs (matches_lists, world, d_title, d_dir):
         draw_graph(world, d_title, d_desc, d_file, d_dir, red_nodes, red_edges, comments)
 
 
-def game_init(gp):
+def game_init(gp, journal: bool = False, compress: bool = False, batch_size: int = 10):
+    """
+    Saves the initial state of the gameplay.
+    :param gp: gameplay dict
+    :param journal: if True, the gameplay is written incrementally to the append-only journal (jsonl)
+    :param compress: if True, the journal is gzip-compressed
+    :param batch_size: number of moves buffered before writing them to the journal
+    :return: nothing
+    """
+    if journal:
+        if not get_journal(gp):
+            open_journal(gp, compress, batch_size)
+        return
     player_to_filename = re.sub(r'[^\w\d-]+', '', gp["Player"])
     file_path = f'{gp["FilePath"]}/gameplay_{gp["QuestName"]}_{gp["WorldName"]}_{gp["DateTimeStart"]}_{player_to_filename}.json'
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
     with open(file_path, 'w', encoding="utf8") as outfile:
-        json.dump(gp, outfile, indent=4, ensure_ascii=False)
+        json.dump(gp, outfile, indent=4, ensure_ascii=False, default=json_default)
 
 
 def game_over(gp, reason = None):
@@ -973,16 +915,33 @@ def game_over(gp, reason = None):
     file_path = f'{gp["FilePath"]}{os.sep}gameplay_{gp["QuestName"]}_{gp["WorldName"]}_{gp["DateTimeStart"]}_{player_to_filename}.json'
 
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # obrazki stanów świata generowane w tle muszą powstać przed zakończeniem gry
+    flush_render_queue()
     draw_narration_line(gp["Moves"], f'gameplay_{gp["QuestName"]}_{gp["WorldName"]}_{gp["DateTimeStart"]}_{player_to_filename}', f'{gp["FilePath"]}')
     del (gp["FilePath"])
 
-    with open(file_path, 'w', encoding="utf8") as outfile:
-        json.dump(gp, outfile, indent=4, ensure_ascii=False)
+    # rozgrywka zapisywana na bieżąco w dzienniku, wystarczy ją domknąć
+    if not close_journal(gp):
+        with open(file_path, 'w', encoding="utf8") as outfile:
+            json.dump(gp, outfile, indent=4, ensure_ascii=False, default=json_default)
 
 
     exit(0)
 
 
+def record_move(gp, move: dict):
+    """
+    Adds the move to the gameplay and to its journal (if the gameplay is journaled).
+    :param gp: gameplay dict
+    :param move: description of the move
+    :return: nothing
+    """
+    gp['Moves'].append(move)
+    journal = get_journal(gp)
+    if journal:
+        journal.append_move(move)
+
+
 def dict_from_variant(variant):
     variant_dicts = []
     for ls_node, w_node in variant:
@@ -1016,7 +975,10 @@ def looking_for_main_character(gameplay, world, name=None, pointer=None, failure
 
 def retrace_gameplay(gameplay_dir, gameplay_filename):
 
-    gp = json.load(open(f'{gameplay_dir}/{gameplay_filename}', encoding="utf8"))
+    # ruchy czytamy strumieniowo (plik json lub dziennik jsonl)
+    gp, moves = read_gameplay(gameplay_dir, gameplay_filename)
+    if not gp:
+        return False
 
     productions_chars_turn_to_match = []
     productions_world_turn_to_match = []
@@ -1045,10 +1007,11 @@ def retrace_gameplay(gameplay_dir, gameplay_filename):
     # print(f'Świat początkowy i świat pierwszego ruchu { "są identyczne." if world == world_before else "są różne."}')
     destinations_change_to_nodes(world, world=True, remove_ids=False)
 
-    print(f'Wykonano {len(gp["Moves"])} ruchów.')
-
+    if "Moves" in gp:
+        print(f'Wykonano {len(gp["Moves"])} ruchów.')
 
-    for nr, move in enumerate(gp['Moves']):
+    nr = -1
+    for nr, move in enumerate(moves):
         who = 'Automatycznie wykonała się produkcja' if move["Object"] == "Action automatically performed" else f'{move["Object"]} wykonał produkcję'
         print(f'{nr:02d}. {who} „{move["ProductionTitle"].split(" / ")[1]}”')
         # if nr < len(gp["Moves"])-1:
@@ -1123,25 +1086,108 @@ def retrace_gameplay(gameplay_dir, gameplay_filename):
             print(f'Zastosowanie produkcji {"dało identyczny efekt co WorldAfter!" if similarity else "nie dało rady ;--("}')
         print()
 
+    if "Moves" not in gp:
+        print(f'Odtworzono {nr + 1} ruchów.')
 
 
 
-def resume_gameplay(gameplay_dir, gameplay_filename):
 
+def _resume_from_index(gameplay_dir: str, gameplay_filename: str, cache_dir: str):
+    """
+    Resumes the gameplay from the indexed journal: reads only the last keyframe and takes the compiled
+    production packs from the cache (compiling and caching them if needed).
+    :param gameplay_dir: directory of the gameplay file
+    :param gameplay_filename: name of the journal file
+    :param cache_dir: directory of the compiled packs cache
+    :return: the same as resume_gameplay, None if the journal has no index (e.g. it is compressed)
+    """
+    journal_path = f'{gameplay_dir}/{gameplay_filename}'
+    if not gameplay_filename.endswith(JOURNAL_EXTENSION):
+        return None
+    resume_point = find_resume_point(journal_path)
+    if not resume_point:
+        return None
+
+    header_entry = resume_point["Header"]
+    gp = None
+    packs = {}
+    for pack_name in PRODUCTION_PACKS:
+        content_hash = (header_entry.get("Packs") or {}).get(pack_name)
+        pack = load_compiled_pack(content_hash, cache_dir)
+        if pack is None:
+            # pakietu nie ma jeszcze w pamięci podręcznej – wczytujemy nagłówek i kompilujemy pakiet
+            if gp is None:
+                header = read_journal_record(journal_path, header_entry["Offset"], header_entry["Length"])
+                if not header:
+                    return None
+                gp = header["Gameplay"]
+            pack = gp.get(pack_name, [])
+            if not save_compiled_pack(pack, cache_dir, content_hash):
+                print("Problem wczytywania produkcji.")
+                return False
+        packs[pack_name] = pack
+
+    keyframe = resume_point["Keyframe"]
+    if keyframe:
+        record = read_journal_record(journal_path, keyframe["Offset"], keyframe["Length"])
+        if not record:
+            return None
+        world = record["Move"]["WorldAfter"]
+    else:
+        if gp is None:
+            header = read_journal_record(journal_path, header_entry["Offset"], header_entry["Length"])
+            if not header:
+                return None
+            gp = header["Gameplay"]
+        if not gp.get("WorldSource"):
+            print(f"Nie można wczytać świata z pliku {journal_path}")
+            return False
+        world = gp["WorldSource"][0]["LSide"]["Locations"]
+    destinations_change_to_nodes(world, world=True)
 
+    productions_chars_turn_to_match = [prod for prod_list in packs["QuestSource"] for prods in prod_list.values()
+                                       for prod in prods]
+    productions_world_turn_to_match = [prod for prod_list in packs["WorldResponseSource"]
+                                       for prods in prod_list.values() for prod in prods]
+    if resume_point["MovesCount"]:
+        print(f'Wykonano {resume_point["MovesCount"]} ruchów.')
+
+    return world, productions_chars_turn_to_match, productions_world_turn_to_match
 
-    gp = json.load(open(f'{gameplay_dir}/{gameplay_filename}', encoding="utf8"))
 
-    world_name = gp["WorldName"]
-    character_name = gp["MainCharacter"]
-    if gp.get("Moves"):
-        world_source = {'file_path': f'{gameplay_dir}/{gameplay_filename}', 'json': gp["Moves"][-1]["WorldAfter"]}
+def resume_gameplay(gameplay_dir, gameplay_filename, cache_dir: str = None):
+    """
+    Restores the state of the world and the productions of the saved gameplay. Indexed journals are resumed
+    from the last keyframe, other files are read as a whole.
+    :param gameplay_dir: directory of the gameplay file
+    :param gameplay_filename: name of the gameplay file (json or journal)
+    :param cache_dir: directory of the compiled production packs (by default next to the gameplay directory)
+    :return: world, productions of the characters turn, productions of the world turn (False on failure)
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(gameplay_dir)), PACK_CACHE_DIR)
+    resumed = _resume_from_index(gameplay_dir, gameplay_filename, cache_dir)
+    if resumed is not None:
+        return resumed
+
+    # ruchy czytamy strumieniowo i pamiętamy tylko ostatni z nich
+    gp, moves = read_gameplay(gameplay_dir, gameplay_filename)
+    last_move = None
+    moves_count = 0
+    for move in moves:
+        last_move = move
+        moves_count += 1
+
+    world_name = gp.get("WorldName")
+    character_name = gp.get("MainCharacter")
+    if last_move:
+        world = last_move["WorldAfter"]
     elif gp.get("WorldSource"):
-        world_source = {'file_path': f'{gameplay_dir}/{gameplay_filename}', 'json': gp["WorldSource"]}
+        world = gp["WorldSource"][0]["LSide"]["Locations"]
     else:
         print(f"Nie można wczytać świata z pliku {gameplay_dir}/{gameplay_filename}")
+        return False
 
-    world = world_source['json'][0]["LSide"]["Locations"]
     world_nodes_list = nodes_list_from_tree(world, "Locations")
     world_nodes_ids_list = [str(id(x['node'])) for x in world_nodes_list]
     world_nodes_ids_pairs_list = [(str(id(x['node'])), x['node']) for x in world_nodes_list]
@@ -1185,8 +1231,8 @@ def resume_gameplay(gameplay_dir, gameplay_filename):
     # # print(f'Świat początkowy i świat pierwszego ruchu { "są identyczne." if world == world_before else "są różne."}')
     # destinations_change_to_nodes(world, world=True, remove_ids=False)
 
-    if gp.get("Moves"):
-        print(f'Wykonano {len(gp["Moves"])} ruchów.')
+    if moves_count:
+        print(f'Wykonano {moves_count} ruchów.')
 
 
 
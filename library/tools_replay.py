@@ -0,0 +1,242 @@
+import contextlib
+import ctypes
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from typing import List, Union
+
+from library.tools import destinations_change_to_nodes, nodes_list_from_tree, is_node
+from library.tools_journal import read_gameplay, is_journal_file
+from library.tools_process import apply_instructions_to_world
+
+NODE_LAYERS = ('Characters', 'Items', 'Narration')
+
+
+class ReplayIds:
+    """
+    Map between the nodes of the replayed world and the Ids recorded in the gameplay (addresses of the nodes
+    during the original game). Nodes themselves are not changed, the map keeps references to them, so the
+    addresses of removed nodes are not reused.
+    """
+
+    def __init__(self):
+        self.node_by_id = {}
+        self._id_by_node = {}
+
+    def add(self, node, recorded_id: str):
+        self.node_by_id[recorded_id] = node
+        self._id_by_node[id(node)] = (node, recorded_id)
+
+    def recorded_id(self, node) -> Union[str, None]:
+        entry = self._id_by_node.get(id(node))
+        return entry[1] if entry else None
+
+
+def _ls_nodes_map(production: dict) -> dict:
+    # węzły lewej strony produkcji według Id i nazwy (jak breadcrumb_pointer z name_or_id)
+    ls_map = {}
+    for element in nodes_list_from_tree(production["LSide"]["Locations"], "Locations"):
+        node = element['node']
+        for reference in {node.get('Id'), node.get('Name')} - {None}:
+            ls_map.setdefault(reference, []).append(node)
+    return ls_map
+
+
+def _compile_productions(prod_lists: list) -> Union[dict, None]:
+    prod_dict = {}
+    for prod_list in prod_lists:
+        for quest_name, prods in prod_list.items():
+            for prod in prods:
+                if not destinations_change_to_nodes(prod['LSide']['Locations']):
+                    return None
+                prod_dict[prod["Title"]] = prod
+    return prod_dict
+
+
+def _adopt_ids(node, after_node: dict, ids: ReplayIds):
+    # nowe węzły (np. skopiowane poddrzewa) dostają Id z zapisanego stanu świata, według pozycji w warstwie
+    for layer in NODE_LAYERS:
+        for child, after_child in zip(node.get(layer) or [], after_node.get(layer) or []):
+            if ids.recorded_id(child) is None and child.get('Name') == after_child.get('Name') and 'Id' in after_child:
+                ids.add(child, after_child['Id'])
+            _adopt_ids(child, after_child, ids)
+
+
+def _node_state(node, node_id, destination_id) -> dict:
+    """
+    Builds the comparable state of the node: keys order, Id key and empty values (removed by world_copy) are ignored.
+    :param node: node of the world
+    :param node_id: function returning Id of the node
+    :param destination_id: function returning Id of the connection destination
+    :return: dict describing the node with its subtree
+    """
+    state = {'Id': node_id(node)}
+    for key, value in node.items():
+        if key == 'Id':
+            continue
+        if key in NODE_LAYERS:
+            if value:
+                state[key] = [_node_state(child, node_id, destination_id) for child in value]
+        elif key == 'Connections':
+            if value:
+                state[key] = [{k: destination_id(v) if k == 'Destination' else v for k, v in connection.items()}
+                              for connection in value]
+        elif key == 'Attributes':
+            if value:
+                state[key] = dict(value.items())
+        elif key == 'Name':
+            if value:
+                state[key] = value
+        else:
+            state[key] = value
+    return state
+
+
+def _compare_worlds(world: list, world_after: list, ids: ReplayIds) -> Union[str, None]:
+    """
+    Compares the replayed world with the world state recorded after the move.
+    :param world: replayed world
+    :param world_after: WorldAfter of the move
+    :param ids: map of the recorded Ids
+    :return: description of the first difference or None if the worlds are identical
+    """
+    if len(world) != len(world_after):
+        return f'Liczba lokacji {len(world)} zamiast {len(world_after)}.'
+    for location, after_location in zip(world, world_after):
+        replayed = _node_state(location, ids.recorded_id,
+                               lambda x: ids.recorded_id(x) if is_node(x) else x)
+        recorded = _node_state(after_location, lambda x: x.get('Id'), lambda x: x)
+        if replayed != recorded:
+            return f'Różnica w lokacji {after_location.get("Name")} (Id {after_location.get("Id")}).'
+    return None
+
+
+def replay_gameplay(gameplay_dir: str, gameplay_filename: str, productions: list = None) -> dict:
+    """
+    Replays the recorded gameplay without drawing anything and checks the state of the world after every move.
+    Nodes are resolved through the map of recorded Ids instead of searching the world.
+    :param gameplay_dir: directory of the gameplay file
+    :param gameplay_filename: name of the gameplay file (json or journal)
+    :param productions: packs of productions in the gameplay format ([{quest_name: productions}, ...]) used
+    instead of the packs saved in the gameplay, e.g. to check the gameplay against changed productions
+    :return: report dict with keys: File, Moves, Passed, Errors, Seconds
+    """
+    start = time.time()
+    report = {"File": gameplay_filename, "Moves": 0, "Passed": False, "Errors": [], "Seconds": 0}
+
+    def error(nr, text):
+        report["Errors"].append({"Move": nr, "Error": text})
+
+    gp, moves = read_gameplay(gameplay_dir, gameplay_filename)
+    if not gp or not gp.get("WorldSource"):
+        error(None, 'Nie można wczytać rozgrywki.')
+        return report
+
+    prod_dict = _compile_productions(deepcopy(productions) if productions is not None
+                                     else gp.get("QuestSource", []) + gp.get("WorldResponseSource", []))
+    if prod_dict is None:
+        error(None, 'Problem wczytywania produkcji.')
+        return report
+
+    world = gp['WorldSource'][0]['LSide']['Locations']
+    ids = ReplayIds()
+    for element in nodes_list_from_tree(world, "Locations"):
+        if element['node'].get('Id'):
+            ids.add(element['node'], str(element['node']['Id']))
+    # Id służą tylko do odtworzenia połączeń, dalej węzły są takie jak w trakcie gry
+    if not destinations_change_to_nodes(world, world=True):
+        error(None, 'Problem wczytywania świata.')
+        return report
+
+    ls_maps = {}
+    for nr, move in enumerate(moves):
+        report["Moves"] += 1
+        production = prod_dict.get(move["ProductionTitle"])
+        if not production:
+            error(nr, f'Brak produkcji „{move["ProductionTitle"]}”.')
+            break
+        if move["ProductionTitle"] not in ls_maps:
+            ls_maps[move["ProductionTitle"]] = _ls_nodes_map(production)
+        ls_map = ls_maps[move["ProductionTitle"]]
+
+        # odtwarzanie wariantu dopasowania
+        variant = []
+        for pair in move["LSMatching"]:
+            ls_nodes = ls_map.get(pair['LSNodeRef'], [])
+            w_node = ids.node_by_id.get(str(pair['WorldNodeId']))
+            if len(ls_nodes) != 1 or w_node is None:
+                error(nr, f'Nie można odtworzyć dopasowania węzła {pair["LSNodeRef"]} = {pair.get("WorldNodeName")}.')
+                break
+            variant.append((ls_nodes[0], w_node))
+        else:
+            with contextlib.redirect_stdout(io.StringIO()):
+                modified_nodes = apply_instructions_to_world(production, variant, world)
+            if len(modified_nodes) != len(move['ModifiedNodes']):
+                error(nr, f'Zmieniono {len(modified_nodes)} węzłów zamiast {len(move["ModifiedNodes"])}.')
+
+            world_after = move.get("WorldAfter")
+            after_nodes = {}
+            if world_after:
+                for element in nodes_list_from_tree(world_after, "Locations"):
+                    after_nodes[str(element['node'].get('Id'))] = element['node']
+
+            for recorded_id, node_id in zip(move['ModifiedNodes'], modified_nodes):
+                node = ctypes.cast(node_id, ctypes.py_object).value
+                current_id = ids.recorded_id(node)
+                if current_id is None:
+                    ids.add(node, str(recorded_id))
+                elif current_id != str(recorded_id):
+                    error(nr, f'Zmieniono węzeł {node.get("Name")} o Id {current_id} zamiast {recorded_id}.')
+                if str(recorded_id) in after_nodes:
+                    _adopt_ids(node, after_nodes[str(recorded_id)], ids)
+
+            if world_after:
+                difference = _compare_worlds(world, world_after, ids)
+                if difference:
+                    error(nr, f'Stan świata po produkcji „{move["ProductionTitle"]}” różni się od zapisanego. {difference}')
+        if report["Errors"]:
+            break
+
+    report["Passed"] = not report["Errors"]
+    report["Seconds"] = round(time.time() - start, 3)
+    return report
+
+
+def _replay_gameplay_args(args) -> dict:
+    return replay_gameplay(*args)
+
+
+def verify_gameplays(gameplays_dir: str, processes: int = None, productions: list = None,
+                     report_file_path: str = None) -> List[dict]:
+    """
+    Replays all gameplays from the directory (in parallel processes) and prints the pass/fail report.
+    :param gameplays_dir: directory with gameplay files (json or journals)
+    :param processes: number of processes (None – number of processors, 1 – without additional processes)
+    :param productions: packs of productions used instead of the packs saved in gameplays
+    :param report_file_path: path of the json file for the report
+    :return: list of reports, in the order of file names
+    """
+    file_names = sorted(f for f in os.listdir(gameplays_dir)
+                        if f.startswith('gameplay_') and (f.endswith('.json') or is_journal_file(f)))
+    tasks = [(gameplays_dir, file_name, productions) for file_name in file_names]
+    if processes == 1 or len(tasks) < 2:
+        reports = [_replay_gameplay_args(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            reports = list(executor.map(_replay_gameplay_args, tasks))
+
+    for report in reports:
+        print(f'{"OK   " if report["Passed"] else "BŁĄD "} {report["File"]}: {report["Moves"]} ruchów, {report["Seconds"]} s')
+        for error in report["Errors"]:
+            print(f'      ruch {error["Move"]}: {error["Error"]}')
+    passed = sum(1 for report in reports if report["Passed"])
+    print(f'Poprawnie odtworzono {passed} z {len(reports)} rozgrywek.')
+
+    if report_file_path:
+        os.makedirs(os.path.dirname(report_file_path) or '.', exist_ok=True)
+        with open(report_file_path, 'w', encoding="utf8") as outfile:
+            json.dump(reports, outfile, indent=4, ensure_ascii=False)
+    return reports
@@ -0,0 +1,152 @@
+import re
+from typing import Union
+
+from library.tools_match import what_to_do
+
+NODE_LAYERS = ('Characters', 'Items', 'Narration')
+
+
+def _subtree_nodes(node):
+    yield node
+    for layer in NODE_LAYERS:
+        for child in node.get(layer) or []:
+            yield from _subtree_nodes(child)
+
+
+class AutomaticMovesScheduler:
+    """
+    Chooses automatic productions to apply in a location without matching all of them after every move.
+    Productions are indexed by the names and attributes of the nodes of their left sides; a production which
+    did not match in a location is not tested there again until a change in the world triggers it.
+    The result is the same as matching all productions: the first matched production (in the order of the list)
+    with its first variant. All changes of the world have to be reported by changed().
+    """
+
+    def __init__(self, productions: list):
+        """
+        :param productions: compiled automatic productions (in the order of application)
+        """
+        self.productions = productions
+        # produkcje testowane po każdej zmianie (wiele lokacji lub węzły bez nazwy i atrybutów)
+        self._always = set()
+        self._by_name = {}
+        self._by_attribute = {}
+        # id lokacji -> numery produkcji, które w niej nie pasują
+        self._failing = {}
+        for nr, production in enumerate(productions):
+            self._index(nr, production)
+
+    def _index(self, nr: int, production: dict):
+        locations = production['LSide']['Locations']
+        if len(locations) != 1:
+            # dopasowanie zależy od sąsiednich lokacji i połączeń
+            self._always.add(nr)
+            return
+        for node in _subtree_nodes(locations[0]):
+            if node.get('Name'):
+                self._by_name.setdefault(node['Name'], set()).add(nr)
+            elif node.get('Attributes'):
+                for attribute in node['Attributes']:
+                    self._by_attribute.setdefault(attribute, set()).add(nr)
+            elif node is not locations[0] and not any(node.get(layer) for layer in NODE_LAYERS):
+                # węzeł bez nazwy, atrybutów i dzieci pasuje do każdego węzła
+                self._always.add(nr)
+        self._index_preconditions(nr, production)
+
+    def _index_preconditions(self, nr: int, production: dict):
+        """
+        Indexes the names and attributes the preconditions of the production depend on. Counted nodes need not be
+        nodes of the left side, so the names of all segments of Count references are indexed (a move removing
+        a counted node touches its parent, which is named in the reference). References with wildcards between
+        segments or referring to an unnamed left side node without attributes make the production tested after every
+        change.
+        :param nr: number of the production
+        :param production: compiled production
+        """
+        ls_nodes = {}
+        for node in _subtree_nodes(production['LSide']['Locations'][0]):
+            for identifier in (node.get('Id'), node.get('Name')):
+                if identifier:
+                    ls_nodes.setdefault(identifier, node)
+        for precondition in production.get('Preconditions') or []:
+            if 'Count' in precondition:
+                segments = [segment for segment in precondition['Count'].split('/') if segment not in NODE_LAYERS]
+                # ** i * przed ostatnim segmentem: zliczane węzły mogą być w dowolnych (także nienazwanych) węzłach
+                if '**' in segments or '*' in segments[:-1] or segments[0] == '*':
+                    self._always.add(nr)
+                    return
+                # tylko pierwszy segment może być identyfikatorem węzła lewej strony, kolejne są nazwami w świecie
+                ls_references = segments[:1] if segments[0] in ls_nodes else []
+                names = [segment for segment in segments[len(ls_references):] if segment != '*']
+            elif 'Cond' in precondition:
+                for attribute in re.findall(r"\.([A-Za-z_][A-Za-z0-9_]*)", precondition['Cond']):
+                    self._by_attribute.setdefault(attribute, set()).add(nr)
+                ls_references = [identifier for identifier in re.findall(r"(?<![.\w])([A-Za-z_]\w*)",
+                                                                          precondition['Cond'])
+                                 if identifier in ls_nodes]
+                names = []
+            else:
+                continue
+            for identifier in ls_references:
+                # zmiany dopasowanego węzła widać przez jego nazwę lub atrybuty (zaindeksowane wyżej)
+                ls_node = ls_nodes[identifier]
+                if not ls_node.get('Name') and not ls_node.get('Attributes'):
+                    self._always.add(nr)
+                    return
+                if ls_node.get('Name'):
+                    names.append(ls_node['Name'])
+            for name in names:
+                self._by_name.setdefault(name, set()).add(nr)
+
+    def copy(self, memo: dict) -> 'AutomaticMovesScheduler':
+        """
+        Creates the scheduler for the deep copy of the world (the index of productions is shared).
+        :param memo: memo dict of deepcopy of the world (id of the original -> copy)
+        :return: scheduler with the failed matchings moved to the copied locations
+        """
+        scheduler = AutomaticMovesScheduler.__new__(AutomaticMovesScheduler)
+        scheduler.__dict__.update(self.__dict__)
+        scheduler._failing = {id(memo[location_id]): set(failing) for location_id, failing in self._failing.items()
+                              if location_id in memo}
+        return scheduler
+
+    def triggered(self, touched_nodes: list) -> set:
+        """
+        :param touched_nodes: world nodes changed by a move (see touched_nodes in apply_instructions_to_world)
+        :return: numbers of productions whose matching may have changed
+        """
+        triggered = set(self._always)
+        for touched in touched_nodes:
+            for node in _subtree_nodes(touched):
+                triggered.update(self._by_name.get(node.get('Name'), ()))
+                for attribute in node.get('Attributes') or {}:
+                    triggered.update(self._by_attribute.get(attribute, ()))
+        return triggered
+
+    def changed(self, touched_nodes: list):
+        """
+        Forgets the failed matchings of productions triggered by the changed nodes (in all locations).
+        :param touched_nodes: world nodes changed by a move
+        """
+        if not touched_nodes:
+            return
+        triggered = self.triggered(touched_nodes)
+        for failing in self._failing.values():
+            failing.difference_update(triggered)
+
+    def next_move(self, world: list, location: dict) -> Union[dict, None]:
+        """
+        Finds the first automatic production matched in the location.
+        :param world: list of locations
+        :param location: location of the automatic moves
+        :return: matched production (with Matches, as in what_to_do result) or None
+        """
+        failing = self._failing.setdefault(id(location), set())
+        for nr, production in enumerate(self.productions):
+            if nr in failing:
+                continue
+            productions_matched, todos = what_to_do(world, location, [production])
+            if productions_matched and todos:
+                return todos[0]
+            failing.add(nr)
+        return None
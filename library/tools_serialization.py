@@ -0,0 +1,138 @@
+import json
+from json.encoder import encode_basestring
+from typing import Iterator, Union
+
+from library.tools import is_node, json_default
+
+# warstwy dzieci węzła
+NODE_LAYERS = ('Characters', 'Items', 'Narration')
+# klucze porządkowane na końcu węzła (pozostałe klucze zostają na początku, w pierwotnej kolejności),
+# tak samo jak w save_world i world_copy
+CANONICAL_KEYS = ('Id', 'Name', 'Attributes', 'Characters', 'Items', 'Narration', 'Connections')
+INDENT = ' ' * 4
+
+
+class CanonicalNode:
+    """
+    Lazy view of the live world node with keys in the canonical order (as after save_world or world_copy).
+    Nothing is copied: the keys are read from the node while the view is walked.
+    """
+    __slots__ = ('node', 'node_id', 'nested')
+
+    def __init__(self, node, node_id: Union[str, None], nested: bool):
+        self.node = node
+        self.node_id = node_id  # Id zapisywane w węźle (None – bez Id)
+        self.nested = nested  # True – dzieci również są porządkowane i dostają Id
+
+    def items(self) -> Iterator[tuple]:
+        node = self.node
+        for key in node:
+            if key not in CANONICAL_KEYS:
+                yield key, node[key]
+        if self.node_id:
+            yield 'Id', self.node_id
+        if node.get('Name'):
+            yield 'Name', node['Name']
+        if node.get('Attributes'):
+            yield 'Attributes', node['Attributes']
+        for layer in NODE_LAYERS:
+            children = node.get(layer)
+            if children:
+                if self.nested:
+                    yield layer, [CanonicalNode(child, str(id(child)), True) for child in children]
+                else:
+                    yield layer, children
+        connections = node.get('Connections')
+        if connections:
+            # lokacje docelowe zapisujemy jako Id, czyli adres lokacji w pamięci (jak w world_copy)
+            yield 'Connections', [{k: str(id(v)) if k == 'Destination' and is_node(v) else v
+                                   for k, v in connection.items()} for connection in connections]
+
+
+def canonical_world_json(world_structure: dict, game: bool = False) -> list:
+    """
+    Prepares the world json for saving without copying the world. Only the first production (the world)
+    is wrapped; the locations are replaced with CanonicalNode views.
+    :param world_structure: dict with keys 'file_path' and 'json', destinations changed to nodes
+    :param game: True – every node gets Id and is ordered (as in save_world_game), False – only locations
+    are ordered and only the destination locations get Id (as in save_world)
+    :return: json list ready for write_json_stream or materialize_json
+    """
+    json_list = list(world_structure['json'])
+    world_production = dict(json_list[0])
+    world_production['LSide'] = dict(world_production['LSide'])
+    locations = world_production['LSide']['Locations']
+
+    if game:
+        views = [CanonicalNode(location, str(id(location)), True) for location in locations]
+    else:
+        destinations = {id(connection['Destination']) for location in locations
+                        for connection in location.get('Connections', []) if is_node(connection.get('Destination'))}
+        views = [CanonicalNode(location, str(id(location)) if id(location) in destinations else location.get('Id'),
+                               False) for location in locations]
+
+    world_production['LSide']['Locations'] = views
+    json_list[0] = world_production
+    return json_list
+
+
+def _json_key(key) -> str:
+    # klucze niebędące napisami zamieniamy tak samo jak json.dump
+    return encode_basestring(key if isinstance(key, str) else json.dumps(key))
+
+
+def iter_json(value, level: int = 0) -> Iterator[str]:
+    """
+    Encodes the value piece by piece, giving exactly the same text as json.dump(value, indent=4,
+    ensure_ascii=False, default=json_default). CanonicalNode views and node objects are written as objects.
+    :param value: value to encode
+    :param level: current indentation level
+    :return: generator of text fragments
+    """
+    if isinstance(value, str):
+        yield encode_basestring(value)
+    elif value is None or isinstance(value, (bool, int, float)):
+        yield json.dumps(value)
+    elif isinstance(value, (list, tuple)):
+        if not value:
+            yield '[]'
+            return
+        separator = '[\n' + INDENT * (level + 1)
+        for item in value:
+            yield separator
+            yield from iter_json(item, level + 1)
+            separator = ',\n' + INDENT * (level + 1)
+        yield '\n' + INDENT * level + ']'
+    elif isinstance(value, (dict, CanonicalNode)) or is_node(value) or hasattr(value, 'items'):
+        separator = '{\n' + INDENT * (level + 1)
+        empty = True
+        for key, item in value.items():
+            yield separator + _json_key(key) + ': '
+            yield from iter_json(item, level + 1)
+            separator = ',\n' + INDENT * (level + 1)
+            empty = False
+        yield '{}' if empty else '\n' + INDENT * level + '}'
+    else:
+        yield from iter_json(json_default(value), level)
+
+
+def write_json_stream(value, outfile):
+    """
+    Writes the value to the open text file piece by piece, without building the whole text or a copy of the world.
+    :param value: value to write (e.g. result of canonical_world_json)
+    :param outfile: file opened for writing
+    """
+    outfile.writelines(iter_json(value))
+
+
+def materialize_json(value):
+    """
+    Builds the independent json structure (dicts and lists) from the value containing CanonicalNode views.
+    :param value: value to convert
+    :return: new structure
+    """
+    if isinstance(value, (list, tuple)):
+        return [materialize_json(item) for item in value]
+    if isinstance(value, (dict, CanonicalNode)) or is_node(value) or hasattr(value, 'items'):
+        return {key: materialize_json(item) for key, item in value.items()}
+    return value
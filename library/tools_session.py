@@ -0,0 +1,258 @@
+import contextlib
+import io
+from copy import copy, deepcopy
+from typing import Callable, List, Union
+
+from library.tools import breadcrumb_pointer, destinations_change_to_nodes
+from library.tools_hash import WorldHasher
+from library.tools_match import what_to_do, what_to_do_batch, production_covers, make_move_record, get_production_tree_new
+from library.tools_process import apply_instructions_to_world, get_reds, record_move
+from library.tools_scheduler import AutomaticMovesScheduler
+
+# opis wykonawcy produkcji automatycznych w zapisie rozgrywki (jak w make_automatic_moves)
+AUTOMATIC_MOVE_OBJECT = "Action automatically performed"
+
+
+def compile_session_sources(chars_turn_sources: list, world_turn_sources: list) -> tuple:
+    """
+    Prepares productions for GameSession from the validated jsons (as in get_jsons_storygraph_validated result).
+    :param chars_turn_sources: list of dicts with keys 'file_path' and 'json' of productions for characters
+    :param world_turn_sources: list of dicts with keys 'file_path' and 'json' of automatic productions
+    :return: tuple (productions_chars_turn, productions_world_turn, hierarchy)
+    """
+    productions_chars_turn = []
+    productions_world_turn = []
+    for sources, productions in ((chars_turn_sources, productions_chars_turn),
+                                 (world_turn_sources, productions_world_turn)):
+        for source in sources:
+            for prod in deepcopy(source['json']):
+                productions.append(prod)
+                destinations_change_to_nodes(prod["LSide"]["Locations"])
+    with contextlib.redirect_stdout(io.StringIO()):
+        hierarchy, generics, missing = get_production_tree_new(*chars_turn_sources, *world_turn_sources)
+    return productions_chars_turn, productions_world_turn, hierarchy or {}
+
+
+class GameSession:
+    """
+    Gameplay driven by method calls instead of the terminal. The session holds the world, the compiled
+    productions and the production hierarchy, returns structured results and does no input or output
+    (messages printed by the library functions are suppressed when quiet is True).
+    """
+
+    def __init__(self, world: list, productions_chars_turn: list, productions_world_turn: list,
+                 hierarchy: dict = None, main_character: dict = None, gameplay: dict = None, quiet: bool = True,
+                 hasher: WorldHasher = None, scheduler: AutomaticMovesScheduler = None):
+        """
+        :param world: list of locations (destinations changed to nodes)
+        :param productions_chars_turn: compiled productions available to characters
+        :param productions_world_turn: compiled automatic productions
+        :param hierarchy: production hierarchy (result of get_production_tree_new), used to label covered productions
+        :param main_character: node of the main character
+        :param gameplay: gameplay dict; if given, every move is recorded in it (and in its journal)
+        :param quiet: suppress messages printed by the library functions
+        :param hasher: incremental hash of the world; if given, it is updated with the nodes changed by every move
+        :param scheduler: scheduler of automatic productions (for a copy of the world of another session)
+        The world may be changed only through the session (the hasher and the scheduler follow the changes).
+        """
+        self.world = world
+        self.productions_chars_turn = productions_chars_turn
+        self.productions_world_turn = productions_world_turn
+        self.hierarchy = hierarchy or {}
+        self.main_character = main_character
+        self.gameplay = gameplay
+        self.quiet = quiet
+        self.hasher = hasher
+        self.scheduler = scheduler or AutomaticMovesScheduler(productions_world_turn)
+        self.decision_nr = 0
+        self.last_effect = []
+
+    def _quietly(self, function, *args, **kwargs):
+        if not self.quiet:
+            return function(*args, **kwargs)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function(*args, **kwargs)
+
+    def _apply_instructions(self, production: dict, variant: list) -> list:
+        touched_nodes = []
+        modified_nodes = self._quietly(apply_instructions_to_world, production, variant, self.world,
+                                       touched_nodes=touched_nodes)
+        if self.hasher is not None:
+            self.hasher.touch(touched_nodes)
+        self.scheduler.changed(touched_nodes)
+        return modified_nodes
+
+    def world_hash(self) -> bytes:
+        """
+        :return: canonical hash of the current world state (incremental if the session has a hasher)
+        """
+        if self.hasher is None:
+            self.hasher = WorldHasher(self.world)
+        return self.hasher.hash()
+
+    def character_path(self, character: dict) -> Union[list, None]:
+        """
+        Finds the character in the world.
+        :param character: node of the character
+        :return: path from the location to the character or None if the character is not in the world (or ambiguous)
+        """
+        character_paths = breadcrumb_pointer(self.world, pointer=character, layer="Characters")
+        if len(character_paths) != 1:
+            return None
+        return character_paths[0]
+
+    def main_character_status(self) -> str:
+        """
+        :return: 'winner', 'missing' (the main character is not in the world, e.g. died), 'subordinate' (not directly
+        in a location, e.g. imprisoned) or 'active'
+        """
+        if self.is_winner():
+            return 'winner'
+        path = self.character_path(self.main_character)
+        if not path:
+            return 'missing'
+        if len(path) != 2:
+            return 'subordinate'
+        return 'active'
+
+    def is_winner(self, character: dict = None) -> bool:
+        character = character or self.main_character
+        return bool(character and (character.get("Attributes") or {}).get("IsWinner"))
+
+    def options(self, character: dict = None) -> List[dict]:
+        """
+        Matches productions for the character (as in character_turn).
+        :param character: node of the character (main character by default)
+        :return: list of options: dicts with keys Nr, Title, Production, Variants, Cover, BlockedVariants,
+        Character, Location
+        """
+        character = character or self.main_character
+        path = self.character_path(character)
+        if not path:
+            return []
+        location = path[0]
+        productions_matched, todos = self._quietly(what_to_do, self.world, location, self.productions_chars_turn,
+                                                   character=character)
+        if not productions_matched:
+            return []
+        return self._options_from_todos(todos, character, location)
+
+    def _options_from_todos(self, todos: list, character: dict, location: dict) -> List[dict]:
+        covers, blocked_variants = production_covers(self.hierarchy, todos)
+        return [{"Nr": nr, "Title": todo["Title"], "Production": todo, "Variants": todo["Matches"], "Cover": cover,
+                 "BlockedVariants": blocked, "Character": character, "Location": location, "Todos": todos}
+                for nr, (todo, cover, blocked) in enumerate(zip(todos, covers, blocked_variants))]
+
+    def location_options(self, location: dict, characters: list = None) -> List[List[dict]]:
+        """
+        Matches productions for many characters of the location in one pass (what_to_do_batch). The options are
+        valid until the next move changes the world.
+        :param location: location of the characters
+        :param characters: nodes of the characters (by default all characters of the location but the main character)
+        :return: list of options lists (as in options()), one per character
+        """
+        if characters is None:
+            characters = [character for character in location.get('Characters', [])
+                          if character is not self.main_character]
+        results = self._quietly(what_to_do_batch, self.world, location, self.productions_chars_turn, characters)
+        return [self._options_from_todos(todos, character, location) if productions_matched else []
+                for character, (productions_matched, todos) in zip(characters, results)]
+
+    def apply(self, option: dict, variant: Union[int, list] = 0) -> dict:
+        """
+        Applies the option chosen for the character. The result is remembered as the effect for world_turn.
+        :param option: one of the options returned by options()
+        :param variant: index of the variant or the variant itself
+        :return: dict with keys Title, Production, Variant, VariantNr, ModifiedNodes, Effect (ids of matched and
+        modified nodes)
+        """
+        production = option["Production"]
+        variant_nr = variant if isinstance(variant, int) else option["Variants"].index(variant)
+        variant = option["Variants"][variant_nr]
+        modified_nodes = self._apply_instructions(production, variant)
+        if self.gameplay is not None:
+            record_move(self.gameplay, make_move_record(production, variant, option["Character"].get("Name"),
+                                                        option["Todos"], option["Nr"], variant_nr, modified_nodes,
+                                                        self.world))
+        effect, red_edges, comments = get_reds(variant)
+        effect.extend(modified_nodes)
+        self.decision_nr += 1
+        self.last_effect = effect
+        return {"Title": production["Title"], "Production": production, "Variant": variant, "VariantNr": variant_nr,
+                "ModifiedNodes": modified_nodes, "Effect": effect}
+
+    def world_turn(self, effect: list = None, limit: int = None, before_move: Callable = None,
+                   after_move: Callable = None) -> List[dict]:
+        """
+        Applies automatic productions in the locations changed by the previous move (as in world_turn):
+        in every such location the first matched production is applied in its first variant until nothing matches.
+        Productions are chosen by AutomaticMovesScheduler, so after a move only the productions triggered by
+        the changed nodes are matched again.
+        :param effect: ids of nodes changed by the move (by default the effect of the last apply)
+        :param limit: maximal number of automatic moves in one location (no limit by default)
+        :param before_move: function called with the matched move (dict with keys Title, Production, Variant,
+        VariantNr, Location, DecisionNr) before it is applied, e.g. to draw the world before every automatic move
+        :param after_move: function called with the result of every applied automatic move (before the next one)
+        :return: list of results of automatic moves (keys as in apply, plus Location and DecisionNr)
+        """
+        effect = self.last_effect if effect is None else effect
+        locations_by_id = {id(location): location for location in self.world}
+        results = []
+        for node_id in effect:
+            location = locations_by_id.get(node_id)
+            if location is None:  # tylko dla lokacji, które zostały zmienione w poprzednim ruchu
+                continue
+            moves_count = 0
+            while limit is None or moves_count < limit:
+                production = self._quietly(self.scheduler.next_move, self.world, location)
+                if not production:
+                    break
+                variant = production['Matches'][0]
+                move = {"Title": production["Title"], "Production": production, "Variant": variant, "VariantNr": 0,
+                        "Location": location, "DecisionNr": self.decision_nr}
+                if before_move is not None:
+                    before_move(move)
+                modified_nodes = self._apply_instructions(production, variant)
+                if not modified_nodes:
+                    break
+                if self.gameplay is not None:
+                    # dalsze pasujące produkcje nie są już dopasowywane
+                    record_move(self.gameplay, make_move_record(production, variant, AUTOMATIC_MOVE_OBJECT,
+                                                                [production], 0, 0, modified_nodes, self.world))
+                moves_count += 1
+                self.decision_nr += 1
+                results.append(dict(move, ModifiedNodes=modified_nodes))
+                if after_move is not None:
+                    after_move(results[-1])
+        self.last_effect = []
+        return results
+
+    def npcs(self) -> List[tuple]:
+        """
+        Lists characters other than the main character in the order used in the gameplay: the location
+        of the main character first, then the remaining locations.
+        :return: list of pairs (location, character)
+        """
+        path = self.character_path(self.main_character) if self.main_character else None
+        locations = copy(self.world)
+        if path:
+            locations.remove(path[0])
+            locations.insert(0, path[0])
+        return [(location, character) for location in locations for character in location.get('Characters', [])
+                if character is not self.main_character]
+
+    def npc_options(self) -> List[dict]:
+        """
+        Matches productions for all NPCs in the current state of the world (in one pass for every location).
+        :return: list of dicts with keys Character, Location, Options
+        """
+        npcs = self.npcs()
+        characters_by_location = {}
+        for location, character in npcs:
+            characters_by_location.setdefault(id(location), (location, []))[1].append(character)
+        options = {}
+        for location, characters in characters_by_location.values():
+            for character, character_options in zip(characters, self.location_options(location, characters)):
+                options[id(character)] = character_options
+        return [{"Character": character, "Location": location, "Options": options[id(character)]}
+                for location, character in npcs]
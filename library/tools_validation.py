@@ -1,5 +1,10 @@
 import json
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
+from hashlib import blake2b
 from json import JSONDecodeError
 from typing import Tuple, List, Union, Dict
 
@@ -10,7 +15,72 @@ from config.config import path_root
 from json_validation.json_schema import schema, schema_sheaf
 
 from library.tools import get_json_files_paths, print_lines, nodes_list_from_tree, breadcrumb_pointer, \
-    attributes_from_nodes_list, find_node_layer_name, paths_convert_to_text
+    attributes_from_nodes_list, find_node_layer_name, paths_convert_to_text, get_project_root
+
+# pliki dozwolonych nazw warstw (względem katalogu projektu, a nie katalogu roboczego)
+ALLOWED_NAMES_DIR = get_project_root() / 'json_validation' / 'allowed_names'
+ALLOWED_NAMES_FILES = {
+    "Locations": ('locations.json', 'locations_Wojtek.json'),
+    "Characters": ('characters.json', 'characters_Wojtek.json'),
+    "Items": ('items.json', 'items_Wojtek.json'),
+}
+# nazwy wczytane raz na proces: czasy modyfikacji plików i zbiory nazw warstw
+_allowed_names_registry = {"Mtimes": None, "Names": None}
+_allowed_names_lock = threading.Lock()
+# walidatory wariantów schematów: (id schematu, skip_names) -> (schemat, walidator, skróty poprawnych instancji)
+_schema_validators = {}
+_schema_validators_lock = threading.Lock()
+# liczba produkcji jednego pliku walidowanych w jednym zadaniu puli procesów
+VALIDATION_CHUNK_SIZE = 20
+# dane wspólne zadań walidacji reguł w procesie potomnym: dozwolone nazwy i słownik tytułów produkcji
+_worker_validation_context = {}
+# progi ostrzeżeń o szacowanej liczbie wariantów dopasowania produkcji w świecie odniesienia
+VARIANTS_WARNING_THRESHOLD = 1000
+CANDIDATES_WARNING_THRESHOLD = 10000
+# katalog wyników walidacji plików (pliki nazwane skrótem treści pliku i danych, od których zależy walidacja)
+VALIDATION_CACHE_DIR = 'validation_cache'
+# zmiana reguł walidacji wymaga zmiany wersji (unieważnia zapisane wyniki)
+VALIDATION_CACHE_VERSION = 2
+
+
+def _node_identifier(layer_node: dict):
+    return layer_node["node"].get("Id", layer_node["node"].get("Name"))
+
+
+class ProductionSymbols(list):
+    """
+    List of layer-described nodes of the production (as returned by nodes_list_from_tree) with the index
+    of their identifiers (id or, for nodes without id, name), so that identifiers are checked without scanning
+    the whole list. The index follows append and remove (used by the simulation of instructions);
+    the ids and names of the nodes must not be changed.
+    """
+
+    def __init__(self, nodes_list: List[dict] = ()):
+        """
+        :param nodes_list: list of layer-described nodes (dict: "layer", "node")
+        """
+        super().__init__(nodes_list)
+        self._by_identifier = {}
+        for n in self:
+            self._by_identifier.setdefault(_node_identifier(n), []).append(n)
+
+    def append(self, layer_node: dict):
+        super().append(layer_node)
+        self._by_identifier.setdefault(_node_identifier(layer_node), []).append(layer_node)
+
+    def remove(self, layer_node: dict):
+        # usuwamy ten sam element co list.remove (pierwszy równy), również z indeksu
+        nr = self.index(layer_node)
+        removed = self.pop(nr)
+        same_identifier = self._by_identifier[_node_identifier(removed)]
+        del same_identifier[next(i for i, n in enumerate(same_identifier) if n is removed)]
+
+    def find(self, identifier: str) -> List[dict]:
+        """
+        :param identifier: id or name of nodes without id
+        :return: layer-described nodes with the identifier, in the order of the list
+        """
+        return self._by_identifier.get(identifier, [])
 
 
 def name_in_allowed_names(name: str, layer: str) -> bool:
@@ -20,25 +90,24 @@ def name_in_allowed_names(name: str, layer: str) -> bool:
     :param layer: given layer
     :return: True or False
     """
-    allowed_locations = json.load(open('../json_validation/allowed_names/locations.json', encoding="utf8"))
-    allowed_locations += json.load(open('../json_validation/allowed_names/locations_Wojtek.json', encoding="utf8"))
-    allowed_characters = json.load(open('../json_validation/allowed_names/characters.json', encoding="utf8"))
-    allowed_characters += json.load(open('../json_validation/allowed_names/characters_Wojtek.json', encoding="utf8"))
-    allowed_items = json.load(open('../json_validation/allowed_names/items.json', encoding="utf8"))
-    allowed_items += json.load(open('../json_validation/allowed_names/items_Wojtek.json', encoding="utf8"))
-
-    if layer == 'Locations' and name in allowed_locations:
-        return True
-    elif layer == 'Characters' and name in allowed_characters:
-        return True
-    elif layer == 'Items' and name in allowed_items:
-        return True
-    elif layer == 'Narration' and name not in allowed_locations + allowed_characters + allowed_items:
-        return True
-
+    allowed_names = get_allowed_names()
+    if layer in allowed_names:
+        return name in allowed_names[layer]
+    elif layer == 'Narration':
+        return not name_in_layers(name, allowed_names)
     return False
 
 
+def name_in_layers(name: str, allowed_names: dict) -> bool:
+    """
+    Checks if the name is an allowed name of any layer (works with lists and sets of names).
+    :param name: given name
+    :param allowed_names: dict with three keys: "Locations", "Characters", "Items" and collections of allowed names
+    :return: True or False
+    """
+    return name in allowed_names['Locations'] or name in allowed_names['Characters'] or name in allowed_names['Items']
+
+
 def get_generic_productions_from_file(generic_path: str) -> Tuple[dict, dict]:
     """
     Temporary function to get dict of the generic productions from one given file. Used in API to extend the production list
@@ -72,21 +141,24 @@ def get_generic_productions_from_file(generic_path: str) -> Tuple[dict, dict]:
 
 def get_allowed_names() -> dict:
     """
-    Imports the allowed nodes names from the JSON files located in json_validation folder.
-    :return: The dict with three keys: "Locations", "Characters", "Items" and lists of names as values.
+    Imports the allowed nodes names from the JSON files located in json_validation folder. The files are read once
+    per process and again only after one of them is modified.
+    :return: The dict with three keys: "Locations", "Characters", "Items" and frozensets of names as values.
     """
-    allowed_locations = json.load(open('../json_validation/allowed_names/locations.json', encoding="utf8"))
-    allowed_locations += json.load(open('../json_validation/allowed_names/locations_Wojtek.json', encoding="utf8"))
-
-    allowed_characters = json.load(open('../json_validation/allowed_names/characters.json', encoding="utf8"))
-    allowed_characters += json.load(open('../json_validation/allowed_names/characters_Wojtek.json', encoding="utf8"))
-
-    allowed_items = json.load(open('../json_validation/allowed_names/items.json', encoding="utf8"))
-    allowed_items += json.load(open('../json_validation/allowed_names/items_Wojtek.json', encoding="utf8"))
-
-    allowed_names = {"Locations": allowed_locations, "Characters": allowed_characters, "Items": allowed_items}
-
-    return allowed_names
+    paths = {layer: [ALLOWED_NAMES_DIR / file_name for file_name in files]
+             for layer, files in ALLOWED_NAMES_FILES.items()}
+    mtimes = tuple(os.stat(path).st_mtime_ns for layer_paths in paths.values() for path in layer_paths)
+    with _allowed_names_lock:
+        if _allowed_names_registry["Mtimes"] != mtimes:
+            names = {}
+            for layer, layer_paths in paths.items():
+                layer_names = []
+                for path in layer_paths:
+                    with open(path, encoding="utf8") as names_file:
+                        layer_names += json.load(names_file)
+                names[layer] = frozenset(layer_names)
+            _allowed_names_registry.update(Mtimes=mtimes, Names=names)
+        return dict(_allowed_names_registry["Names"])
 
 
 def get_prod_ids(nodes_list: List[dict]) -> Tuple[List[str], List[str]]:
@@ -174,8 +246,10 @@ def check_identifier(identifier_to_check: str, tree: Union[dict, list] = None, n
                                 f'obiektów lewej strony produkcji poprzez nazwę może dać efekt różny od spodziewanego.')
 
     elif nodes_list:
+        # tablica symboli produkcji zwraca od razu węzły o tym identyfikatorze
+        candidates = nodes_list.find(identifier_to_check) if isinstance(nodes_list, ProductionSymbols) else nodes_list
         first_segments = []
-        for n in nodes_list:
+        for n in candidates:
             if n["node"].get("Id", n["node"].get("Name")) == identifier_to_check:
                 first_segments.append(n)
 
@@ -240,7 +314,8 @@ def check_multifererence_world_part(world_part: Union[list, str], allowed_names:
                 errors.append(f'Tekst „{multireference_split[nr + 1]}” to id a nie nazwa, więc nie może znajdować się w drugiej '
                               f'części multirferencji.')
             # czy drugi człon jest nazwą i to z właściwej warstwy
-            elif (multireference_split[nr] != "Narration") and (multireference_split[nr + 1] not in allowed_names[multireference_split[nr]] + ['**', '*']):
+            elif (multireference_split[nr] != "Narration") and (multireference_split[nr + 1] not in allowed_names[multireference_split[nr]]
+                                                              and multireference_split[nr + 1] not in ('**', '*')):
                 errors.append(f'Tekst „{multireference_split[nr + 1]}” znajduje się w multireferencji '
                     f'„…{"/".join(multireference_split)}” jako nazwa, a nie jest dozwoloną nazwą w świecie lub jest '
                     f'nazwą z inne warstwy niż wskazana w członie poprzedzającym („{multireference_split[nr]}”).')
@@ -402,6 +477,25 @@ def production_metainfo_validation(production: dict, generic_prod_dict: dict = N
     return errors, warnings
 
 
+def _referenced_identifiers(production: dict) -> set:
+    """
+    :param production: given production
+    :return: set of the texts used as node identifiers in instructions, preconditions and connections
+    """
+    referenced = set()
+    for instr in production.get("Instructions") or []:
+        referenced.update([instr.get('Nodes', '').split('/')[0], instr.get('To', '').split('/')[0],
+                           instr.get('In', '').split('/')[0], instr.get('Attribute', '').split('.')[0]])
+    for prec in production.get("Preconditions") or []:
+        if "Cond" in prec:
+            referenced.update(re.findall(r"[A-Z][A-Za-z0-9_]*", prec["Cond"]))
+        if "Count" in prec:
+            referenced.add(prec["Count"].split('/')[0])
+    for dest in production.get("Connections") or []:
+        referenced.add(dest['Destination'])
+    return referenced
+
+
 def identifiers_ls_validation(production: dict, nodes_list: List[dict], allowed_names: dict) -> Tuple[List[str], List[str]]:
     """
     Validates if the node names are from allowed set or of allowed structure (for narration nodes), ids are disjoint from the names and ids are used follows names.
@@ -412,6 +506,8 @@ def identifiers_ls_validation(production: dict, nodes_list: List[dict], allowed_
     """
     errors = []
     warnings = []
+    # identyfikatory użyte w instrukcjach, predykatach i połączeniach (zbierane raz dla produkcji)
+    referenced_ids = None
     for n in nodes_list:
 
         # sprawdzanie nazw
@@ -422,7 +518,7 @@ def identifiers_ls_validation(production: dict, nodes_list: List[dict], allowed_
             # nazwy w warstwie narracyjnej nie podlegają reglamentacji
             elif n['layer'] == "Narration":
                 # ale nie mogą pokrywać się z nazwami innych warstw
-                if n['node']['Name'] in allowed_names['Locations'] + allowed_names['Characters'] + allowed_names['Items']:
+                if name_in_layers(n['node']['Name'], allowed_names):
                     errors.append(f"Nazwa „{n['node']['Name']}” z warstwy „Narration” pokrywa się z nazwą ze zbioru "
                                   f"dozwolonych nazw innych warstw, a musi się różnić.")
                 # i muszą mieć odpowiednią strukturę
@@ -435,7 +531,7 @@ def identifiers_ls_validation(production: dict, nodes_list: List[dict], allowed_
 
         # sprawdzanie id
         if 'Id' in n['node']:
-            if n['node']['Id'] in allowed_names['Locations'] + allowed_names['Characters'] + allowed_names['Items']:
+            if name_in_layers(n['node']['Id'], allowed_names):
                 errors.append(f"Id „{n['node']['Id']}” pokrywa się z nazwą ze zbioru dozwolonych nazw, a musi się różnić.")
 
             if not production.get("Instructions"):  # jeśli nie ma instrukcji, jest to świat, w którym pozwalamy na cyfrowe id
@@ -449,27 +545,9 @@ def identifiers_ls_validation(production: dict, nodes_list: List[dict], allowed_
             # sprawdzanie, czy id są wykorzystywane
             if production.get("Instructions"): # jeśli są instrukcje, to nie jest to świat, w którym z definicji nie interesują nas id
                 if 'Name' in n['node']:
-                    need_for_id = False
-                    if "Instructions" in production:
-                        for instr in production["Instructions"]:
-                            if n['node']['Id'] in [instr.get('Nodes', '').split('/')[0],
-                                                   instr.get('To', '').split('/')[0],
-                                                   instr.get('In', '').split('/')[0],
-                                                   instr.get('Attribute', '').split('.')[0]]:
-                                need_for_id = True
-                    if "Preconditions" in production:
-                        for prec in production["Preconditions"]:
-                            if "Cond" in prec:
-                                potential_ids = re.findall(r"[A-Z][A-Za-z0-9_]*", prec["Cond"])
-                                if n['node']['Id'] in potential_ids:
-                                    need_for_id = True
-                            if "Count" in prec:
-                                if n['node']['Id'] == prec["Count"].split('/')[0]:
-                                    need_for_id = True
-                    if "Connections" in production:
-                        for dest in production["Connections"]:
-                            if n['node']['Id'] == dest['Destination']:
-                                need_for_id = True
+                    if referenced_ids is None:
+                        referenced_ids = _referenced_identifiers(production)
+                    need_for_id = n['node']['Id'] in referenced_ids
                     if not need_for_id:
                         warnings.append(f"Id „{n['node']['Id']}” występuje w węźle równolegle z nazwą "
                             f"„{n['node']['Name']}”, a nie jest wykorzystywane w instrukcjach ani predykatach"
@@ -657,8 +735,7 @@ def sheaf_dict_validation(dict_to_check: dict, allowed_names: dict) -> Tuple[Lis
             if 'Name' in n['node'] and n['node']['Name'] == "?":
                 warnings.append(f"Produkcja zawierająca węzeł o nazwie „?” jest produkcją wzorcową, nie do stosowania.")
             elif 'Name' in n['node'] and n['layer'] == "Narration":  # nazwy w warstwie narracyjnej nie podlegają reglamentacji
-                if n['node']['Name'] in allowed_names['Locations'] + allowed_names['Characters'] + allowed_names[
-                    'Items']:
+                if name_in_layers(n['node']['Name'], allowed_names):
                     errors.append(f"Nazwa „{n['node']['Name']}” z warstwy „Narration” pokrywa się z nazwą ze zbioru "
                                   f"dozwolonych nazw innych warstw, a musi się różnić.")
                 elif not re.fullmatch(r"[A-Z][A-Za-z0-9_]*", n['node']['Name']):
@@ -753,6 +830,21 @@ def expression_validation(expr: str, prod_ids: List[str], prod_names_c: dict, tr
     return errors, warnings
 
 
+def _count_normalized(count: str) -> str:
+    return re.sub(r'/\*\*/', '/', count)
+
+
+def _normalize_preconditions(production: dict):
+    """
+    Changes the multireferences of "Count" preconditions as preconditions_validation_errors does (used when
+    the production was validated in another process).
+    :param production: given production
+    """
+    for prec in production.get("Preconditions") or []:
+        if 'Cond' not in prec and 'Count' in prec:
+            prec['Count'] = _count_normalized(prec['Count'])
+
+
 def preconditions_validation_errors(production: dict, nodes_list: List[dict], prod_ids: List[str], prod_names_c: dict,
                                     allowed_names: dict = None) -> Tuple[List[str], List[str]]:
     """
@@ -781,7 +873,7 @@ def preconditions_validation_errors(production: dict, nodes_list: List[dict], pr
 
             elif 'Count' in prec:
                 # sprawdzamy poprawność MULTI-REF
-                prec['Count'] = re.sub(r'/\*\*/', '/', prec['Count'])  # możemy po prostu wyciąć wszystkie ** ponieważ jeśli multireferencja jest poprawna, to bez gwiazdek też będzie poprawna
+                prec['Count'] = _count_normalized(prec['Count'])  # możemy po prostu wyciąć wszystkie ** ponieważ jeśli multireferencja jest poprawna, to bez gwiazdek też będzie poprawna
                 multireference_split = prec['Count'].split('/')
                 id_err, id_wrn, id_result = check_identifier(multireference_split[0], nodes_list=nodes_list)
                 warnings.extend(id_wrn)
@@ -839,7 +931,7 @@ def instruction_validation(instruction: dict, prod_ids: List[str], prod_names_c:
     err = []
     wrn = []
     apply = {}
-    nodes_list = nodes_list or nodes_list_from_tree(tree, 'root')
+    nodes_list = nodes_list or ProductionSymbols(nodes_list_from_tree(tree, 'root'))
 
     if 'Op' not in instruction:
         err.append(f'Podany jako instrukcja słownik nie zawiera instrukcji: {instruction}.')
@@ -910,7 +1002,8 @@ def instruction_validation(instruction: dict, prod_ids: List[str], prod_names_c:
 
             # do symulacji wykonania
             if len(multireference_split) == 1 and not id_err:
-                apply["Nodes"] = deepcopy(id_result)
+                # węzeł z listy (nie kopia), żeby symulacja usunięcia nie porównywała całych poddrzew
+                apply["Nodes"] = id_result
             elif len(multireference_split) > 1 and not mwp_err:
                 apply["Nodes"] = {"layer": deepcopy(multireference_split[-2]), "node": "world nodes"}
 
@@ -1106,30 +1199,189 @@ def get_instructions_validation_errors(production: dict, nodes_list: List[dict],
     return errors, warnings
 
 
+def get_schema_validator(schema: dict, skip_names: bool = False) -> Tuple[Draft7Validator, set]:
+    """
+    Gets the validator of the schema variant, built once per process. The given schema is not modified.
+    :param schema: JSON schema
+    :param skip_names: use the variant of the schema without the list of allowed node names
+    :return: Draft7Validator of the variant, set of hashes of instances (or list items) already found valid
+    """
+    key = (id(schema), skip_names)
+    with _schema_validators_lock:
+        entry = _schema_validators.get(key)
+        if entry is None or entry[0] is not schema:
+            variant = schema
+            if skip_names:
+                variant = deepcopy(schema)
+                variant['definitions']['node']['properties']['Name'].pop('enum', None)
+            # schemat jest przechowywany razem z walidatorem, żeby jego id nie zostało użyte ponownie
+            entry = (schema, Draft7Validator(variant), set())
+            _schema_validators[key] = entry
+    return entry[1], entry[2]
+
+
+def _json_digest(value) -> bytes:
+    # skrót treści wartości JSON niezależny od kolejności kluczy słowników
+    return blake2b(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf8'), digest_size=16).digest()
+
+
+def _instance_hashes(schema: dict, instance: Union[dict, list]) -> List[bytes]:
+    """
+    Hashes the parts of the instance validated independently: items of the list for the schema of the array with
+    the only constraint on its items (as the schema of productions), the whole instance otherwise.
+    :param schema: JSON schema
+    :param instance: given JSON instance
+    :return: list of hashes
+    """
+    items_only = schema.get('type') == 'array' and isinstance(schema.get('items'), dict) \
+        and not set(schema) - {'$schema', '$id', 'title', 'description', 'definitions', 'type', 'items'}
+    parts = instance if items_only and isinstance(instance, list) else [instance]
+    return [_json_digest(part) for part in parts]
+
+
+def _errors_remembering_valid(validator: Draft7Validator, instance: Union[dict, list], hashes: List[bytes],
+                              valid_hashes: set):
+    # pełna walidacja; instancja bez błędów jest zapamiętywana jako poprawna
+    has_errors = False
+    for err in validator.iter_errors(instance):
+        has_errors = True
+        yield err
+    if not has_errors:
+        with _schema_validators_lock:
+            valid_hashes.update(hashes)
+
+
 def validate_schema(schema, instance: Union[dict, list], skip_names: bool = False) -> iter:
     """
-    Validates JSON instance with the schema.
+    Validates JSON instance with the schema. Instances (or productions of the list) already found valid
+    are not validated again.
     :param skip_names: Show if the part of the schema could be ignored
     :param schema: JSON schema
     :param instance: given mission as JSON list
     :return: Iterable of errors
     """
-    # TODO jakiego typu jest schema?
-    if skip_names:
-        schema['definitions']['node']['properties']['Name'].pop('enum', None)
+    validator, valid_hashes = get_schema_validator(schema, skip_names)
+    try:
+        hashes = _instance_hashes(schema, instance)
+    except (TypeError, ValueError):  # instancja spoza JSON – bez szybkiej ścieżki
+        return validator.iter_errors(instance)
+    if all(h in valid_hashes for h in hashes):
+        return iter(())
+    return _errors_remembering_valid(validator, instance, hashes, valid_hashes)
+
+
+def get_world_statistics(world: list) -> dict:
+    """
+    Collects the name statistics of the world used by estimate_variants.
+    :param world: list of locations
+    :return: dict with keys "Locations" (number of locations), "LocationNames" (name -> number of locations) and
+    child layers names: {"MaxChildren": maximal number of children of one node in the layer,
+    "MaxNames": name -> maximal number of children of one node with this name}
+    """
+    statistics = {"Locations": len(world), "LocationNames": dict(Counter(location['Name'] for location in world
+                                                                         if location.get('Name')))}
+    for layer in ('Characters', 'Items', 'Narration'):
+        statistics[layer] = {"MaxChildren": 0, "MaxNames": {}}
+    nodes = list(world)
+    while nodes:
+        node = nodes.pop()
+        for layer in ('Characters', 'Items', 'Narration'):
+            children = node.get(layer) or []
+            if not children:
+                continue
+            layer_statistics = statistics[layer]
+            layer_statistics["MaxChildren"] = max(layer_statistics["MaxChildren"], len(children))
+            for name, count in Counter(child['Name'] for child in children if child.get('Name')).items():
+                layer_statistics["MaxNames"][name] = max(layer_statistics["MaxNames"].get(name, 0), count)
+            nodes.extend(children)
+    return statistics
+
+
+def _children_estimate(ls_node: dict, statistics: dict) -> Tuple[int, int]:
+    """
+    :param ls_node: node of the left side
+    :param statistics: statistics of the world (see get_world_statistics)
+    :return: numbers of tested world nodes and of variants of the children of the node for one of its matches
+    """
+    candidates_count = 0
+    variants_count = 1
+    for layer in ('Characters', 'Items', 'Narration'):
+        children = ls_node.get(layer) or []
+        objects_count = len([child for child in children if child.get('IsObject')])
+        for child in children:
+            if child.get('IsObject') and objects_count == 1:
+                candidates = 1
+            elif 'Name' in child:
+                candidates = statistics[layer]["MaxNames"].get(child['Name'], 0)
+            else:
+                # węzeł bez nazwy jest porównywany ze wszystkimi nieużytymi węzłami warstwy
+                candidates = statistics[layer]["MaxChildren"]
+            child_candidates, child_variants = _children_estimate(child, statistics)
+            candidates_count += candidates * (1 + child_candidates)
+            variants_count *= candidates * child_variants
+    return candidates_count, variants_count
+
+
+def estimate_variants(production: dict, statistics: dict) -> dict:
+    """
+    Estimates the worst-case cost of matching the production in a world with the given statistics, following
+    the matcher: named nodes are compared with the world nodes of the same name, unnamed nodes with all unused
+    nodes of the layer, and the variants of all nodes are multiplied before the variants using one world node
+    twice are removed.
+    :param production: given production
+    :param statistics: statistics of the world (see get_world_statistics)
+    :return: dict with keys "Candidates" (compared pairs of nodes) and "Variants" (enumerated variants)
+    """
+    candidates_count = 0
+    variants_count = 1
+    for nr, location in enumerate(production["LSide"]["Locations"]):
+        if nr == 0:  # lokacja postaci
+            candidates = 1
+        elif 'Name' in location:
+            candidates = statistics["LocationNames"].get(location['Name'], 0)
+        else:
+            candidates = max(statistics["Locations"] - 1, 0)
+        child_candidates, child_variants = _children_estimate(location, statistics)
+        candidates_count += candidates * (1 + child_candidates)
+        variants_count *= candidates * child_variants
+    return {"Candidates": candidates_count, "Variants": variants_count}
 
-    v = Draft7Validator(schema)
-    return v.iter_errors(instance)
+
+def _estimate_text(value: int) -> str:
+    return f'{value:.2e}' if value >= 10 ** 9 else str(value)
+
+
+def variants_estimate_warnings(estimate: dict, variants_threshold: int = VARIANTS_WARNING_THRESHOLD,
+                               candidates_threshold: int = CANDIDATES_WARNING_THRESHOLD) -> List[str]:
+    """
+    :param estimate: result of estimate_variants
+    :param variants_threshold: maximal number of variants without a warning
+    :param candidates_threshold: maximal number of compared pairs of nodes without a warning
+    :return: list of warnings
+    """
+    if estimate["Variants"] <= variants_threshold and estimate["Candidates"] <= candidates_threshold:
+        return []
+    return [f'Dopasowanie produkcji w świecie odniesienia może wymagać do {_estimate_text(estimate["Variants"])} '
+            f'wariantów i {_estimate_text(estimate["Candidates"])} porównań węzłów (progi: {variants_threshold} '
+            f'i {candidates_threshold}). Węzły lewej strony bez nazw są dopasowywane do wszystkich węzłów warstwy – '
+            f'warto je nazwać lub ograniczyć ich liczbę.']
 
 
 def get_quest_validated(production_list: List[dict], allowed_names: dict = None,
-                        productions_titles_dict: dict = None, production_type = None) -> Tuple[List[dict], dict, dict]:
+                        productions_titles_dict: dict = None, production_type = None, world_statistics: dict = None,
+                        estimates: dict = None, variants_threshold: int = VARIANTS_WARNING_THRESHOLD,
+                        candidates_threshold: int = CANDIDATES_WARNING_THRESHOLD) -> Tuple[List[dict], dict, dict]:
     """
     Gets the list of productions validated with system rules from one JSON and errors and warnings from other.
     :param production_list: list of productions taken from one JSON file
     :param dict_schema_path: schema for validating parameter „sheaf” in instructions
     :param allowed_names: dict with three keys: "Locations", "Characters", "Items" and lists of allowed names as values
     :param productions_titles_dict:
+    :param world_statistics: statistics of the reference world (see get_world_statistics) for the estimation of
+    the number of variants of productions (None – without the estimation)
+    :param estimates: dict filled in with production titles as keys and results of estimate_variants as values
+    :param variants_threshold: maximal estimated number of variants without a warning
+    :param candidates_threshold: maximal estimated number of compared pairs of nodes without a warning
     :return: list of valid productions, dict of production names as keys and list of errors as values
     """
 
@@ -1142,7 +1394,7 @@ def get_quest_validated(production_list: List[dict], allowed_names: dict = None,
     for production in production_list:
         errors = []
         warnings = []
-        prod_nodes = nodes_list_from_tree(production["LSide"])
+        prod_nodes = ProductionSymbols(nodes_list_from_tree(production["LSide"]))
         id_err, prod_ids = get_prod_ids(prod_nodes)
         prod_names_c = get_prods_names_count(prod_nodes)
         errors.extend(id_err)
@@ -1199,6 +1451,13 @@ def get_quest_validated(production_list: List[dict], allowed_names: dict = None,
         errors.extend(err)
         warnings.extend(wrn)
 
+        # szacowanie liczby wariantów dopasowania w świecie odniesienia (światy nie są dopasowywane)
+        if world_statistics is not None and production.get("Instructions"):
+            estimate = estimate_variants(production, world_statistics)
+            if estimates is not None:
+                estimates[production["Title"]] = estimate
+            warnings.extend(variants_estimate_warnings(estimate, variants_threshold, candidates_threshold))
+
         if not errors:
             prods_sg_validated.append(production)
         if errors:
@@ -1209,6 +1468,144 @@ def get_quest_validated(production_list: List[dict], allowed_names: dict = None,
     return prods_sg_validated, all_errors, all_warnings
 
 
+def _validation_cache_key(*parts) -> str:
+    """
+    :param parts: strings and hashes (bytes) the validation result depends on
+    :return: name of the cached result (without the extension)
+    """
+    digest = blake2b(digest_size=20)
+    digest.update(f'{VALIDATION_CACHE_VERSION}'.encode('utf8'))
+    for part in parts:
+        digest.update(b'\x00' + (part if isinstance(part, bytes) else part.encode('utf8')))
+    return digest.hexdigest()
+
+
+def _validation_cache_load(cache_dir: str, key: str) -> Union[dict, None]:
+    try:
+        with open(os.path.join(cache_dir, f'{key}.json'), encoding='utf8') as cache_file:
+            result = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    return result if isinstance(result, dict) and result.get("Version") == VALIDATION_CACHE_VERSION else None
+
+
+def _validation_cache_store(cache_dir: str, key: str, result: dict):
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # zapis przez plik tymczasowy, żeby inny proces nie odczytał niepełnego wyniku
+        cache_path = os.path.join(cache_dir, f'{key}.json')
+        temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w', encoding='utf8') as cache_file:
+            json.dump(dict(result, Version=VALIDATION_CACHE_VERSION), cache_file, ensure_ascii=False)
+        os.replace(temporary_path, cache_path)
+    except (OSError, TypeError, ValueError):
+        pass
+
+
+def _schema_errors_cached(jsons_opened_list: List[dict], cache_dir: str, processes: int = 1) -> List[List[str]]:
+    """
+    Validates the opened JSONs with the schema of productions, using the results stored on disk under the hashes
+    of the file path, its content and the schema.
+    :param jsons_opened_list: list of dicts with keys 'file_path' and 'json'
+    :param cache_dir: directory of the cache
+    :param processes: number of processes validating files missing in the cache
+    :return: lists of errors in the order of JSONs
+    """
+    schema_digest = _json_digest(schema)
+    keys = [_validation_cache_key('schema', json_instance['file_path'], _json_digest(json_instance['json']),
+                                  schema_digest) for json_instance in jsons_opened_list]
+    results = [_validation_cache_load(cache_dir, key) for key in keys]
+    schema_errors = [result["Errors"] if result else None for result in results]
+
+    missing = [nr for nr, result in enumerate(results) if result is None]
+    if processes != 1 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            missing_errors = list(executor.map(_json_schema_errors, [jsons_opened_list[nr] for nr in missing]))
+    else:
+        missing_errors = [_json_schema_errors(jsons_opened_list[nr]) for nr in missing]
+    for nr, errors in zip(missing, missing_errors):
+        _validation_cache_store(cache_dir, keys[nr], {"Errors": errors})
+        schema_errors[nr] = errors
+    return schema_errors
+
+
+def _quests_validated_cached(json_instances: List[dict], tasks: List[Tuple[List[dict], str]], allowed_names: dict,
+                             production_titles_dict: dict, cache_dir: str, processes: int = 1,
+                             **estimation) -> List[Tuple[dict, dict, dict]]:
+    """
+    get_quests_validated using the results stored on disk under the hashes of the file path, its content,
+    the allowed names, the titles of all productions and the schema of sheaves.
+    :param json_instances: dicts with keys 'file_path' and 'json' of the tasks
+    :param tasks: list of tuples (list of productions of one file, production type)
+    :param allowed_names: dict with three keys: "Locations", "Characters", "Items" and collections of allowed names
+    :param production_titles_dict: dict with production title as the key and dict {"production": "file_path":} as value
+    :param cache_dir: directory of the cache
+    :param processes: number of processes validating files missing in the cache
+    :param estimation: world statistics and thresholds of the estimation of variants (as in get_quests_validated)
+    :return: list of tuples (dict of errors, dict of warnings, dict of variants estimates) in the order of tasks
+    """
+    context_digest = _json_digest([[layer, sorted(allowed_names[layer])] for layer in sorted(allowed_names)] +
+                                  [sorted(production_titles_dict), estimation])
+    # reguły sprawdzają też snopy instrukcji schematem schema_sheaf
+    schema_digest = _json_digest(schema_sheaf)
+    keys = [_validation_cache_key('rules', json_instance['file_path'], _json_digest(json_instance['json']),
+                                  context_digest, schema_digest) for json_instance in json_instances]
+    results = [_validation_cache_load(cache_dir, key) for key in keys]
+    results = [(result["Errors"], result["Warnings"], result["Estimates"]) if result else None for result in results]
+
+    missing = [nr for nr, result in enumerate(results) if result is None]
+    for nr, (production_list, production_type) in enumerate(tasks):
+        if results[nr] is not None:
+            # walidacja zmienia też warunki produkcji – zachowujemy ten efekt
+            for production in production_list:
+                _normalize_preconditions(production)
+    missing_results = get_quests_validated([tasks[nr] for nr in missing], allowed_names, production_titles_dict,
+                                           processes, **estimation)
+    for nr, (errors, warnings, estimates) in zip(missing, missing_results):
+        _validation_cache_store(cache_dir, keys[nr], {"Errors": errors, "Warnings": warnings, "Estimates": estimates})
+        results[nr] = errors, warnings, estimates
+    return results
+
+
+def _json_file_skipped(json_file) -> bool:
+    return 'Stare wersje misji' in str(json_file.absolute()) or 'temp' in str(json_file.absolute())
+
+
+def _open_json_file(json_file) -> Tuple[Union[dict, None], dict]:
+    """
+    Opens one JSON file.
+    :param json_file: path of the file
+    :return: dict with keys 'file_path' and 'json' or None, dict of errors (key filepath, value: {"file": list of errors})
+    """
+    try:
+        info_json_file_path = f'{str(json_file.absolute()).replace(f"{path_root}/","")}'
+        json_instance = json.loads(json_file.read_text(encoding="utf8"))
+        return {'file_path': info_json_file_path, 'json': json_instance}, {}
+
+    except JSONDecodeError as e:
+        # print(f'Nie można wczytać pliku „{json_file.parent.name}/{json_file.name}”\n{e}\n')
+        return None, {f'{json_file.parent.name}/{json_file.name}':
+                      {"file": [f'Nie można wczytać pliku „{json_file.parent.name}/{json_file.name}”\n{e}\n']}}
+
+
+def _json_schema_errors(json_instance: dict) -> List[str]:
+    """
+    :param json_instance: dict with keys 'file_path' and 'json'
+    :return: list of errors of the validation with the schema of productions
+    """
+    # json_schema = json.load(open(json_schema_path, encoding="utf8"))
+    errors = []
+    for err in validate_schema(schema, json_instance['json'], skip_names=True):
+        errors.append(f'Błąd walidacji schematu JSON misji: \n{err}')
+    return errors
+
+
+def _open_json_file_schema_validated(json_file) -> Tuple[Union[dict, None], dict, List[str]]:
+    # zadanie puli procesów: otwarcie pliku i walidacja schematu
+    json_instance, errors = _open_json_file(json_file)
+    return json_instance, errors, _json_schema_errors(json_instance) if json_instance else []
+
+
 def get_jsons_opened(json_path: str, mask: str = '*.json') -> Tuple[List[dict], dict]:
     """
     Gets the list of valid JSONs from opened files.
@@ -1222,37 +1619,47 @@ def get_jsons_opened(json_path: str, mask: str = '*.json') -> Tuple[List[dict],
 
     for json_file in json_files:
 
-        if 'Stare wersje misji' in str(json_file.absolute()):
-            continue
-
-        if 'temp' in str(json_file.absolute()):
+        if _json_file_skipped(json_file):
             continue
 
-        try:
-            info_json_file_path = f'{str(json_file.absolute()).replace(f"{path_root}/","")}'
-            json_instance = json.loads(json_file.read_text(encoding="utf8"))
-            jsons_opened.append({'file_path': info_json_file_path, 'json': json_instance})
-
-        except JSONDecodeError as e:
-            # print(f'Nie można wczytać pliku „{json_file.parent.name}/{json_file.name}”\n{e}\n')
-            errors[f'{json_file.parent.name}/{json_file.name}'] = \
-                {"file": [f'Nie można wczytać pliku „{json_file.parent.name}/{json_file.name}”\n{e}\n']}
-
+        json_instance, opening_errors = _open_json_file(json_file)
+        if json_instance:
+            jsons_opened.append(json_instance)
+        errors.update(opening_errors)
 
     return jsons_opened, errors
 
 
-def get_jsons_schema_validated(json_path: str, mask: str = '*.json') -> Tuple[List[dict], dict]:
+def get_jsons_schema_validated(json_path: str, mask: str = '*.json', processes: int = 1,
+                               cache_dir: str = None) -> Tuple[List[dict], dict]:
     """
     Gets the list of JSONs validated with schema from list of valid JSONs
     :param json_path: filepath to root folder of folders with JSON files
     :param json_schema_path: filepath to file with JSON schema for production
     :param mask: structure of filenames included to analysis
+    :param processes: number of processes opening and validating files (1 – without additional processes,
+    None – number of processors); the result does not depend on it
+    :param cache_dir: directory of the validation results of unchanged files (None – no cache)
     :return: list of JSONs schema-validated, dict of errors (key filepath, value: {"file": list of errors})
     """
 
-    # otwieranie plików. Zwraca listę słowników: "file_path", "json" i listę błędów
-    jsons_opened_list, opening_errors = get_jsons_opened(json_path, mask)
+    json_files = [json_file for json_file in get_json_files_paths(json_path, mask=mask)
+                  if not _json_file_skipped(json_file)] if cache_dir is None and processes != 1 else []
+    if len(json_files) > 1:
+        # otwieranie i walidowanie plików w puli procesów; wyniki w kolejności plików
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            opened = list(executor.map(_open_json_file_schema_validated, json_files))
+        jsons_opened_list = [json_instance for json_instance, e, s in opened if json_instance]
+        schema_errors = [errors for json_instance, e, errors in opened if json_instance]
+        opening_errors = {}
+        for json_instance, errors, s in opened:
+            opening_errors.update(errors)
+    else:
+        # otwieranie plików. Zwraca listę słowników: "file_path", "json" i listę błędów
+        jsons_opened_list, opening_errors = get_jsons_opened(json_path, mask)
+        schema_errors = None
+        if cache_dir is not None:
+            schema_errors = _schema_errors_cached(jsons_opened_list, cache_dir, processes)
     if not jsons_opened_list:
         print("Nie udało się wczytać żadnego pliku.")
         exit(1)
@@ -1260,14 +1667,10 @@ def get_jsons_schema_validated(json_path: str, mask: str = '*.json') -> Tuple[Li
         # print(f'Znaleziono {len(jsons_opened_list)} plików {mask}')
 
     # walidowanie zgodności ze schemą. Zwraca listę słowników: "file_path", "json" i listę błędów
-    # json_schema = json.load(open(json_schema_path, encoding="utf8"))
-    json_schema = schema
     jsons_schema_validated = []
     all_errors = opening_errors
-    for json_instance in jsons_opened_list:
-        errors = []
-        for err in validate_schema(json_schema, json_instance['json'], skip_names=True):
-            errors.append(f'Błąd walidacji schematu JSON misji: \n{err}')
+    for nr, json_instance in enumerate(jsons_opened_list):
+        errors = schema_errors[nr] if schema_errors is not None else _json_schema_errors(json_instance)
 
         if errors:
             errors.append(f'Dalsza walidacja pliku „{json_instance["file_path"]}” została przerwana.')
@@ -1279,9 +1682,10 @@ def get_jsons_schema_validated(json_path: str, mask: str = '*.json') -> Tuple[Li
     return jsons_schema_validated, all_errors
 
 
-def print_errors_warnings(jsons_schema_validated, errors = None, warnings = None):
+def print_errors_warnings(jsons_schema_validated, errors = None, warnings = None, estimates = None):
     errors = {} if errors is None else errors
     warnings = {} if warnings is None else warnings
+    estimates = {} if estimates is None else estimates
 
     # wypisywanie błędów i ostrzeżeń
     print(f'\n\n##################################### Błędy otwierania plików i walidacji schematu JSON:')
@@ -1320,6 +1724,81 @@ def print_errors_warnings(jsons_schema_validated, errors = None, warnings = None
                             else:
                                 print_lines(f'{nr:03d}. {w[0:350]}…', 90, '     ', '          ')
 
+    # szacowana liczba wariantów dopasowania (jeśli walidacja korzystała ze świata odniesienia)
+    if estimates:
+        print(f'\n\n##################################### Szacowana liczba wariantów dopasowania w świecie odniesienia:')
+    for file in jsons_schema_validated:
+        file_estimates = estimates.get(file['file_path'])
+        if not file_estimates:
+            continue
+        print(f'\n########## {file["file_path"]}')
+        for prod in file['json']:
+            if prod["Title"] in file_estimates:
+                estimate = file_estimates[prod["Title"]]
+                print(f'{_estimate_text(estimate["Variants"]):>10} wariantów, '
+                      f'{_estimate_text(estimate["Candidates"]):>10} porównań – {prod["Title"]}')
+
+def _init_quest_validation(allowed_names: dict, production_titles_dict: dict, estimation: dict):
+    _worker_validation_context.update(allowed_names=allowed_names, production_titles_dict=production_titles_dict,
+                                      estimation=estimation)
+
+
+def _quest_chunk_validated(task: Tuple[List[dict], str]) -> Tuple[dict, dict, dict]:
+    # zadanie puli procesów: walidacja reguł części produkcji jednego pliku
+    production_list, production_type = task
+    estimates = {}
+    productions_sg_validated, errors, warnings = get_quest_validated(
+        production_list, _worker_validation_context['allowed_names'],
+        _worker_validation_context['production_titles_dict'], production_type, estimates=estimates,
+        **_worker_validation_context['estimation'])
+    return errors, warnings, estimates
+
+
+def get_quests_validated(tasks: List[Tuple[List[dict], str]], allowed_names: dict, production_titles_dict: dict,
+                         processes: int = 1, world_statistics: dict = None,
+                         variants_threshold: int = VARIANTS_WARNING_THRESHOLD,
+                         candidates_threshold: int = CANDIDATES_WARNING_THRESHOLD) -> List[Tuple[dict, dict, dict]]:
+    """
+    Runs get_quest_validated for many files. With processes other than 1 the productions of the files are
+    validated in a pool of processes (in parts of at most VALIDATION_CHUNK_SIZE productions) and the results
+    of the parts are merged in the order of productions, so the result is the same as in one process.
+    :param tasks: list of tuples (list of productions of one file, production type)
+    :param allowed_names: dict with three keys: "Locations", "Characters", "Items" and collections of allowed names
+    :param production_titles_dict: dict with production title as the key and dict {"production": "file_path":} as value
+    :param processes: number of processes (1 – without additional processes, None – number of processors)
+    :param world_statistics: statistics of the reference world (None – without the estimation of variants)
+    :param variants_threshold: maximal estimated number of variants without a warning
+    :param candidates_threshold: maximal estimated number of compared pairs of nodes without a warning
+    :return: list of tuples (dict of errors, dict of warnings, dict of variants estimates) in the order of tasks
+    """
+    estimation = {"world_statistics": world_statistics, "variants_threshold": variants_threshold,
+                  "candidates_threshold": candidates_threshold}
+    chunks = [(nr, (production_list[start:start + VALIDATION_CHUNK_SIZE], production_type))
+              for nr, (production_list, production_type) in enumerate(tasks)
+              for start in range(0, len(production_list), VALIDATION_CHUNK_SIZE)]
+    if processes == 1 or len(chunks) < 2:
+        results = []
+        for production_list, production_type in tasks:
+            estimates = {}
+            results.append(get_quest_validated(production_list, allowed_names, production_titles_dict,
+                                               production_type, estimates=estimates, **estimation)[1:] + (estimates,))
+        return results
+
+    results = [({}, {}, {}) for _ in tasks]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_quest_validation,
+                             initargs=(allowed_names, production_titles_dict, estimation)) as executor:
+        for (nr, c), chunk_results in zip(chunks, executor.map(_quest_chunk_validated,
+                                                               [chunk for n, chunk in chunks])):
+            # późniejsza produkcja o tym samym tytule nadpisuje wynik, jak w get_quest_validated
+            for result, chunk_result in zip(results[nr], chunk_results):
+                result.update(chunk_result)
+    # walidacja w procesie głównym zmienia też warunki produkcji – zachowujemy ten efekt
+    for production_list, production_type in tasks:
+        for production in production_list:
+            _normalize_preconditions(production)
+    return results
+
+
 def production_names_list_builder(jsons_schema_validated: list, production_titles_dict:dict = None, errors:list = None, warnings:list = None):
 
     if production_titles_dict is None:
@@ -1345,7 +1824,10 @@ def production_names_list_builder(jsons_schema_validated: list, production_title
     return production_titles_dict, errors, warnings
 
 def get_jsons_storygraph_validated(json_path: str, mask: str = '*.json', production_titles_dict:dict = None,
-                                   allowed_names: dict = None) -> Tuple[List[dict], List[dict], dict, dict]:
+                                   allowed_names: dict = None, processes: int = 1, cache_dir: str = None,
+                                   reference_world: list = None, estimates: dict = None,
+                                   variants_threshold: int = VARIANTS_WARNING_THRESHOLD,
+                                   candidates_threshold: int = CANDIDATES_WARNING_THRESHOLD) -> Tuple[List[dict], List[dict], dict, dict]:
     """
     Gets the list of JSONs validated with system rules from list of JSONs validated with schema from the list of valid JSONs files
     :param json_path: filepath to root folder of folders with JSON files
@@ -1354,12 +1836,22 @@ def get_jsons_storygraph_validated(json_path: str, mask: str = '*.json', product
     :param mask: structure of filenames included to analysis
     :param production_titles_dict: dict with production title as the key and dict {"production": "file_path":} as value
     :param allowed_names: dict with three keys: "Locations", "Characters", "Items" and lists of allowed names as values
+    :param processes: number of processes validating files and productions (1 – without additional processes,
+    None – number of processors); the result does not depend on it
+    :param cache_dir: directory of the validation results of unchanged files (None – no cache); a file is validated
+    again when its content, the schema, the allowed names or the set of production titles change
+    :param reference_world: list of locations of the world in which the number of variants of productions
+    is estimated (None – without the estimation)
+    :param estimates: dict filled in with file paths as keys and dicts {production title: result of
+    estimate_variants} as values (for print_errors_warnings)
+    :param variants_threshold: maximal estimated number of variants without a warning
+    :param candidates_threshold: maximal estimated number of compared pairs of nodes without a warning
     :return: list of JSONs system-validated, list of JSONs schema-validated, dict of errors, dict of warnings (key filepath, value: {"file"/production_title: list of errors})
     """
 
     jsons_sg_validated = []
     warnings = {}
-    jsons_schema_validated, errors = get_jsons_schema_validated(json_path, mask)
+    jsons_schema_validated, errors = get_jsons_schema_validated(json_path, mask, processes, cache_dir)
         # for file, err in errors.items():
     #     print(f'### {file}')
     #     for e in err:
@@ -1387,16 +1879,30 @@ def get_jsons_storygraph_validated(json_path: str, mask: str = '*.json', product
                     f'w pliku z produkcjami generycznymi a nie jest pochodną żadnej produkcji generycznej. Podejrzane.']
 
     # walidowanie poszczególnych produkcji zgodnie z regułami systemu
+    tasks = []
     for json_instance in jsons_schema_validated:
-        # print(f'### {json_instance["file_path"]}')
         if "automat" in json_instance['file_path']:
             production_type = "automatic"
         elif "gener" in json_instance['file_path']:
             production_type = "generic"
         else:
             production_type = None
-        productions_sg_validated, sg_errors, sg_warnings = \
-            get_quest_validated(json_instance['json'], allowed_names, production_titles_dict, production_type)
+        tasks.append((json_instance['json'], production_type))
+    world_statistics = get_world_statistics(reference_world) if reference_world is not None else None
+    if cache_dir is not None:
+        quests_validated = _quests_validated_cached(jsons_schema_validated, tasks, allowed_names,
+                                                    production_titles_dict, cache_dir, processes,
+                                                    world_statistics=world_statistics,
+                                                    variants_threshold=variants_threshold,
+                                                    candidates_threshold=candidates_threshold)
+    else:
+        quests_validated = get_quests_validated(tasks, allowed_names, production_titles_dict, processes,
+                                                world_statistics, variants_threshold, candidates_threshold)
+
+    for json_instance, (sg_errors, sg_warnings, sg_estimates) in zip(jsons_schema_validated, quests_validated):
+        # print(f'### {json_instance["file_path"]}')
+        if estimates is not None and sg_estimates:
+            estimates[json_instance['file_path']] = sg_estimates
 
 
         # Dodawanie do słownika błędów klucza ścieżki pliku i wartości listy błędów
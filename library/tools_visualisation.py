@@ -1,12 +1,17 @@
 import json
 import os
 import textwrap
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import List, Union
 
 import graphviz
 from PIL import Image, ImageOps
 from graphviz.graphs import BaseGraph
 
+from library.tools import is_node
+from library.tools_cache import render_source
+
 
 def merge_images(images_paths: List[str], save_dir: str, save_file: str) -> None:
     """
@@ -35,13 +40,120 @@ def merge_images(images_paths: List[str], save_dir: str, save_file: str) -> None
     new_im.save(f'{save_dir}/{save_file}')
 
 
+class RenderQueue:
+    """
+    Renders graphs in worker threads, so the game loop does not wait for graphviz. The DOT source is built
+    by the caller (the world may change right after the call); only running the layout engine is deferred.
+    Frames waiting for the same output file are coalesced – only the latest one is rendered.
+    """
+
+    def __init__(self, workers: int = 2):
+        """
+        :param workers: number of threads running graphviz
+        """
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='render')
+        self._lock = threading.Lock()
+        # ścieżka pliku -> ostatnie zlecenie czekające na wygenerowanie
+        self._pending = {}
+        # ścieżki plików generowanych w tej chwili (kolejne zlecenie dla nich czeka na zakończenie)
+        self._running = set()
+        self._futures = []
+        self.rendered = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def submit(self, graph: BaseGraph, filename: str, directory: str, format: str = 'png', cleanup: bool = False):
+        """
+        Queues rendering of the graph (as graph.render(format=format, filename=filename, directory=directory)).
+        :param graph: graph to render (its source is copied at once)
+        :param filename: name of the output file (without the format extension)
+        :param directory: output directory
+        :param format: output format
+        :param cleanup: remove the DOT source file after rendering
+        """
+        path = os.path.join(directory, filename)
+        job = (graph.source, graph.engine, filename, directory, format, cleanup)
+        with self._lock:
+            if path in self._pending:
+                self.coalesced += 1
+            new_job = path not in self._pending and path not in self._running
+            self._pending[path] = job
+            if new_job:
+                self._futures = [future for future in self._futures if not future.done()]
+                self._futures.append(self._executor.submit(self._render, path))
+
+    def _render(self, path: str):
+        while True:
+            with self._lock:
+                job = self._pending.pop(path, None)
+                if job is None:
+                    self._running.discard(path)
+                    return
+                self._running.add(path)
+            source, engine, filename, directory, format, cleanup = job
+            try:
+                render_source(source, engine, filename, directory, format=format, cleanup=cleanup)
+                rendered = True
+            except Exception:
+                rendered = False
+            with self._lock:
+                if rendered:
+                    self.rendered += 1
+                else:
+                    self.failed += 1
+
+    def flush(self):
+        """
+        Waits until all queued graphs are rendered.
+        """
+        while True:
+            with self._lock:
+                futures = self._futures
+                self._futures = []
+            if not futures:
+                return
+            wait(futures)
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
+
+
+# kolejka, przez którą draw_graph generuje obrazki (None – generowanie od razu, w wątku wywołującym)
+_render_queue = None
+
+
+def start_render_queue(workers: int = 2) -> RenderQueue:
+    """
+    Makes draw_graph render graphs in the background.
+    :param workers: number of threads running graphviz
+    :return: the render queue
+    """
+    global _render_queue
+    if _render_queue is None:
+        _render_queue = RenderQueue(workers)
+    return _render_queue
+
+
+def flush_render_queue():
+    """
+    Waits for the graphs queued by draw_graph (does nothing if the background rendering is not started).
+    """
+    if _render_queue is not None:
+        _render_queue.flush()
+
+
 def draw_graph(graph, t, d, file, dr, r_n=None, r_e=None, c=None, w=True, f='png', clean=False, draw_id=True):
     if type(graph) == list:
         graph = {"Locations": graph}
     gv = GraphVisualizer()
     try:
-        gv.visualise(graph, title=t, description=d, world=w, emph_nodes_ids=r_n, emph_edges=r_e, comments=c, draw_id=draw_id).render(
-            format=f, filename=file, directory=dr, cleanup=clean)
+        visualisation = gv.visualise(graph, title=t, description=d, world=w, emph_nodes_ids=r_n, emph_edges=r_e,
+                                     comments=c, draw_id=draw_id)
+        if _render_queue is not None:
+            _render_queue.submit(visualisation, file, dr, format=f, cleanup=clean)
+        else:
+            render_source(visualisation.source, visualisation.engine, file, dr, format=f, cleanup=clean)
     except Exception:
         pass
         # print(123)
@@ -80,8 +192,7 @@ def draw_narration_line(move_list: list, mission_name, directory_path):
             graph.edge(f'{nr-1}', f'{nr}')
 
 
-    graph.render(format='png', filename=f'{mission_name}',
-                 directory=directory_path, cleanup=True)
+    render_source(graph.source, graph.engine, f'{mission_name}', directory_path, format='png', cleanup=True)
 
 
 class GraphVisualizer:
@@ -102,7 +213,7 @@ class GraphVisualizer:
         if not comments:
             comments = {}
         current_list = []
-        if isinstance(json_dict_or_list, dict):
+        if is_node(json_dict_or_list):
             current_dict = {}
             if parent_key != 'root':
                 current_dict["Layer"] = parent_key
@@ -1,4 +1,5 @@
 import logging
+import os
 import sys
 
 
@@ -10,11 +11,18 @@ from config.config import path_root
 
 #################################################################
 from library.tools import get_quest_nr, draw_production_tree
-from library.tools_match import check_hierarchy, get_production_tree_new
+from library.tools_match import check_hierarchy, get_production_tree_new, HIERARCHY_CACHE_DIR
 
-from library.tools_validation import get_jsons_storygraph_validated
+from library.tools_validation import get_jsons_storygraph_validated, VALIDATION_CACHE_DIR
 
 mask = '*.json'
+# katalog wyników porównań produkcji z ich rodzicami (None – bez pamięci podręcznej)
+hierarchy_cache_dir = f'{os.getcwd().rsplit(os.sep, 1)[0]}/{HIERARCHY_CACHE_DIR}'
+# katalog wyników walidacji niezmienionych plików (None – bez pamięci podręcznej)
+validation_cache_dir = f'{os.getcwd().rsplit(os.sep, 1)[0]}/{VALIDATION_CACHE_DIR}'
+# liczba procesów walidujących pliki i porównujących produkcje z rodzicami (1 – bez dodatkowych procesów,
+# None – liczba procesorów)
+processes = None
 # mask = 'World_pptx_base.json'
 logging.basicConfig(level=logging.ERROR, format='%(levelname)s: %(message)s', stream=sys.stdout)
 #################################################################
@@ -24,14 +32,17 @@ logging.basicConfig(level=logging.ERROR, format='%(levelname)s: %(message)s', st
 # dict_schema_path = f'../json_validation/schema_sheaf_updated_20220213.json'
 dir_name = ''
 json_path = f'{path_root}/{dir_name}'
-jsons_OK, jsons_schema_OK, errors, warnings = get_jsons_storygraph_validated(json_path)
 
 
 
 ########################################################################################################################
 # Testy generowania drzewa produkcji ###################################################################################
 production_hierarchy_tests = True
-if production_hierarchy_tests:
+# procesy potomne importują ten plik, więc drzewa generujemy tylko w procesie głównym
+if production_hierarchy_tests and __name__ == '__main__':
+    jsons_OK, jsons_schema_OK, errors, warnings = get_jsons_storygraph_validated(json_path, processes=processes,
+                                                                                 cache_dir=validation_cache_dir)
+
     # get_production_tree('prod_generyczne_nowe_Dragon_story',
     #                     jsons_schema_OK[get_quest_nr('produkcje_generyczne',jsons_schema_OK)]['json'],
     #                     jsons_schema_OK[get_quest_nr('produkcje_automatyczne',jsons_schema_OK)]['json'],
@@ -43,7 +54,8 @@ if production_hierarchy_tests:
         #                     jsons_schema_OK[get_quest_nr('produkcje_generyczne', jsons_schema_OK)]['json'],
         #                     json['json'])
 
-        prod_hierarchy, g, m = get_production_tree_new(jsons_schema_OK[get_quest_nr('produkcje_generyczne', jsons_schema_OK)], quest_json)
+        prod_hierarchy, g, m = get_production_tree_new(jsons_schema_OK[get_quest_nr('produkcje_generyczne', jsons_schema_OK)], quest_json,
+                                                       cache_dir=hierarchy_cache_dir, processes=processes)
 
         # print(f'### {quest_json["file_path"]}')
         # print(f'Wszystkie produkcje: {len(prod_hierarchy)}')
@@ -9,10 +9,13 @@ from copy import copy, deepcopy
 from config.config import path_root
 from library.tools import *
 
-from library.tools_match import character_turn, world_turn, get_production_tree_new
+from library.tools_match import get_production_tree_new, HIERARCHY_CACHE_DIR
 from library.tools_process import game_init, looking_for_main_character, game_over, save_world_game, \
-    ids_list_update, get_quest_description
-from library.tools_validation import get_jsons_storygraph_validated
+    get_quest_description, save_world, get_reds, draw_variants_graphs
+from library.tools_session import GameSession
+from library.tools_visualisation import draw_graph, start_render_queue
+from library.tools_cache import set_render_cache, RENDER_CACHE_DIR
+from library.tools_validation import get_jsons_storygraph_validated, VALIDATION_CACHE_DIR
 
 
 logging.basicConfig(level=logging.ERROR, format='%(levelname)s: %(message)s', stream=sys.stdout)
@@ -21,7 +24,9 @@ logging.basicConfig(level=logging.ERROR, format='%(levelname)s: %(message)s', st
 # wgrywanie jsonów
 dir_name = ''  #
 json_path = f'{path_root}/{dir_name}'
-jsons_OK, jsons_schema_OK, errors, warnings = get_jsons_storygraph_validated(json_path)
+# wyniki walidacji niezmienionych plików są odczytywane z katalogu validation_cache
+jsons_OK, jsons_schema_OK, errors, warnings = get_jsons_storygraph_validated(
+    json_path, cache_dir=f'{os.getcwd().rsplit(os.sep, 1)[0]}/{VALIDATION_CACHE_DIR}')
 
 
 # ######################################################
@@ -33,8 +38,19 @@ quest_names = ['quest_DragonStory'] #'quest_RumcajsStory_close'
 quest_automatic_names = []  #
 # definiowanie głównego bohatera
 character_name = 'Main_hero'  # 'Rumcajs'
+# zapis rozgrywki na bieżąco w dzienniku (jsonl), opcjonalnie skompresowanym
+gameplay_journal = True
+gameplay_journal_compress = False
+# generowanie obrazków stanów świata w tle (gra nie czeka na graphviz)
+background_rendering = True
+# ponowne użycie obrazków tych samych stanów świata (zamiast uruchamiania graphviz)
+render_cache = True
 # ######################################################
 
+if background_rendering:
+    start_render_queue()
+if render_cache:
+    set_render_cache(f'{os.getcwd().rsplit(os.sep, 1)[0]}/{RENDER_CACHE_DIR}')
 
 
 # świat z naszego katalogu
@@ -105,7 +121,7 @@ print(f"""
 ║
 ║ UWAGA1: Aplikacja działa w trybie testera, czyli można wykonywać produkcje przesłonięte 
 ║ parametrem Override mimo ich oznaczenia: BLOKADA1, BLOKADA2.
-║ UWAGA2: Działa dość wolno, bo generuje mnóstwo obrazków pomocniczych.
+║ UWAGA2: Generuje mnóstwo obrazków pomocniczych{' (w tle, mogą pojawiać się z opóźnieniem)' if background_rendering else ', więc działa dość wolno'}.
 ╚═══════════════════════════════════════════════════════════════════════════════════════════
 """)
 
@@ -127,7 +143,7 @@ gameplay = {
 
 }
 
-game_init(gameplay)
+game_init(gameplay, journal=gameplay_journal, compress=gameplay_journal_compress)
 
 # sprawdzamy, gdzie jest główny bohater
 character_paths = looking_for_main_character(gameplay, world, name=character_name, failure_text="Kończymy zanim zaczęliśmy, przy inicjacji.")
@@ -138,41 +154,156 @@ print(f'     ┌─────────────────────
 print_lines(quest_description, line_limit, prefix = '     │ ')
 print(f'     └──────────────────────────────────────────────────────────────────────────────────────')
 
-prod_hierarchy, g, m = get_production_tree_new(*[jsons_schema_OK[get_quest_nr(x,jsons_schema_OK)] for x in prod_chars_turn_names + prod_world_turn_names])
+prod_hierarchy, g, m = get_production_tree_new(*[jsons_schema_OK[get_quest_nr(x,jsons_schema_OK)] for x in prod_chars_turn_names + prod_world_turn_names],
+                                              cache_dir=f'{script_root_path}/{HIERARCHY_CACHE_DIR}')
 gameplay["ProductionHierarchy"] = prod_hierarchy
 
+session = GameSession(world, productions_chars_turn_to_match, productions_world_turn_to_match, prod_hierarchy,
+                      main_character=character, gameplay=gameplay)
+
+
+def draw_move(variant, modified_nodes, title, chosen_variant, who, nr):
+    red_nodes, red_edges, comments = get_reds(variant)
+    d_dir = f'{gameplay["FilePath"]}/world_states/'
+    d_file = title.split(" / ")[0].replace("’", "")
+    if modified_nodes is None:
+        draw_graph(world, title, f'Dopasowanie produkcji{who} w świecie, wariant {chosen_variant:03d}',
+                   f'{nr:03d}a_world_before_{d_file}', d_dir, red_nodes, red_edges, comments)
+    else:
+        red_nodes.extend(modified_nodes)
+        draw_graph(world, title, f'Stan świata po zastosowaniu produkcji w wariancie {chosen_variant:03d}',
+                   f'{nr:03d}b_world_after_{d_file}', d_dir, red_nodes, red_edges, comments)
+        draw_graph(world, f'Świat w oczekiwaniu na ruch gracza', f'Pomiędzy kolejnymi produkcjami',
+                   f'{nr:03d}c_world_between_moves', d_dir)
+
+
+def player_move(char, char_text='', npc=False, options=None):
+    """
+    Interactive choice of the production and its variant for the character (the same dialog as character_turn).
+    :param options: options of the character matched earlier (e.g. for all characters of the location at once)
+    :return: result of session.apply, "" if the character does nothing, "end" if the user ends
+    """
+    print(f"\n#### Co może zrobić {char_text}{char.get('Name')}:")
+    if options is None:
+        options = session.options(char)
+    if not options:
+        print(f"Nie udało się dopasować produkcji do postaci {char.get('Name')} w świecie.")
+        return ""
+    print(f"Z {len(productions_chars_turn_to_match)} produkcji udało się dopasować {len(options)}. ")
+    for option in options:
+        print(f"{option['Nr']:02d}. {option['Cover']}{option['Title'].split(' / ')[0]} – {len(option['Variants'])} wariantów")
+
+    print(f'\n0–{len(options) - 1} – wybór produkcji, '
+          f'enter – opuszczenie kolejki, '
+          f'„end” – {"przerwij" if npc else "koniec symulacji"}, '
+          f'„save” – zapis świata')
+    while True:
+        decision = input(f'Co robi {char_text}{char.get("Name") or ""}? ')
+        if decision.lower() in ('end', ''):
+            return decision.lower()
+        if decision.lower() == 'save':
+            save_world(world_source, f'{gameplay["FilePath"]}{os.sep}jsons')
+            print(f'Zapisano świat w katalogu: {gameplay["FilePath"]}{os.sep}jsons.')
+        try:
+            option = options[int(decision.split(",")[0])]
+            break
+        except (ValueError, IndexError):
+            continue
+
+    variants = option['Variants']
+    d_title = option["Title"]
+    d_dir = f'{gameplay["FilePath"]}/{session.decision_nr:03d}_{option["Title"].split(" / ")[0].replace("’", "")}'
+    print(f"\n#### Produkcja „{option['Title'].split(' / ')[0]}” ma {len(variants)} wariantów.\n", end='')
+    print(f'#### Jeżeli chcesz poznać szczegóły wariantów, wygeneruj wizualizacje (katalog podany u góry).')
+    for variant_nr, variant in enumerate(variants):
+        pairs = ''.join(f'{pair[0].get("Id", pair[0].get("Name"))} = {pair[1].get("Id", pair[1].get("Name"))}, '
+                        for pair in variant)
+        print(f"{variant_nr:02d}. {'BLOKADA1 ' if variant_nr in option['BlockedVariants'] else ''}{pairs}")
+
+    if len(variants) == 1:
+        while True:
+            print(f't – wykonanie produkcji, enter – opuszczenie kolejki, d – wizualizacja wariantów')
+            confirmation = input("Czy chcesz ją wykonać? ").lower()
+            if confirmation in ['n', '']:
+                return ''
+            elif confirmation == 'd':
+                print("Może trochę potrwać...")
+                draw_variants_graphs(variants, world, d_title, d_dir)
+            elif confirmation in ['t', '0']:
+                chosen_variant = 0
+                break
+    else:
+        print(f'\n0–{len(variants) - 1} – wybór wariantu, '
+              f'enter – opuszczenie kolejki, '
+              f'd – wizualizacja wariantów')
+        while True:
+            decision = input(f'Co konkretnie robi {char.get("Name", "")} w produkcji? ')
+            if decision == '':
+                return ''
+            if decision.lower() == 'd':
+                print("Może trochę potrwać...")
+                draw_variants_graphs(variants, world, d_title, d_dir)
+            try:
+                chosen_variant = int(decision)
+            except ValueError:
+                continue
+            if chosen_variant in range(len(variants)):
+                break
+
+    nr = session.decision_nr
+    draw_move(variants[chosen_variant], None, option["Title"], chosen_variant, f" dla {char.get('Name')}", nr)
+    result = session.apply(option, chosen_variant)
+    if result["ModifiedNodes"]:
+        action_description(option["Production"], result["Variant"])
+    else:
+        print(f'Nie dało się zastosować produkcji „{option["Title"].split(" / ")[0]}” do świata. '
+              f'Żaden węzeł nie został zmodyfikowany.')
+    draw_move(result["Variant"], result["ModifiedNodes"], option["Title"], chosen_variant, '', nr)
+    return result
+
+
+def automatic_move_before(move):
+    # stan świata przed zastosowaniem i po zastosowaniu każdej produkcji automatycznej (jak w make_automatic_moves)
+    draw_move(move["Variant"], None, move["Title"], move["VariantNr"], ' automatycznej', move["DecisionNr"])
+
+
+def automatic_move_after(result):
+    draw_move(result["Variant"], result["ModifiedNodes"], result["Title"], result["VariantNr"], '',
+              result["DecisionNr"])
+
+
+def automatic_moves():
+    print(f'\n#### Co musi wydarzyć się w świecie po ruchu postaci:')
+    results = session.world_turn(before_move=automatic_move_before, after_move=automatic_move_after)
+    for result in results:
+        action_description(result["Production"], result["Variant"])
+    for location in {id(r["Location"]): r["Location"] for r in results}.values():
+        sheaf_description(location)
+    if not results:
+        print('Nic.')
+
+
 while True:  # dopóki nie zakończymy, będziemy aplikować kolejne produkcje
 
     # sprawdzamy, gdzie jest główny bohater
     character_paths = looking_for_main_character(gameplay, world, pointer=character, zero_text="Zniknął główny bohater po ruchu NPC-a. Pewno zginął.")
     main_location = character_paths[0][0]
-    skip = False
     sheaf_description(main_location)
 
     # wykonujemy ruch gracza
-    if len(character_paths[0]) == 2:
-        effect_main = character_turn(gameplay, world, world_source, main_location, productions_chars_turn_to_match, decision_nr, character=character)
+    if session.main_character_status() == 'active':
+        effect_main = player_move(character)
     else:
         print(f"Bohater jest podporządkowany innej postaci lub uwięziony({str([x.get('Name') for x in character_paths[0]]).replace(', ','->')}). Odzyska samostanowienie, gdy stanie na własnych nogach w lokacji.")
         effect_main = ""
     if effect_main == "end":
         game_over(gameplay, "Decyzja użytkownika")
-    elif effect_main == "":
-        pass
-    else:
-        decision_nr += 1
-        ids_list_update(world_nodes_ids_list, world_nodes_ids_pairs_list, effect_main)
-        effect_world, decs_world = world_turn(gameplay, effect_main, world, world_locations_ids, productions_world_turn_to_match, decision_nr)
-        decision_nr = decs_world
-        ids_list_update(world_nodes_ids_list, world_nodes_ids_pairs_list, effect_world)
-
+    elif effect_main:
+        automatic_moves()
         # sprawdzamy, gdzie jest główny bohater
-        character_paths = looking_for_main_character(gameplay, world, pointer=character, zero_text="Zniknął główny bohater po swoim ruchu. Pewno umarł.")
-        main_location = character_paths[0][-2]
-
+        looking_for_main_character(gameplay, world, pointer=character, zero_text="Zniknął główny bohater po swoim ruchu. Pewno umarł.")
 
     # wykonujemy ruchy NPC-ów
-    char_nr = sum([len(loc["Characters"]) if "Characters" in loc else 0 for loc in world])
     print("\n########## UWAGA: teraz można wybrać działania wszystkich NPC-ów w świecie. ################")
     print("########## Strasznie upierdliwe, ale niekiedy niezbędne. ###################################")
     print("0 – nie wykonuj żadnych akcji postaci niezależnych,")
@@ -180,67 +311,36 @@ while True:  # dopóki nie zakończymy, będziemy aplikować kolejne produkcje
     print("2 – wskazanie konkretnych postaci.")
     while True:
         decision = input("Co wybierasz? ")
-        if decision == "0":
-            skip = True
-            print("########## NIE BĘDZIEMY ODWALAĆ PRACY ZA NPC-e #############################################")
-            print("############################################################################################")
-            break
-        elif decision == "1":
+        if decision in ("0", "1"):
             break
         if decision == "2":
             print("Przykro mi, jeszcze nie działa.")
-
-    if skip:
+    if decision == "0":
+        print("########## NIE BĘDZIEMY ODWALAĆ PRACY ZA NPC-e #############################################")
+        print("############################################################################################")
         continue
 
-    loc_list = copy(world)
-    try:
-        loc_list.remove(main_location)
-    except:
-        pass
-    loc_list = [main_location] + loc_list
-    loc_index = 0
-    for loc in loc_list:
-        if loc.get('Characters'):
-            loc_index += 1
-            chars_list = copy(loc["Characters"])
-            if character in chars_list:
-                try:
-                    chars_list.remove(character)
-                except:
-                    pass
-
-            char_index = 1 if len(chars_list) != 1 else None
-            skip = False
-            if len(chars_list) == 0:
-                print(f'W lokacji {main_location.get("Name")} nie ma żadnej postaci poza głównym bohaterem.')
-                continue
-
+    current_location = None
+    npc_options = {}
+    for loc, char in session.npcs():
+        if char not in loc.get("Characters", []):  # mógł go ktoś zabić
+            continue
+        if loc is not current_location:
+            current_location = loc
             sheaf_description(loc)
-
-            for char in chars_list:
-                   # mógł go ktoś zabić          # nie jest głównym bohaterem
-                if char in loc["Characters"] and char is not character:
-                    effect_npc = character_turn(gameplay, world, world_source, loc, productions_chars_turn_to_match, decision_nr, character=char, char_index=char_index, loc_index =loc_index, npc=True )
-                    if char_index is not None:
-                        char_index += 1
-                    if effect_npc == "end":
-                        skip = True
-                        break
-                    elif effect_npc == "":
-                        print("Nic.")
-                        continue
-                    else:
-                        decision_nr += 1
-                        ids_list_update(world_nodes_ids_list, world_nodes_ids_pairs_list, effect_npc)
-                        effect_world, decs_world = world_turn(gameplay, effect_npc, world, world_locations_ids, productions_world_turn_to_match, decision_nr)
-                        decision_nr = decs_world
-                        ids_list_update(world_nodes_ids_list, world_nodes_ids_pairs_list, effect_world)
-            if skip:
-                break
+            npc_options = {}
+        if id(char) not in npc_options:
+            # opcje wszystkich postaci lokacji dopasowujemy naraz, są aktualne do pierwszego ruchu zmieniającego świat
+            npc_characters = [x for x in loc.get("Characters", []) if x is not character]
+            npc_options = dict(zip([id(x) for x in npc_characters], session.location_options(loc, npc_characters)))
+        effect_npc = player_move(char, char_text='postać w lokacji – ', npc=True, options=npc_options[id(char)])
+        if effect_npc == "end":
+            break
+        elif effect_npc == "":
+            print("Nic.")
+        else:
+            npc_options = {}
+            automatic_moves()
     print("########## KONIEC ODWALANIA PRACY ZA NPC-e #################################################")
     print("############################################################################################")
     print()
-
-
-
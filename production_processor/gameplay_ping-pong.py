@@ -12,7 +12,9 @@ from library.tools import *
 from library.tools_match import character_turn, world_turn
 from library.tools_process import game_init, looking_for_main_character, game_over, save_world_game, \
     ids_list_update, resume_gameplay
-from library.tools_validation import get_jsons_storygraph_validated
+from library.tools_cache import set_render_cache, RENDER_CACHE_DIR
+from library.tools_validation import get_jsons_storygraph_validated, VALIDATION_CACHE_DIR
+from library.tools_visualisation import start_render_queue
 
 
 logging.basicConfig(level=logging.ERROR, format='%(levelname)s: %(message)s', stream=sys.stdout)
@@ -23,7 +25,9 @@ logging.basicConfig(level=logging.ERROR, format='%(levelname)s: %(message)s', st
 # dict_schema_path = f'../json_validation/schema_sheaf_updated_20220213.json'
 dir_name = ''  #    przykłady do testowania dopasowań
 json_path = f'{path_root}/{dir_name}'
-jsons_OK, jsons_schema_OK, errors, warnings = get_jsons_storygraph_validated(json_path)
+# wyniki walidacji niezmienionych plików są odczytywane z katalogu validation_cache
+jsons_OK, jsons_schema_OK, errors, warnings = get_jsons_storygraph_validated(
+    json_path, cache_dir=f'{os.getcwd().rsplit(os.sep, 1)[0]}/{VALIDATION_CACHE_DIR}')
 
 
 # ######################################################
@@ -35,8 +39,17 @@ quest_names = ['quest00_Dragon_story']
 quest_automatic_names = []  #'Turning_a_dead_rat_into_a_rat_tail_with_discount_(automatic_q-13)'
 # definiowanie głównego bohatera
 character_name = 'Main_hero'  # 'Rumcajs'
+# generowanie obrazków stanów świata w tle (gra nie czeka na graphviz)
+background_rendering = True
+# ponowne użycie obrazków tych samych stanów świata (zamiast uruchamiania graphviz)
+render_cache = True
 # ######################################################
 
+if background_rendering:
+    start_render_queue()
+if render_cache:
+    set_render_cache(f'{os.getcwd().rsplit(os.sep, 1)[0]}/{RENDER_CACHE_DIR}')
+
 
 
 # świat z naszego katalogu
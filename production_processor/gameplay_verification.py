@@ -0,0 +1,39 @@
+
+import logging
+import os
+import sys
+
+from config.config import path_root
+from library.tools_replay import verify_gameplays
+from library.tools_validation import get_jsons_storygraph_validated
+
+
+logging.basicConfig(level=logging.ERROR, format='%(levelname)s: %(message)s', stream=sys.stdout)
+
+
+# ######################################################
+# definicje
+# katalog z zapisanymi rozgrywkami (json lub dzienniki jsonl)
+gp_folder = 'gameplays'
+gameplays_dir_name = ''  # np. 'gp-20220202100653'
+# True – rozgrywki są odtwarzane z bieżącymi produkcjami z katalogu path_root zamiast zapisanych w rozgrywce
+use_current_productions = False
+# liczba procesów (None – liczba procesorów)
+processes = None
+# ######################################################
+
+
+# procesy potomne importują ten plik, więc weryfikację uruchamiamy tylko w procesie głównym
+if __name__ == '__main__':
+    script_root_path = os.getcwd().rsplit(os.sep, 1)[0]
+    gameplays_dir = f'{script_root_path}/{gp_folder}/{gameplays_dir_name}'.rstrip('/')
+
+    productions = None
+    if use_current_productions:
+        jsons_OK, jsons_schema_OK, errors, warnings = get_jsons_storygraph_validated(f'{path_root}/')
+        productions = [{x['file_path'].split('/')[-1]: x['json']} for x in jsons_schema_OK]
+
+    reports = verify_gameplays(gameplays_dir, processes=processes, productions=productions,
+                               report_file_path=f'{gameplays_dir}/verification_report.json')
+
+    sys.exit(0 if all(report["Passed"] for report in reports) else 1)
@@ -0,0 +1,57 @@
+
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+from config.config import path_root
+from library.tools import get_quest_nr
+from library.tools_montecarlo import run_monte_carlo, print_monte_carlo_report
+from library.tools_validation import get_jsons_storygraph_validated
+
+
+logging.basicConfig(level=logging.ERROR, format='%(levelname)s: %(message)s', stream=sys.stdout)
+
+
+# ######################################################
+# definicje
+# definiowanie świata
+world_name = 'world_DragonStory'
+# definiowanie misji
+quest_names = ['quest_DragonStory']
+quest_automatic_names = []
+# definiowanie głównego bohatera
+character_name = 'Main_hero'
+# liczba gier, budżet ruchów w grze i ziarno pierwszej gry
+games = 1000
+max_moves = 200
+seed = 0
+# wagi produkcji (tytuł: waga, pozostałe produkcje mają wagę 1)
+weights = {}
+# prawdopodobieństwo, że NPC wykona ruch w swojej kolejce
+npc_move_probability = 0.5
+# liczba procesów (None – liczba procesorów)
+processes = None
+# ######################################################
+
+
+# procesy potomne importują ten plik, więc gry uruchamiamy tylko w procesie głównym
+if __name__ == '__main__':
+    jsons_OK, jsons_schema_OK, errors, warnings = get_jsons_storygraph_validated(f'{path_root}/')
+
+    prod_chars_turn_names = ['produkcje_generyczne', *quest_names]
+    prod_world_turn_names = [*quest_automatic_names, 'produkcje_automatyczne', 'produkcje_automatyczne_wygrywania']
+
+    report = run_monte_carlo(jsons_schema_OK[get_quest_nr(world_name, jsons_schema_OK)],
+                             [jsons_schema_OK[get_quest_nr(x, jsons_schema_OK)] for x in prod_chars_turn_names],
+                             [jsons_schema_OK[get_quest_nr(x, jsons_schema_OK)] for x in prod_world_turn_names],
+                             character_name, games=games, processes=processes, seed=seed, max_moves=max_moves,
+                             weights=weights, npc_move_probability=npc_move_probability)
+    print_monte_carlo_report(report)
+
+    script_root_path = os.getcwd().rsplit(os.sep, 1)[0]
+    report_path = f'{script_root_path}/monte_carlo/mc_{quest_names[0]}_{world_name}_{datetime.now().strftime("%Y%m%d%H%M%S")}.json'
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path, 'w', encoding="utf8") as outfile:
+        json.dump(report, outfile, indent=4, ensure_ascii=False)
@@ -0,0 +1,52 @@
+
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+from config.config import path_root
+from library.tools import get_quest_nr
+from library.tools_explorer import explore_quest, print_exploration_report, EXPLORE_BFS
+from library.tools_validation import get_jsons_storygraph_validated
+
+
+logging.basicConfig(level=logging.ERROR, format='%(levelname)s: %(message)s', stream=sys.stdout)
+
+
+# ######################################################
+# definicje
+# definiowanie świata
+world_name = 'world_DragonStory'
+# definiowanie misji
+quest_names = ['quest_DragonStory']
+quest_automatic_names = []
+# definiowanie głównego bohatera
+character_name = 'Main_hero'
+# strategia przeszukiwania (EXPLORE_BFS – najpierw najkrótsze drogi, EXPLORE_DFS)
+strategy = EXPLORE_BFS
+# limity przeszukiwania (None – bez limitu): liczba ruchów bohatera, liczba stanów, pamięć procesu w MB
+max_depth = None
+max_states = 100000
+max_memory_mb = 4000
+# ######################################################
+
+
+jsons_OK, jsons_schema_OK, errors, warnings = get_jsons_storygraph_validated(f'{path_root}/')
+
+prod_chars_turn_names = ['produkcje_generyczne', *quest_names]
+prod_world_turn_names = [*quest_automatic_names, 'produkcje_automatyczne', 'produkcje_automatyczne_wygrywania']
+
+report = explore_quest(jsons_schema_OK[get_quest_nr(world_name, jsons_schema_OK)],
+                       [jsons_schema_OK[get_quest_nr(x, jsons_schema_OK)] for x in prod_chars_turn_names],
+                       [jsons_schema_OK[get_quest_nr(x, jsons_schema_OK)] for x in prod_world_turn_names],
+                       character_name, strategy=strategy, max_depth=max_depth, max_states=max_states,
+                       max_memory_mb=max_memory_mb)
+if report:
+    print_exploration_report(report)
+
+    script_root_path = os.getcwd().rsplit(os.sep, 1)[0]
+    report_path = f'{script_root_path}/state_space/ss_{quest_names[0]}_{world_name}_{datetime.now().strftime("%Y%m%d%H%M%S")}.json'
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path, 'w', encoding="utf8") as outfile:
+        json.dump(report, outfile, indent=4, ensure_ascii=False)